@@ -0,0 +1,158 @@
+"""
+Benchmarks for IAConnector.
+
+Benchmarks are registered with the `benchmark` decorator. A benchmark function receives the options of the run and
+returns a tuple of a callable performing one operation and a callable cleaning up afterwards (or `None`). The runner
+measures the throughput, the latency distribution and the memory allocated by the operations.
+
+Run the suite using `python -m benchmarks`; see `python -m benchmarks --help` for the options.
+"""
+import gc
+import platform
+import time
+import tracemalloc
+from collections import OrderedDict
+
+
+registry = OrderedDict()
+
+
+def benchmark(name, calls=1, scale=1):
+    """
+    Registers a benchmark. A benchmark requiring an optional dependency raises an ImportError when it is not installed,
+    in which case it is skipped.
+
+    :param name: The name of the benchmark.
+    :param calls: (Optional) The number of API calls (or other units) performed by one operation.
+    :param scale: (Optional) The factor by which the numbers of iterations are scaled, for slow operations.
+    :return: The decorator.
+    """
+    def decorator(function):
+        registry[name] = (function, calls, scale)
+        return function
+    return decorator
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of the sorted values, using the nearest rank.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def measure(operation, iterations, warmup, memory_iterations):
+    """
+    Measures an operation.
+
+    :param operation: The callable performing one operation.
+    :param iterations: The number of timed operations.
+    :param warmup: The number of operations performed before measuring.
+    :param memory_iterations: The number of operations performed while tracing memory allocations.
+    :return: A dictionary of the measurements.
+    """
+    for i in range(warmup):
+        operation()
+
+    gc.collect()
+    durations = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        operation_started = time.perf_counter()
+        operation()
+        durations.append(time.perf_counter() - operation_started)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for i in range(memory_iterations):
+            operation()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'ops_per_second': iterations / elapsed,
+        'mean_ms': elapsed / iterations * 1000,
+        'p50_ms': percentile(durations, 0.50) * 1000,
+        'p99_ms': percentile(durations, 0.99) * 1000,
+        'peak_memory_bytes': peak - baseline,
+        'retained_memory_bytes': current - baseline,
+    }
+
+
+def run(options, names=None):
+    """
+    Runs the registered benchmarks.
+
+    :param options: The options of the run, as a namespace with at least `iterations`, `warmup` and
+    `memory_iterations`. The options are passed to the benchmarks.
+    :param names: (Optional) The names of the benchmarks to run. Defaults to all benchmarks.
+    :return: A dictionary with the environment, the options and the results per benchmark.
+    """
+    results = OrderedDict()
+
+    for name, (function, calls, scale) in registry.items():
+        if names and name not in names:
+            continue
+
+        try:
+            operation, cleanup = function(options)
+        except ImportError as e:
+            # An optional dependency of the benchmark is not installed
+            results[name] = {'skipped': str(e)}
+            continue
+
+        try:
+            result = measure(
+                operation,
+                max(1, int(options.iterations * scale)),
+                int(options.warmup * scale),
+                max(1, int(options.memory_iterations * scale)),
+            )
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+        result['calls_per_second'] = result['ops_per_second'] * calls
+        results[name] = result
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'options': vars(options),
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Compares the results of a run to the results of an earlier run.
+
+    :param report: The report of the run.
+    :param baseline: The report of the earlier run.
+    :param tolerance: The fraction by which the throughput may decrease, or the p99 latency and peak memory may increase.
+    :return: A list of regression descriptions.
+    """
+    regressions = []
+
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None or 'skipped' in result or 'skipped' in previous:
+            continue
+
+        if result['ops_per_second'] < previous['ops_per_second'] * (1 - tolerance):
+            regressions.append('{:s}: {:.0f} ops/s, was {:.0f}'.format(
+                name, result['ops_per_second'], previous['ops_per_second']))
+        if result['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append('{:s}: p99 {:.3f} ms, was {:.3f}'.format(name, result['p99_ms'], previous['p99_ms']))
+        if result['peak_memory_bytes'] > previous['peak_memory_bytes'] * (1 + tolerance) + 1024:
+            regressions.append('{:s}: peak memory {:d} bytes, was {:d}'.format(
+                name, result['peak_memory_bytes'], previous['peak_memory_bytes']))
+
+    return regressions
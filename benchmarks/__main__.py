@@ -0,0 +1,73 @@
+"""
+Command line interface of the benchmark suite.
+
+Prints the results as JSON, or writes them to a file. When a baseline file from an earlier run is given, the exit code
+is 1 if any benchmark regressed by more than the tolerance.
+"""
+import argparse
+import json
+import sys
+
+import benchmarks
+import benchmarks.client  # noqa: F401 (registers the benchmarks)
+import benchmarks.codec  # noqa: F401
+import benchmarks.imports  # noqa: F401
+import benchmarks.models  # noqa: F401
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Runs the IAConnector benchmarks.")
+    parser.add_argument('names', nargs='*', help="The benchmarks to run. Defaults to all benchmarks.")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks and exit.")
+    parser.add_argument('--iterations', type=int, default=1000, help="The number of timed operations.")
+    parser.add_argument('--warmup', type=int, default=50, help="The number of operations before measuring.")
+    parser.add_argument('--memory-iterations', type=int, default=50,
+                        help="The number of operations while tracing memory allocations.")
+    parser.add_argument('--activities', type=int, default=20, help="The number of activities served.")
+    parser.add_argument('--description-size', type=int, default=500,
+                        help="The length of the activity descriptions in characters.")
+    parser.add_argument('--payload-activities', type=int, default=5000,
+                        help="The number of activities in the payload of the codec benchmarks.")
+    parser.add_argument('--latency', type=float, default=0, help="The server latency per request in seconds.")
+    parser.add_argument('--transport', choices=('requests', 'urllib3', 'httpx', 'inprocess'), default='requests',
+                        help="The transport of the API consumer.")
+    parser.add_argument('--output', help="The file to write the results to. Defaults to standard output.")
+    parser.add_argument('--baseline', help="A results file of an earlier run to compare to.")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="The fraction by which results may be worse than the baseline.")
+    options = parser.parse_args(argv)
+
+    if options.list:
+        for name, (function, calls, scale) in benchmarks.registry.items():
+            print('{:24s} {:s}'.format(name, (function.__doc__ or '').strip()))
+        return 0
+
+    unknown = set(options.names) - set(benchmarks.registry)
+    if unknown:
+        parser.error("unknown benchmarks: %s" % ', '.join(sorted(unknown)))
+
+    names, output, baseline, tolerance = options.names, options.output, options.baseline, options.tolerance
+    for name in ('names', 'list', 'output', 'baseline', 'tolerance'):
+        delattr(options, name)
+
+    report = benchmarks.run(options, names)
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if baseline:
+        with open(baseline) as file:
+            regressions = benchmarks.compare(report, json.load(file), tolerance)
+        for regression in regressions:
+            sys.stderr.write('Regression: %s\n' % regression)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
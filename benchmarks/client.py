@@ -0,0 +1,119 @@
+"""
+Benchmarks of the API and OAuth consumers against the stand-in server.
+"""
+import os
+
+from benchmarks import benchmark
+from iaconnector import APIConsumer, OAuthConsumer
+from iaconnector.testing import StandInServer, make_activities
+from iaconnector.transport import HTTPXTransport, InProcessTransport, RequestsTransport, Urllib3Transport
+
+
+def _start_server(options):
+    """
+    Starts a stand-in server with the payload and latency of the options.
+
+    :return: The started `StandInServer`.
+    """
+    server = StandInServer(
+        activities=make_activities(options.activities, description_size=options.description_size),
+        latency=options.latency,
+    )
+    server.start()
+    return server
+
+
+def _get_transport(options, server):
+    """
+    Returns the transport of the options for the given server.
+    """
+    if options.transport == 'urllib3':
+        return Urllib3Transport()
+    if options.transport == 'httpx':
+        return HTTPXTransport()
+    if options.transport == 'inprocess':
+        return InProcessTransport(server.handle_http)
+    return RequestsTransport(server.api_url)
+
+
+def _consumer_benchmark(options, operation):
+    """
+    Sets up a benchmark of an operation on an `APIConsumer` connected to a stand-in server.
+
+    :param operation: A function performing the operation with the consumer and the server.
+    :return: The operation and the cleanup callables.
+    """
+    server = _start_server(options)
+    try:
+        transport = _get_transport(options, server)
+    except Exception:
+        # Such as an ImportError of a transport which is not installed, which is reported as a skipped benchmark
+        server.stop()
+        raise
+    api = APIConsumer(access_token=server.access_token, base_url=server.api_url, transport=transport)
+
+    def cleanup():
+        transport.close()
+        server.stop()
+
+    return lambda: operation(api, server), cleanup
+
+
+@benchmark('call')
+def call(options):
+    """A raw `_call`, bypassing the endpoint methods."""
+    return _consumer_benchmark(options, lambda api, server: api._call('getActivityDetailed', 1))
+
+
+@benchmark('get_activity_stream')
+def get_activity_stream(options):
+    """An activity stream of all activities."""
+    return _consumer_benchmark(
+        options,
+        lambda api, server: api.get_activity_stream('2000-01-01T00:00:00', '2100-01-01T00:00:00'),
+    )
+
+
+@benchmark('iter_activity_stream')
+def iter_activity_stream(options):
+    """A streamed activity stream of all activities."""
+    def operation(api, server):
+        for activity in api.iter_activity_stream('2000-01-01T00:00:00', '2100-01-01T00:00:00'):
+            pass
+
+    return _consumer_benchmark(options, operation)
+
+
+@benchmark('get_activity_details')
+def get_activity_details(options):
+    """The details of a single activity."""
+    return _consumer_benchmark(options, lambda api, server: api.get_activity_details(1))
+
+
+@benchmark('activity_signup', calls=2)
+def activity_signup(options):
+    """A signup followed by revoking it, as a signup cannot be repeated."""
+    def operation(api, server):
+        api.activity_signup(1, '0.00', [])
+        api.revoke_activity_signup(1)
+
+    return _consumer_benchmark(options, operation)
+
+
+@benchmark('renew_access_token')
+def renew_access_token(options):
+    """A token refresh at the OAuth token endpoint."""
+    os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
+
+    server = _start_server(options)
+    oauth = OAuthConsumer(
+        client_id='benchmark',
+        client_secret='benchmark',
+        redirect_uri='https://example.test/oauth',
+        scope=['benchmark'],
+        access_token=server.access_token,
+        renew_token=server.renew_token,
+        base_url=server.oauth_url,
+    )
+
+    return oauth.renew_access_token, server.stop
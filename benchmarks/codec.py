@@ -0,0 +1,55 @@
+"""
+Benchmarks of the JSON codecs on a large activity stream response.
+"""
+from benchmarks import benchmark
+from iaconnector.codec import orjson, OrjsonCodec, StdlibCodec
+from iaconnector.testing import make_activities
+
+
+def _response(options):
+    """
+    Returns a JSON-RPC response with an activity stream of the number of activities of the options.
+    """
+    activities = make_activities(options.payload_activities, description_size=options.description_size)
+    return {'id': 'benchmark', 'result': activities, 'error': None}
+
+
+def _codec_benchmark(options, codec, decode):
+    """
+    Sets up a benchmark encoding or decoding a large response with the given codec.
+    """
+    response = _response(options)
+    if decode:
+        content = StdlibCodec().encode(response)
+        return lambda: codec.decode(content), None
+    return lambda: codec.encode(response), None
+
+
+def _orjson_codec():
+    if orjson is None:
+        raise ImportError("The orjson benchmarks require orjson.")
+    return OrjsonCodec()
+
+
+@benchmark('codec.json.decode', scale=0.05)
+def stdlib_decode(options):
+    """Decoding a large activity stream with the standard library."""
+    return _codec_benchmark(options, StdlibCodec(), True)
+
+
+@benchmark('codec.orjson.decode', scale=0.05)
+def orjson_decode(options):
+    """Decoding a large activity stream with orjson."""
+    return _codec_benchmark(options, _orjson_codec(), True)
+
+
+@benchmark('codec.json.encode', scale=0.05)
+def stdlib_encode(options):
+    """Encoding a large activity stream with the standard library."""
+    return _codec_benchmark(options, StdlibCodec(), False)
+
+
+@benchmark('codec.orjson.encode', scale=0.05)
+def orjson_encode(options):
+    """Encoding a large activity stream with orjson."""
+    return _codec_benchmark(options, _orjson_codec(), False)
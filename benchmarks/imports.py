@@ -0,0 +1,40 @@
+"""
+Benchmarks of the import time of the package, each importing a module in a new interpreter.
+
+The time includes the startup of the interpreter, which is measured by `import.none` for comparison.
+"""
+import subprocess
+import sys
+
+from benchmarks import benchmark
+
+
+def _import_benchmark(statement):
+    """
+    Sets up a benchmark running the import statement in a new interpreter.
+    """
+    return lambda: subprocess.run([sys.executable, '-c', statement], check=True), None
+
+
+@benchmark('import.none', scale=0.02)
+def import_none(options):
+    """Starting the interpreter without imports."""
+    return _import_benchmark('pass')
+
+
+@benchmark('import.package', scale=0.02)
+def import_package(options):
+    """Importing the package."""
+    return _import_benchmark('import iaconnector')
+
+
+@benchmark('import.api', scale=0.02)
+def import_api(options):
+    """Importing the API consumer."""
+    return _import_benchmark('from iaconnector import APIConsumer')
+
+
+@benchmark('import.oauth', scale=0.02)
+def import_oauth(options):
+    """Importing the OAuth consumer."""
+    return _import_benchmark('from iaconnector import OAuthConsumer')
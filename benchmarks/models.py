@@ -0,0 +1,39 @@
+"""
+Benchmarks of the result models on a large activity stream.
+"""
+from benchmarks import benchmark
+from iaconnector.models import Activity
+from iaconnector.testing import make_activities
+
+
+def _keep(convert, options):
+    """
+    Sets up a benchmark converting a large activity stream and keeping the results of the last operation alive, so the
+    retained memory shows the size of the converted activities.
+    """
+    activities = make_activities(options.payload_activities, description_size=options.description_size)
+    kept = []
+
+    def operation():
+        kept[:] = [convert(activities)]
+
+    return operation, kept.clear
+
+
+@benchmark('models.dicts', scale=0.05)
+def dicts(options):
+    """Copying a large activity stream as dictionaries, for comparison."""
+    return _keep(lambda activities: [dict(activity) for activity in activities], options)
+
+
+@benchmark('models.activities', scale=0.05)
+def activities(options):
+    """Converting a large activity stream to models."""
+    return _keep(Activity.from_list, options)
+
+
+@benchmark('models.access', scale=0.05)
+def access(options):
+    """Reading the title and begin date of every activity of a large activity stream of models."""
+    models = Activity.from_list(make_activities(options.payload_activities, description_size=options.description_size))
+    return lambda: [(activity.title, activity.begin_date) for activity in models], None
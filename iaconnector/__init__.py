@@ -3,17 +3,46 @@ Library for interacting with the Inter-Actief web site (https://www.inter-actief
 
 This library provides OAuth (2) authentication and access to the API. Access to these resources is limited to members
 of study association Inter-Actief.
+
+The consumers are imported on first use, so that importing the package does not import the OAuth stack (or the HTTP
+stack) for applications which do not use it.
 """
+import importlib
+
 import logging
 
-from iaconnector.api import APIConsumer
-from iaconnector.oauth import OAuthConsumer
 from iaconnector.exceptions import APIError, NotLoggedInError, SignupError, UnknownDeviceError, OtherError
 
 
 logger = logging.getLogger('iaconnector')
 
 
+# Names exported by the package which are imported on first use, and their modules
+_lazy_imports = {
+    'APIConsumer': 'iaconnector.api',
+    'BaseAPIConsumer': 'iaconnector.api',
+    'OAuthConsumer': 'iaconnector.oauth',
+}
+
+# Listing the lazily imported names makes `from iaconnector import *` import them through `__getattr__`
+__all__ = sorted(_lazy_imports) + [
+    'IAConnector', 'APIError', 'NotLoggedInError', 'SignupError', 'UnknownDeviceError', 'OtherError',
+]
+
+
+def __getattr__(name):
+    if name not in _lazy_imports:
+        raise AttributeError("module 'iaconnector' has no attribute '%s'" % name)
+
+    value = getattr(importlib.import_module(_lazy_imports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
+
+
 class IAConnector(object):
     """
     Wrapper class for interacting with Amelie, the Inter-Actief web site.
@@ -25,7 +54,8 @@ class IAConnector(object):
         self._api = None
 
     def init_oauth(self, client_id, client_secret, scope, redirect_url, access_token=None,
-                        renew_token=None, base_url=None):
+                        renew_token=None, base_url=None, token_expiry=None, auto_refresh=False, refresh_margin=60,
+                        token_store=None, token_key=None):
         """
         Initializes the OAuth consumer. This is only possible if the consumer has not been initialized yet.
 
@@ -36,7 +66,16 @@ class IAConnector(object):
         :param access_token: (Optional) The access token, if known.
         :param renew_token: (Optional) The renew token, if known.
         :param base_url: (Optional) The base URL of the OAuth implementation. Overrides the default production URL.
+        :param token_expiry: (Optional) The (UTC) datetime the access token expires, if known.
+        :param auto_refresh: (Optional) Whether to renew the access token in the background before it expires. Renewed
+        tokens are propagated to the API.
+        :param refresh_margin: (Optional) The number of seconds before expiry at which the access token is renewed.
+        :param token_store: (Optional) The `TokenStore` to share tokens with other processes.
+        :param token_key: (Optional) The key of the tokens of the user in the token store. Required when a token
+        store is given.
         """
+        from iaconnector.oauth import OAuthConsumer
+
         assert self._oauth is None
         self._oauth = OAuthConsumer(
             client_id=client_id,
@@ -47,18 +86,28 @@ class IAConnector(object):
             renew_token=renew_token,
             base_url=base_url,
             connector=self,
+            token_expiry=token_expiry,
+            auto_refresh=auto_refresh,
+            refresh_margin=refresh_margin,
+            token_store=token_store,
+            token_key=token_key,
         )
 
-    def init_api(self, base_url=None):
+    def init_api(self, base_url=None, transport=None):
         """
         Initializes the API consumer. This is only possible if the consumer has not been initializes yet.
 
         :param base_url: (Optional) The URL of the API implementation. Overrides the default production URL.
+        :param transport: (Optional) The `Transport` to perform the HTTP requests with, for example an `HTTPXTransport`
+        for HTTP/2. Defaults to a pooled `requests` session.
         """
+        from iaconnector.api import APIConsumer
+
         assert self._api is None
         self._api = APIConsumer(
             base_url=base_url,
             connector=self,
+            transport=transport,
         )
 
     def propagate_tokens(self, access_token=None, renew_token=None, source=None):
@@ -77,14 +126,14 @@ class IAConnector(object):
         :param renew_token: The renew token to propagate.
         :param source: The source object which initiated the propagation.
         """
-        # Set for API
-        if not isinstance(source, APIConsumer) and self._api is not None:
+        # Set for API (the consumer classes are only imported if they are in use)
+        if self._api is not None and not isinstance(source, __getattr__('BaseAPIConsumer')):
             if access_token is not None:
                 self._api.access_token = access_token
                 logger.debug("Access token propagated to API.")
 
         # Set for OAuth
-        if not isinstance(source, OAuthConsumer) and self._oauth is not None:
+        if self._oauth is not None and not isinstance(source, __getattr__('OAuthConsumer')):
             if access_token is not None:
                 self._oauth.access_token = access_token
                 logger.debug("Access token propagated to OAuth.")
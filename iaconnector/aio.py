@@ -0,0 +1,326 @@
+"""
+Asynchronous (asyncio) API consumer for the Inter-Actief API.
+
+This module requires the optional `aiohttp` dependency, which can be installed using `pip install iaconnector[async]`.
+"""
+import asyncio
+import time
+from contextlib import nullcontext
+
+import logging
+
+from iaconnector.api import APIBatch, BaseAPIConsumer
+from iaconnector.exceptions import APIError, CircuitOpenError, NotLoggedInError, TransportError
+from iaconnector.flight import AsyncSingleFlight
+from iaconnector.transport import DEFAULT_TIMEOUT, _split_timeout
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+logger = logging.getLogger('iaconnector')
+
+
+def _require_aiohttp():
+    """
+    Raises an ImportError if the optional `aiohttp` dependency is not installed.
+    """
+    if aiohttp is None:
+        raise ImportError("The asynchronous consumers require aiohttp, install 'iaconnector[async]'.")
+
+
+def _client_timeout(timeout):
+    """
+    Converts a timeout given as a number or a tuple of the connect and read timeout to an aiohttp timeout.
+    """
+    connect, read = _split_timeout(timeout)
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+
+class AsyncAPIConsumer(BaseAPIConsumer):
+    """
+    Asynchronous API consumer for the Inter-Actief API.
+
+    Provides the same endpoint methods as `APIConsumer`, which return awaitables instead of results::
+
+        async with AsyncAPIConsumer(access_token=token) as api:
+            details = await api.get_activity_details(id)
+
+    Connections are pooled and kept alive within a consumer. The number of concurrent calls is bounded by
+    `max_concurrency`; additional calls wait for a free slot.
+    """
+    def __init__(self, access_token=None, base_url=None, connector=None, preview_mode=False, limit=100,
+                 limit_per_host=10, max_concurrency=10, keep_alive=True, cache=None, cache_ttls=None, metrics=None,
+                 request_log=None, timeout=DEFAULT_TIMEOUT, codec=None, coalesce=True, limiters=None, retries=2,
+                 retry_backoff=0.1, retry_backoff_max=2.0, breaker_threshold=None, breaker_timeout=30, models=False,
+                 token_cache=None):
+        """
+        :param access_token: (Optional) The access token to use with the API.
+        :param base_url: (Optional) The URL on which the API resides. Defaults to the production Inter-Actief API.
+        :param connector: (Optional) The `IAConnector` instance this consumer is used with.
+        :param preview_mode: (Optional) Whether to use a sandboxed test environment.
+        :param limit: (Optional) The maximum number of open connections.
+        :param limit_per_host: (Optional) The maximum number of open connections per host.
+        :param max_concurrency: (Optional) The maximum number of concurrent calls.
+        :param keep_alive: (Optional) Whether to keep connections open between calls.
+        :param cache: (Optional) The `ResponseCache` to cache results of read-only methods in. Caching is disabled by
+        default.
+        :param cache_ttls: (Optional) A dictionary of JSON-RPC method names and the time to live of their cached results
+        in seconds, overriding the defaults in `cache_ttls`.
+        :param metrics: (Optional) The `MetricsHook` to report metrics of the calls to.
+        :param request_log: (Optional) The `RequestLogger` to log requests and responses with.
+        :param timeout: (Optional) The timeout in seconds of a request, as a number or a tuple of the connect and read
+        timeout. `None` disables the timeout. Time spent waiting for a free slot is not included.
+        :param codec: (Optional) The `JSONCodec` to encode requests and decode responses with.
+        :param coalesce: (Optional) Whether identical concurrent calls of read-only methods share a single request.
+        :param limiters: (Optional) A dictionary of JSON-RPC method names (or `batch`) and the `RateLimiter` to limit
+        their requests with. The limiter at key `None` applies to the other methods.
+        :param retries: (Optional) The maximum number of retries of calls of read-only methods when the API is
+        unavailable.
+        :param retry_backoff: (Optional) The maximum delay in seconds before the first retry, doubling every retry.
+        :param retry_backoff_max: (Optional) The maximum delay in seconds before a retry.
+        :param breaker_threshold: (Optional) The number of consecutive failures of a method after which its calls fail
+        fast. Circuit breaking is disabled by default.
+        :param breaker_timeout: (Optional) The number of seconds after which a call is tried again.
+        :param models: (Optional) Whether activities and person details are returned as compact models.
+        :param token_cache: (Optional) The `TokenInfoCache` to answer token checks and person details from.
+        """
+        _require_aiohttp()
+        super(AsyncAPIConsumer, self).__init__(
+            access_token=access_token,
+            base_url=base_url,
+            connector=connector,
+            preview_mode=preview_mode,
+            keep_alive=keep_alive,
+            cache=cache,
+            cache_ttls=cache_ttls,
+            metrics=metrics,
+            request_log=request_log,
+            codec=codec,
+            coalesce=coalesce,
+            limiters=limiters,
+            retries=retries,
+            retry_backoff=retry_backoff,
+            retry_backoff_max=retry_backoff_max,
+            breaker_threshold=breaker_threshold,
+            breaker_timeout=breaker_timeout,
+            models=models,
+            token_cache=token_cache,
+        )
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        self._session = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._flights = AsyncSingleFlight()
+        self._renew_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _get_session(self):
+        """
+        Returns the HTTP session object and creates a new one if necessary. Must be called from a running event loop.
+
+        :return: The HTTP session object.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    force_close=not self.keep_alive,
+                ),
+                timeout=_client_timeout(self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """
+        Closes the HTTP session and its connections. The consumer can still be used afterwards, in which case a new
+        session is created.
+        """
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    async def _post(self, payload):
+        """
+        Sends a JSON-RPC payload (a single call or a batch) to the API and returns the decoded response.
+
+        :param payload: The JSON-RPC request object or list of request objects.
+        :return: The decoded JSON response.
+        """
+        body = self.codec.encode(payload)
+        headers = self._get_headers()
+        headers['Content-Type'] = 'application/json'
+
+        limiter = self._get_limiter(payload)
+
+        session = self._get_session()
+
+        async with (limiter.permit_async() if limiter is not None else nullcontext()) as permit, self._semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.post(self.base_url, data=body, headers=headers) as response:
+                    content = await response.read()
+                response_json = self.codec.decode(content)
+            except Exception as e:
+                if self.metrics is not None:
+                    self._observe_call(payload, time.perf_counter() - started, len(body), 0, exception=e)
+                raise TransportError("Request failed: %s" % str(e)) from e
+
+            if permit is not None:
+                permit.overloaded = self._is_overloaded(response_json)
+
+        if self.metrics is not None:
+            self._observe_call(payload, time.perf_counter() - started, len(body), len(content),
+                               response_json=response_json)
+
+        self._log_response(payload, response_json)
+
+        return response_json
+
+    async def _call(self, method, *params):
+        """
+        Performs a JSON-RPC call. Raises an APIError (or subclassed) exception in case of an error.
+
+        The (JSON) result is decoded and returned as native Python objects, or as models if enabled.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call as Python objects.
+        """
+        hit, result = self._get_token_info(method)
+
+        if not hit:
+            hit, result = self._get_cached(method, params)
+
+        if not hit:
+            if self.coalesce and method in self.read_methods:
+                key = self._get_cache_key(method, params)
+                result = await self._flights.do(key, lambda: self._fetch(method, params))
+            else:
+                result = await self._fetch(method, params)
+
+        return self._to_model(method, result)
+
+    async def _fetch(self, method, params):
+        """
+        Performs a JSON-RPC call, bypassing the cache and coalescing, and updates the cache with the result. See
+        `APIConsumer._fetch`.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call as Python objects.
+        """
+        breaker = self._get_breaker(method)
+
+        try:
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("The API is unavailable for %s." % method)
+            result = await self._attempt(method, params)
+        except APIError as e:
+            return self._handle_failure(method, params, breaker, e)
+        except BaseException:
+            # Such as a cancellation, which must not leave a trial call of a half-open circuit unfinished
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        if breaker is not None:
+            breaker.record_success()
+
+        self._update_cache(method, params, result)
+        self._update_token_info(method, result)
+        return result
+
+    async def _attempt(self, method, params):
+        """
+        Performs a JSON-RPC call with retries and token renewal. See `APIConsumer._attempt`.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call as Python objects.
+        """
+        access_token = self._get_access_token()
+        attempt = 0
+        renewed = False
+
+        while True:
+            try:
+                return self._get_result(await self._post(self._build_request(method, params)))
+            except NotLoggedInError:
+                self._forget_token()
+                if renewed or not await self._renew_access_token(access_token):
+                    raise
+                renewed = True
+            except APIError as e:
+                if not self._should_retry(method, e, attempt):
+                    raise
+                attempt += 1
+                await asyncio.sleep(self._get_retry_delay(attempt))
+
+    async def _renew_access_token(self, access_token):
+        """
+        Renews the rejected access token without blocking the event loop. See `APIConsumer._renew_access_token`.
+
+        :param access_token: The rejected access token.
+        :return: Whether a new access token is available.
+        """
+        oauth = self._get_oauth(access_token)
+
+        if oauth is None:
+            return False
+
+        logger.info("Access token rejected, renewing.")
+        async with self._renew_lock:
+            if self.access_token == access_token:
+                await oauth.renew_access_token_async()
+                self.access_token = oauth.access_token
+
+        return self.access_token != access_token
+
+    def batch(self):
+        """
+        Returns a batch for combining multiple API calls into a single JSON-RPC batch request. See `APIConsumer.batch`.
+
+        The batch is sent when it is used as an asynchronous context manager and the block exits without an exception,
+        or when `send` is awaited explicitly.
+
+        :return: The `AsyncAPIBatch` object.
+        """
+        return AsyncAPIBatch(self)
+
+
+class AsyncAPIBatch(APIBatch):
+    """
+    A JSON-RPC batch of API calls for the asynchronous consumer. Obtain an instance using `AsyncAPIConsumer.batch`.
+    """
+    def __enter__(self):
+        raise TypeError("Use 'async with' for batches of an AsyncAPIConsumer.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.send()
+
+    async def send(self):
+        """
+        Sends all queued calls in a single request and sets the results of their placeholders. Failures of individual
+        calls are stored in their placeholder and raised by `BatchCall.result`.
+        """
+        if not self.calls:
+            return
+
+        calls, payload = self._build_payload()
+        self._set_results(calls, await self.consumer._post(payload))
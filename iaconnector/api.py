@@ -1,37 +1,278 @@
+import contextvars
+import hashlib
+import inspect
 import random
 import string
+import time
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
 
 import logging
-import requests
 
-from iaconnector.exceptions import APIError
+from iaconnector.codec import default_codec
+from iaconnector.breaker import CircuitBreaker
+from iaconnector.exceptions import APIError, CircuitOpenError, NotLoggedInError, OtherError, TransportError
+from iaconnector.flight import SingleFlight
+from iaconnector.logs import default_request_log
+from iaconnector.models import Activity, Person
+from iaconnector.streaming import iter_json_array
+from iaconnector.transport import DEFAULT_TIMEOUT, RequestsTransport
 
 
 logger = logging.getLogger('iaconnector')
 
 
-class APIConsumer(object):
+# Access token for API calls in the current context, overriding the access token of the consumer
+_context_access_token = contextvars.ContextVar('iaconnector_access_token', default=None)
+
+
+@contextmanager
+def using_token(access_token):
     """
-    API consumer for the Inter-Actief API.
+    Returns a context manager within which API calls of all consumers use the given access token instead of their own.
+
+    The token is stored in a context variable, so it applies to the current thread or asyncio task only. This allows a
+    single consumer (with its connection pool and cache) to be shared between users::
+
+        with using_token(token):
+            details = api.get_person_details()
+
+    :param access_token: The access token to use.
+    """
+    reset_token = _context_access_token.set(access_token)
+    try:
+        yield
+    finally:
+        _context_access_token.reset(reset_token)
+
+
+class APIEndpoints(object):
+    """
+    The endpoints of the Inter-Actief API.
 
     The methods performing API calls are documented to explain the call according to the official API documentation.
-    Additionally, the exact JSON-RPC method name is included for reference.
+    Additionally, the exact JSON-RPC method name is included for reference. Subclasses implement `_call` to perform
+    the actual JSON-RPC call.
 
     The API documentation can be found at https://github.com/Inter-Actief/api-docs.
     """
+    __slots__ = ()
+
+    def _call(self, method, *params):
+        raise NotImplementedError()
+
+    # Authentication module
+
+    def get_device_id(self):
+        """
+        Requests a new device id. It is recommended to call this method only once in your apps lifetime, just after its
+        first start, and store the result for further use.
+
+        JSON-RPC method: `getDeviceId`.
+
+        :return: The assigned device id.
+        """
+        return self._call('getDeviceId')
+
+    def get_auth_token(self, username, password, device_id):
+        """
+        Attempts to log in and returns the authentication token.
+
+        This method is deprecated, please use OAuth and do not directly ask the user for his/her password.
+
+        JSON-RPC method: `getAuthToken`.
+
+        :param username: The username of the user.
+        :param password: The password of the user.
+        :param device_id: The device id of this app.
+        :return: The authentication token for further use.
+        """
+        warnings.warn("API method 'get_auth_token' is deprecated, use OAuth instead.", DeprecationWarning, stacklevel=2)
+        return self._call('getAuthToken', username, password, device_id)
+
+    def check_auth_token(self):
+        """
+        Checks if an authentication token is (still) valid. It is recommended to do this after resuming your app, to see
+        if the token was revoked.
+
+        JSON-RPC method: `checkAuthToken`.
+
+        :return: Whether the authentication token is valid.
+        """
+        return self._call('checkAuthToken')
+
+    def revoke_auth_token(self):
+        """
+        Revokes an authentication token.
+
+        JSON-RPC method: `revokeAuthToken`.
+
+        :return: Whether the token was successfully revoked.
+        """
+        return self._call('revokeAuthToken')
+
+    def get_person_details(self):
+        """
+        Retrieves details of the currently authenticated person.
+
+        For a detailed description of the result, please consult the official API documentation.
+
+        JSON-RPC method: `getPersonDetails`.
+
+        :return: A dictionary containing the user's details.
+        """
+        return self._call('getPersonDetails')
+
+    # Activity module
+
+    def get_activity_stream(self, begin, end):
+        """
+        Retrieves a list of activities.
+
+        The authentication token is used to check if the user is signed up for an activity.
+
+        For a detailed description of the result, please consult the official API documentation.
+
+        JSON-RPC method: `getActivityStream`.
+
+        :param begin: The minimal end date (inclusive).
+        :param end: The maximal begin date (exclusive).
+        :return: An list of dictionaries containing the activity details.
+        """
+        return self._call('getActivityStream', begin, end)
+
+    def get_activity_details(self, id):
+        """
+        Retrieves the details of an activity, including its signup options.
+
+        The authentication token is used to check if the user is signed up for an activity.
+
+        For a detailed description of the result, please consult the official API documentation.
+
+        JSON-RPC method: `getActivityDetailed`.
+
+        :param id: The id of the activity.
+        :return: A dictionary containing the activity details.
+        """
+        return self._call('getActivityDetailed', id)
+
+    def activity_signup(self, id, price, options):
+        """
+        Marks the user as an attendee to an activity.
+
+        The calculated costs for the activity are used to check if the user was presented with the right price. The
+        selected options may change the price of the activity.
+
+        The options must be given as an list of dictionaries containing an id (of the option) and appropriate value.
+
+        JSON-RPC method: `activitySignup`.
+
+        :param id: The id of the activity.
+        :param price: The calculated costs for the activity.
+        :param options: The selected options for the activity.
+        """
+        return self._call('activitySignup', id, price, options)
+
+    def revoke_activity_signup(self, id):
+        """
+        Unmarks the current user as an attendee to an activity.
+
+        JSON-RPC method: `activityRevokeSignup`.
+
+        :param id: The id of the activity.
+        """
+        return self._call('activityRevokeSignup', id)
+
+
+class BaseAPIConsumer(APIEndpoints):
+    """
+    Base class for API consumers for the Inter-Actief API.
+
+    Contains the configuration and the construction and interpretation of JSON-RPC messages, which are shared between
+    the synchronous and asynchronous consumers.
+    """
     base_url = 'https://api.ia.utwente.nl/app/lennart/'
 
-    def __init__(self, access_token=None, base_url=None, connector=None, preview_mode=False):
+    # Time to live in seconds of cached results of read-only methods
+    cache_ttls = {
+        'getActivityStream': 60,
+        'getActivityDetailed': 60,
+        'getPersonDetails': 300,
+    }
+
+    # Methods which only read data, so that identical concurrent calls can share a single request
+    read_methods = frozenset(['checkAuthToken', 'getPersonDetails', 'getActivityStream', 'getActivityDetailed'])
+
+    # Methods changing the state of an activity, of which the first parameter is the activity id
+    activity_updates = ('activitySignup', 'activityRevokeSignup')
+
+    # Model classes of the results (or the items of list results) of methods, if models are enabled
+    result_models = {
+        'getActivityStream': Activity,
+        'getActivityDetailed': Activity,
+        'getPersonDetails': Person,
+    }
+
+    def __init__(self, access_token=None, base_url=None, connector=None, preview_mode=False, keep_alive=True,
+                 cache=None, cache_ttls=None, metrics=None, request_log=None, codec=None, coalesce=True, limiters=None,
+                 retries=2, retry_backoff=0.1, retry_backoff_max=2.0, breaker_threshold=None, breaker_timeout=30,
+                 models=False, token_cache=None):
         """
         :param access_token: (Optional) The access token to use with the API.
         :param base_url: (Optional) The URL on which the API resides. Defaults to the production Inter-Actief API.
         :param connector: (Optional) The `IAConnector` instance this consumer is used with.
         :param preview_mode: (Optional) Whether to use a sandboxed test environment.
+        :param keep_alive: (Optional) Whether to keep connections open between calls.
+        :param cache: (Optional) The `ResponseCache` to cache results of read-only methods in. Caching is disabled by
+        default.
+        :param cache_ttls: (Optional) A dictionary of JSON-RPC method names and the time to live of their cached results
+        in seconds, overriding the defaults in `cache_ttls`.
+        :param metrics: (Optional) The `MetricsHook` to report metrics of the calls to.
+        :param request_log: (Optional) The `RequestLogger` to log requests and responses with. Defaults to logging to
+        the `iaconnector` logger at DEBUG level.
+        :param codec: (Optional) The `JSONCodec` to encode requests and decode responses with. Defaults to orjson if
+        installed, and the standard library otherwise.
+        :param coalesce: (Optional) Whether identical concurrent calls of read-only methods (with the same parameters
+        and access token) share a single request and its result or exception.
+        :param limiters: (Optional) A dictionary of JSON-RPC method names (or `batch`) and the `RateLimiter` to limit
+        their requests with. The limiter at key `None` applies to the other methods. Methods can share a limiter. No
+        limits apply by default.
+        :param retries: (Optional) The maximum number of retries of calls of read-only methods when the API is
+        unavailable (connection failures, invalid responses and internal server errors).
+        :param retry_backoff: (Optional) The maximum delay in seconds before the first retry. The maximum delay doubles
+        with every retry; the actual delay is random.
+        :param retry_backoff_max: (Optional) The maximum delay in seconds before a retry.
+        :param breaker_threshold: (Optional) The number of consecutive failures of a method after which calls of that
+        method fail fast with a `CircuitOpenError`. Circuit breaking is disabled by default.
+        :param breaker_timeout: (Optional) The number of seconds after which a call is tried again.
+        :param models: (Optional) Whether activities and person details are returned as the compact models of
+        `iaconnector.models` instead of dictionaries.
+        :param token_cache: (Optional) The `TokenInfoCache` to answer `check_auth_token` and `get_person_details` from
+        while the access token is known to be valid. Disabled by default.
         """
         self.access_token = access_token
         self.connector = connector
         self.preview_mode = preview_mode
+        self.keep_alive = keep_alive
+        self.cache = cache
+        self.metrics = metrics
+        self.request_log = request_log if request_log is not None else default_request_log
+        self.codec = codec if codec is not None else default_codec
+        self.coalesce = coalesce
+        self.limiters = limiters or {}
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_timeout = breaker_timeout
+        self.models = models
+        self.token_cache = token_cache
+        self._breakers = {}
+
+        if cache_ttls is not None:
+            self.cache_ttls = dict(self.cache_ttls, **cache_ttls)
 
         if base_url is not None:
             if base_url[-1:] != '/':
@@ -59,48 +300,398 @@ class APIConsumer(object):
 
         return errors.get(error_code, APIError)
 
-    def _call(self, method, *params):
+    @staticmethod
+    def _generate_call_id():
         """
-        Performs a JSON-RPC call. Raises an APIError (or subclassed) exception in case of an error.
+        Generates a random identifier for a JSON-RPC call.
 
-        The (JSON) result is decoded and returned as native Python objects.
+        :return: The call identifier.
+        """
+        return ''.join(random.choice(string.ascii_letters + string.digits) for i in range(10))
 
-        :param method: The API method to call.
-        :param call_id: (Optional) An identifier for the API call. This is not used at this time.
-        :param params: The parameters for the method call.
-        :return: The result of the call as Python objects.
+    def _get_access_token(self):
         """
-        call_id = ''.join(random.choice(string.ascii_letters + string.digits) for i in range(10))
+        Returns the access token to use for a call: the token set for the current context using `using_token` or
+        `bind`, or the access token of this consumer.
 
+        :return: The access token or `None`.
+        """
+        access_token = _context_access_token.get()
+        return access_token if access_token is not None else self.access_token
+
+    def bind(self, access_token):
+        """
+        Returns a lightweight consumer for a single user, which performs calls through this consumer using the given
+        access token. The connection pool and cache of this consumer are shared by all bound consumers, and this
+        consumer is not modified, so it can be shared between threads and users.
+
+        :param access_token: The access token of the user.
+        :return: The `BoundAPIConsumer` object.
+        """
+        return BoundAPIConsumer(self, access_token)
+
+    def _get_headers(self):
+        """
+        Builds the HTTP headers for a JSON-RPC request.
+
+        :return: A dictionary of HTTP headers.
+        """
         headers = {
             'User-Agent': 'IAConnector',
         }
 
-        if self.access_token:
-            headers['Authorization'] = 'Bearer %s' % self.access_token
+        access_token = self._get_access_token()
+
+        if access_token:
+            headers['Authorization'] = 'Bearer %s' % access_token
 
         if self.preview_mode:
             headers['User-Agent'] += ' PREVIEWMODE'
 
-        logger.debug("API request: {method:s}({params:s}).".format(
-            method=method,
-            params=','.join(map(str, params)),
-        ))
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
 
-        response = requests.post(
-            url=self.base_url,
-            json={
-                'method': method,
-                'params': params,
-                'id': call_id,
-            },
-            headers=headers
+        return headers
+
+    def _build_request(self, method, params):
+        """
+        Builds a JSON-RPC request object.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The JSON-RPC request object.
+        """
+        call_id = self._generate_call_id()
+
+        self.request_log.log_request(call_id, method, params)
+
+        return {
+            'method': method,
+            'params': params,
+            'id': call_id,
+        }
+
+    def _log_response(self, payload, response_json):
+        """
+        Logs a JSON-RPC response, if enabled.
+
+        :param payload: The JSON-RPC request object or list of request objects.
+        :param response_json: The decoded JSON-RPC response.
+        """
+        if isinstance(payload, dict):
+            self.request_log.log_response(payload['id'], payload['method'], response_json)
+        elif payload:
+            self.request_log.log_response(payload[0]['id'], 'batch', response_json)
+
+    def _get_limiter(self, payload):
+        """
+        Returns the rate limiter for a JSON-RPC payload.
+
+        :param payload: The JSON-RPC request object or list of request objects.
+        :return: The `RateLimiter` or `None`.
+        """
+        if not self.limiters:
+            return None
+
+        method = payload['method'] if isinstance(payload, dict) else 'batch'
+        return self.limiters.get(method, self.limiters.get(None))
+
+    def _is_overloaded(self, response_json):
+        """
+        Returns whether a JSON-RPC response signals that the server is overloaded, which is the case for internal server
+        errors (`OtherError`).
+
+        :param response_json: The decoded JSON-RPC response.
+        :return: Whether the server is overloaded.
+        """
+        items = response_json if isinstance(response_json, list) else [response_json]
+
+        return any(
+            isinstance(item, dict) and isinstance(item.get('error'), dict) and
+            issubclass(self._get_exception(item['error'].get('code')), OtherError)
+            for item in items
         )
 
-        response_json = response.json()
+    def _is_unavailable(self, exception):
+        """
+        Returns whether an exception indicates that the API is (temporarily) unavailable: the request failed, the
+        response was invalid or the server reported an internal error.
+
+        :param exception: The APIError (or subclassed) exception.
+        :return: Whether the API is unavailable.
+        """
+        return isinstance(exception, (TransportError, OtherError)) and not isinstance(exception, CircuitOpenError)
+
+    def _should_retry(self, method, exception, attempt):
+        """
+        Returns whether a failed call is retried. Only calls of read-only methods are retried, as other calls might
+        have taken effect.
+
+        :param method: The API method that was called.
+        :param exception: The APIError (or subclassed) exception.
+        :param attempt: The number of retries so far.
+        :return: Whether the call is retried.
+        """
+        if attempt >= self.retries or method not in self.read_methods or not self._is_unavailable(exception):
+            return False
+
+        logger.debug("Retrying %s after %s.", method, type(exception).__name__)
+        if self.metrics is not None:
+            self.metrics.observe_retry(method)
+
+        return True
+
+    def _get_retry_delay(self, attempt):
+        """
+        Returns the delay before a retry: exponential backoff with full jitter.
+
+        :param attempt: The number of the retry, starting at 1.
+        :return: The delay in seconds.
+        """
+        return random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** (attempt - 1)))
+
+    def _get_breaker(self, method):
+        """
+        Returns the circuit breaker for a method, if circuit breaking is enabled.
+
+        :param method: The API method.
+        :return: The `CircuitBreaker` or `None`.
+        """
+        if self.breaker_threshold is None:
+            return None
+
+        breaker = self._breakers.get(method)
+
+        if breaker is None:
+            breaker = self._breakers.setdefault(
+                method,
+                CircuitBreaker(method, failure_threshold=self.breaker_threshold, reset_timeout=self.breaker_timeout),
+            )
+
+        return breaker
+
+    def _handle_failure(self, method, params, breaker, exception):
+        """
+        Handles a failed call: records the failure with the circuit breaker and returns the stale cached result if the
+        API is unavailable and there is one. Raises the exception otherwise.
+
+        :param method: The API method that was called.
+        :param params: The parameters of the method call.
+        :param breaker: The `CircuitBreaker` of the method or `None`.
+        :param exception: The APIError (or subclassed) exception.
+        :return: The stale result.
+        """
+        if breaker is not None and not isinstance(exception, CircuitOpenError):
+            if self._is_unavailable(exception):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+        if isinstance(exception, (TransportError, OtherError)) and self.cache is not None and \
+                method in self.cache_ttls:
+            hit, result = self.cache.get_stale(self._get_cache_key(method, params))
+            if hit:
+                logger.warning("Serving stale result for %s: %s", method, exception)
+                return result
+
+        raise exception
+
+    def _get_oauth(self, access_token):
+        """
+        Returns the OAuth consumer to renew the given rejected access token with, if possible.
+
+        :param access_token: The rejected access token.
+        :return: The `OAuthConsumer` or `None`.
+        """
+        if _context_access_token.get() is not None or self.connector is None:
+            return None
+
+        oauth = self.connector.oauth
+        if oauth is None or not oauth.renew_token:
+            return None
+
+        return oauth
+
+    def _get_token_expiry(self, access_token):
+        """
+        Returns the expiry of the given access token, if it is the token of the OAuth consumer of the connector.
+
+        :param access_token: The access token.
+        :return: The (UTC) datetime the token expires, or `None` if unknown.
+        """
+        oauth = self.connector.oauth if self.connector is not None else None
+
+        if oauth is None or oauth.access_token != access_token:
+            return None
+
+        return oauth.token_expiry
+
+    def _get_token_info(self, method):
+        """
+        Looks up the result of a call checking the access token or its user in the token cache.
+
+        :param method: The API method to call.
+        :return: A tuple of a boolean indicating whether the result was found and the result.
+        """
+        access_token = self._get_access_token()
+
+        if self.token_cache is None or not access_token:
+            return False, None
+
+        if method == 'checkAuthToken':
+            return self.token_cache.is_valid(access_token), True
+        if method == 'getPersonDetails':
+            return self.token_cache.get_person(access_token)
+
+        return False, None
+
+    def _update_token_info(self, method, result):
+        """
+        Updates the token cache after a successful call checking, revoking or using the access token.
+
+        :param method: The API method that was called.
+        :param result: The result of the call.
+        """
+        if method == 'revokeAuthToken' or (method == 'checkAuthToken' and not result):
+            self._forget_token()
+            return
 
-        logger.debug("API response: {json:s}".format(json=response_json))
+        access_token = self._get_access_token()
 
+        if self.token_cache is None or not access_token:
+            return
+
+        if method == 'checkAuthToken':
+            self.token_cache.set_valid(access_token, self._get_token_expiry(access_token))
+        elif method == 'getPersonDetails':
+            self.token_cache.set_valid(access_token, self._get_token_expiry(access_token), person=result)
+
+    def _forget_token(self):
+        """
+        Removes the access token from the token cache, and the cached person details of the token from the response
+        cache, after the token has been revoked or rejected by the API.
+        """
+        access_token = self._get_access_token()
+
+        if not access_token:
+            return
+
+        if self.token_cache is not None:
+            self.token_cache.invalidate(access_token)
+        if self.cache is not None:
+            self.cache.delete(self._get_cache_key('getPersonDetails', ()))
+
+    def _get_cache_key(self, method, params):
+        """
+        Builds the cache key for a call. The key includes a hash of the access token, as results depend on the user.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The cache key.
+        """
+        access_token = self._get_access_token()
+        token = hashlib.sha256(access_token.encode('utf-8')).hexdigest() if access_token else None
+        return method, self._encode_params(params), token
+
+    def _encode_params(self, params):
+        """
+        Encodes the parameters of a call for a cache key, with the codec the request is encoded with, so every call
+        which can be made has a key.
+
+        :param params: The parameters for the method call.
+        :return: The JSON document as a string.
+        """
+        return self.codec.encode(list(params)).decode('utf-8')
+
+    def _get_cached(self, method, params):
+        """
+        Looks up the cached result of a call.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: A tuple of a boolean indicating whether a cached result was found and the cached result.
+        """
+        if self.cache is None or method not in self.cache_ttls:
+            return False, None
+
+        hit, result = self.cache.get(self._get_cache_key(method, params))
+
+        if self.metrics is not None:
+            self.metrics.observe_cache(method, hit)
+
+        return hit, result
+
+    def _observe_call(self, payload, duration, request_size, response_size, response_json=None, exception=None):
+        """
+        Reports the metrics of a JSON-RPC request to the metrics hook.
+
+        :param payload: The JSON-RPC request object or list of request objects.
+        :param duration: The duration of the request in seconds.
+        :param request_size: The size of the request body in bytes.
+        :param response_size: The size of the response body in bytes.
+        :param response_json: (Optional) The decoded JSON-RPC response.
+        :param exception: (Optional) The exception raised while performing the request.
+        """
+        error = None
+
+        if exception is not None:
+            error = type(exception).__name__
+        elif isinstance(response_json, dict) and isinstance(response_json.get('error'), dict):
+            error = self._get_exception(response_json['error'].get('code')).__name__
+
+        self.metrics.observe_call(
+            payload['method'] if isinstance(payload, dict) else 'batch',
+            duration,
+            request_size,
+            response_size,
+            error,
+        )
+
+    def _update_cache(self, method, params, result):
+        """
+        Updates the cache after a successful call. Results of read-only methods are stored, and calls changing an
+        activity invalidate the cached results containing that activity.
+
+        :param method: The API method that was called.
+        :param params: The parameters of the method call.
+        :param result: The result of the call.
+        """
+        if self.cache is None:
+            return
+
+        if method in self.cache_ttls:
+            self.cache.set(self._get_cache_key(method, params), result, self.cache_ttls[method])
+        elif method in self.activity_updates:
+            self.cache.invalidate_item(params[0], 'getActivityDetailed', self._encode_params(params[:1]))
+
+    def _to_model(self, method, result):
+        """
+        Converts the result of a call to the model of the method, if models are enabled. The items of list results are
+        converted one by one, so this is also used for items of streamed results.
+
+        :param method: The API method that was called.
+        :param result: The result of the call as Python objects.
+        :return: The model (or list of models), or the result as-is.
+        """
+        if not self.models or method not in self.result_models:
+            return result
+
+        model = self.result_models[method]
+
+        if isinstance(result, dict):
+            return model.from_dict(result)
+        if isinstance(result, list):
+            return model.from_list(result)
+        return result
+
+    def _get_result(self, response_json):
+        """
+        Extracts the result from a JSON-RPC response object. Raises an APIError (or subclassed) exception in case of an
+        error.
+
+        :param response_json: The decoded JSON-RPC response object.
+        :return: The result of the call as Python objects.
+        """
         if 'error' in response_json and response_json['error'] is not None:
             error = response_json['error']
 
@@ -116,128 +707,620 @@ class APIConsumer(object):
 
         return result
 
-    # ----------------------
-    # Begin of API endpoints
-    # ----------------------
 
-    # Authentication module
+class APIConsumer(BaseAPIConsumer):
+    """
+    API consumer for the Inter-Actief API.
 
-    def get_device_id(self):
+    The API calls are performed by a transport, by default over a pooled HTTP session which is shared with other
+    consumers of the same API.
+    """
+    # Size in bytes of the chunks in which streamed responses are read
+    stream_chunk_size = 65536
+
+    def __init__(self, access_token=None, base_url=None, connector=None, preview_mode=False, pool_connections=10,
+                 pool_maxsize=10, pool_block=False, keep_alive=True, session_pool=None, cache=None, cache_ttls=None,
+                 metrics=None, request_log=None, transport=None, timeout=DEFAULT_TIMEOUT, codec=None, coalesce=True,
+                 limiters=None, retries=2, retry_backoff=0.1, retry_backoff_max=2.0, breaker_threshold=None,
+                 breaker_timeout=30, models=False, token_cache=None, prefetcher=None):
         """
-        Requests a new device id. It is recommended to call this method only once in your apps lifetime, just after its
-        first start, and store the result for further use.
+        :param access_token: (Optional) The access token to use with the API.
+        :param base_url: (Optional) The URL on which the API resides. Defaults to the production Inter-Actief API.
+        :param connector: (Optional) The `IAConnector` instance this consumer is used with.
+        :param preview_mode: (Optional) Whether to use a sandboxed test environment.
+        :param pool_connections: (Optional) The number of per-host connection pools to cache.
+        :param pool_maxsize: (Optional) The maximum number of connections to keep open per host.
+        :param pool_block: (Optional) Whether to wait for a free connection instead of exceeding `pool_maxsize`.
+        :param keep_alive: (Optional) Whether to keep connections open between calls.
+        :param session_pool: (Optional) The `SessionPool` to obtain the HTTP session from. Consumers using the same pool
+        and base URL share their connections. Defaults to a process-wide pool.
+        :param cache: (Optional) The `ResponseCache` to cache results of read-only methods in. Caching is disabled by
+        default.
+        :param cache_ttls: (Optional) A dictionary of JSON-RPC method names and the time to live of their cached results
+        in seconds, overriding the defaults in `cache_ttls`.
+        :param metrics: (Optional) The `MetricsHook` to report metrics of the calls to.
+        :param request_log: (Optional) The `RequestLogger` to log requests and responses with.
+        :param transport: (Optional) The `Transport` to perform the HTTP requests with, for example to record or replay
+        the calls. Defaults to a `RequestsTransport` using the pool settings above. A given transport is not closed by
+        `close`.
+        :param timeout: (Optional) The timeout in seconds of a request of the default transport, as a number or a tuple
+        of the connect and read timeout. `None` disables the timeout.
+        :param codec: (Optional) The `JSONCodec` to encode requests and decode responses with.
+        :param coalesce: (Optional) Whether identical concurrent calls of read-only methods share a single request.
+        :param limiters: (Optional) A dictionary of JSON-RPC method names (or `batch`) and the `RateLimiter` to limit
+        their requests with. The limiter at key `None` applies to the other methods. Streamed calls are not limited.
+        :param retries: (Optional) The maximum number of retries of calls of read-only methods when the API is
+        unavailable.
+        :param retry_backoff: (Optional) The maximum delay in seconds before the first retry, doubling every retry.
+        :param retry_backoff_max: (Optional) The maximum delay in seconds before a retry.
+        :param breaker_threshold: (Optional) The number of consecutive failures of a method after which its calls fail
+        fast. Circuit breaking is disabled by default.
+        :param breaker_timeout: (Optional) The number of seconds after which a call is tried again.
+        :param models: (Optional) Whether activities and person details are returned as compact models.
+        :param token_cache: (Optional) The `TokenInfoCache` to answer token checks and person details from.
+        :param prefetcher: (Optional) The `DetailPrefetcher` to prefetch the details of upcoming activities into the
+        cache with after an activity stream has been fetched. Requires a cache.
+        """
+        if prefetcher is not None and cache is None:
+            raise ValueError("Prefetching requires a cache.")
+
+        super(APIConsumer, self).__init__(
+            access_token=access_token,
+            base_url=base_url,
+            connector=connector,
+            preview_mode=preview_mode,
+            keep_alive=keep_alive,
+            cache=cache,
+            cache_ttls=cache_ttls,
+            metrics=metrics,
+            request_log=request_log,
+            codec=codec,
+            coalesce=coalesce,
+            limiters=limiters,
+            retries=retries,
+            retry_backoff=retry_backoff,
+            retry_backoff_max=retry_backoff_max,
+            breaker_threshold=breaker_threshold,
+            breaker_timeout=breaker_timeout,
+            models=models,
+            token_cache=token_cache,
+        )
+        self.prefetcher = prefetcher
+        self._owns_transport = transport is None
+        self._flights = SingleFlight()
 
-        JSON-RPC method: `getDeviceId`.
+        if transport is None:
+            transport = RequestsTransport(
+                self.base_url,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=pool_block,
+                session_pool=session_pool,
+                timeout=timeout,
+            )
 
-        :return: The assigned device id.
+        self.transport = transport
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
         """
-        return self._call('getDeviceId')
+        Releases the transport of this consumer. Connections are closed when no other consumer uses them.
 
-    def get_auth_token(self, username, password, device_id):
+        The consumer can still be used afterwards, in which case new connections are made.
         """
-        Attempts to log in and returns the authentication token.
+        if self._owns_transport:
+            self.transport.close()
 
-        This method is deprecated, please use OAuth and do not directly ask the user for his/her password.
+    def _get_permit(self, payload):
+        """
+        Returns a context manager waiting for the limiter of the payload, if any, yielding the permit or `None`.
 
-        JSON-RPC method: `getAuthToken`.
+        :param payload: The JSON-RPC request object or list of request objects.
+        :return: The context manager.
+        """
+        limiter = self._get_limiter(payload)
+        return limiter.permit() if limiter is not None else nullcontext()
 
-        :param username: The username of the user.
-        :param password: The password of the user.
-        :param device_id: The device id of this app.
-        :return: The authentication token for further use.
+    def _prepare(self, payload):
         """
-        warnings.warn("API method 'get_auth_token' is deprecated, use OAuth instead.", DeprecationWarning, stacklevel=2)
-        return self._call('getAuthToken', username, password, device_id)
+        Encodes a JSON-RPC payload and builds the headers of the request. Errors are raised as-is, as they are not
+        caused by the API.
 
-    def check_auth_token(self):
+        :param payload: The JSON-RPC request object or list of request objects.
+        :return: A tuple of the request body and the headers.
         """
-        Checks if an authentication token is (still) valid. It is recommended to do this after resuming your app, to see
-        if the token was revoked.
+        body = self.codec.encode(payload)
+        headers = self._get_headers()
+        headers['Content-Type'] = 'application/json'
+        return body, headers
 
-        JSON-RPC method: `checkAuthToken`.
+    def _send(self, body, headers, stream=False):
+        """
+        Sends a request body to the API using the transport.
 
-        :return: Whether the authentication token is valid.
+        :param body: The encoded JSON-RPC payload.
+        :param headers: The headers of the request.
+        :param stream: (Optional) Whether the response body is read incrementally.
+        :return: The `TransportResponse`.
         """
-        return self._call('checkAuthToken')
+        return self.transport.request('POST', self.base_url, headers, body, stream=stream)
 
-    def revoke_auth_token(self):
+    def _post(self, payload):
         """
-        Revokes an authentication token.
+        Sends a JSON-RPC payload (a single call or a batch) to the API and returns the decoded response.
 
-        JSON-RPC method: `revokeAuthToken`.
+        :param payload: The JSON-RPC request object or list of request objects.
+        :return: The decoded JSON response.
+        """
+        body, headers = self._prepare(payload)
 
-        :return: Whether the token was successfully revoked.
+        with self._get_permit(payload) as permit:
+            started = time.perf_counter() if self.metrics is not None else None
+
+            try:
+                response = self._send(body, headers)
+                response_json = self.codec.decode(response.content)
+            except Exception as e:
+                if self.metrics is not None:
+                    self._observe_call(payload, time.perf_counter() - started, 0, 0, exception=e)
+                raise TransportError("Request failed: %s" % str(e)) from e
+
+            if permit is not None:
+                permit.overloaded = self._is_overloaded(response_json)
+
+        if self.metrics is not None:
+            self._observe_call(
+                payload,
+                time.perf_counter() - started,
+                len(body),
+                len(response.content),
+                response_json=response_json,
+            )
+
+        self._log_response(payload, response_json)
+
+        return response_json
+
+    def _call(self, method, *params):
         """
-        return self._call('revokeAuthToken')
+        Performs a JSON-RPC call. Raises an APIError (or subclassed) exception in case of an error.
 
-    def get_person_details(self):
+        The (JSON) result is decoded and returned as native Python objects, or as models if enabled.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call as Python objects.
         """
-        Retrieves details of the currently authenticated person.
+        hit, result = self._get_token_info(method)
 
-        For a detailed description of the result, please consult the official API documentation.
+        if not hit:
+            hit, result = self._get_cached(method, params)
 
-        JSON-RPC method: `getPersonDetails`.
+        if not hit:
+            if self.coalesce and method in self.read_methods:
+                result = self._flights.do(self._get_cache_key(method, params), lambda: self._fetch(method, params))
+            else:
+                result = self._fetch(method, params)
 
-        :return: A dictionary containing the user's details.
+        return self._to_model(method, result)
+
+    def _fetch(self, method, params):
         """
-        return self._call('getPersonDetails')
+        Performs a JSON-RPC call, bypassing the cache and coalescing, and updates the cache with the result.
 
-    # Activity module
+        The call is guarded by the circuit breaker of the method, if enabled. If the API is unavailable, the stale
+        cached result of the call is returned if there is one. After an activity stream has been fetched, prefetching
+        the details of its upcoming activities is scheduled, if enabled.
 
-    def get_activity_stream(self, begin, end):
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call as Python objects.
         """
-        Retrieves a list of activities.
+        breaker = self._get_breaker(method)
 
-        The authentication token is used to check if the user is signed up for an activity.
+        try:
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("The API is unavailable for %s." % method)
+            result = self._attempt(method, params)
+        except APIError as e:
+            return self._handle_failure(method, params, breaker, e)
+        except BaseException:
+            # Such as an error of the OAuth library, which must not leave a trial call of a half-open circuit unfinished
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        if breaker is not None:
+            breaker.record_success()
+
+        self._update_cache(method, params, result)
+        self._update_token_info(method, result)
+
+        if self.prefetcher is not None and method == 'getActivityStream' and isinstance(result, list):
+            self.prefetcher.schedule(self, result)
 
-        For a detailed description of the result, please consult the official API documentation.
+        return result
 
-        JSON-RPC method: `getActivityStream`.
+    def _attempt(self, method, params):
+        """
+        Performs a JSON-RPC call, retrying read-only methods when the API is unavailable and renewing the access token
+        once if it is rejected.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call as Python objects.
+        """
+        access_token = self._get_access_token()
+        attempt = 0
+        renewed = False
+
+        while True:
+            try:
+                return self._get_result(self._post(self._build_request(method, params)))
+            except NotLoggedInError:
+                self._forget_token()
+                if renewed or not self._renew_access_token(access_token):
+                    raise
+                renewed = True
+            except APIError as e:
+                if not self._should_retry(method, e, attempt):
+                    raise
+                attempt += 1
+                time.sleep(self._get_retry_delay(attempt))
+
+    def _renew_access_token(self, access_token):
+        """
+        Renews the access token of this consumer using the OAuth consumer of the connector, after the given token was
+        rejected. Tokens set for the current context are not renewed.
+
+        :param access_token: The rejected access token.
+        :return: Whether a new access token is available.
+        """
+        oauth = self._get_oauth(access_token)
+
+        if oauth is None:
+            return False
+
+        logger.info("Access token rejected, renewing.")
+        if self.access_token == access_token:
+            oauth.renew_access_token()
+            self.access_token = oauth.access_token
+
+        return self.access_token != access_token
+
+    def _iter_call(self, method, *params):
+        """
+        Performs a JSON-RPC call of which the result is a list, and yields the items of the result while the response
+        is being received. Raises an APIError (or subclassed) exception in case of an error.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: A generator yielding the items of the result as Python objects.
+        """
+        payload = self._build_request(method, params)
+        body, headers = self._prepare(payload)
+        started = time.perf_counter() if self.metrics is not None else None
+        received = [0]
+
+        def chunks():
+            for chunk in response.iter_content(chunk_size=self.stream_chunk_size):
+                received[0] += len(chunk)
+                yield chunk
+
+        try:
+            response = self._send(body, headers, stream=True)
+            try:
+                fields = yield from iter_json_array(chunks(), 'result')
+            except ValueError as e:
+                logger.error("Invalid response from server: %s" % str(e))
+                raise TransportError("Invalid response from server: %s" % str(e))
+            finally:
+                response.close()
+        except Exception as e:
+            if self.metrics is not None:
+                self._observe_call(payload, time.perf_counter() - started, 0, received[0], exception=e)
+            if isinstance(e, APIError):
+                raise
+            raise TransportError("Request failed: %s" % str(e)) from e
+
+        if self.metrics is not None:
+            self._observe_call(payload, time.perf_counter() - started, len(body), received[0],
+                               response_json=fields)
+
+        # The result has been streamed already, only check for errors
+        result = self._get_result(dict(fields, result=fields.get('result')))
+
+        if result is not None:
+            yield result
+
+    def iter_activity_stream(self, begin, end, chunk=None):
+        """
+        Retrieves activities like `get_activity_stream`, but yields the activities one by one while they are received
+        instead of returning one list, so memory usage does not grow with the size of the range.
+
+        The range can be split into chunks of at most the given duration, which are requested one after another. In
+        that case the begin and end must be `datetime` objects, which are sent in ISO 8601 format. Activities spanning
+        multiple chunks are yielded once.
 
         :param begin: The minimal end date (inclusive).
         :param end: The maximal begin date (exclusive).
-        :return: An list of dictionaries containing the activity details.
+        :param chunk: (Optional) The maximum duration of a chunk as a `timedelta`. Defaults to a single request.
+        :return: A generator yielding dictionaries (or models) containing the activity details.
         """
-        return self._call('getActivityStream', begin, end)
+        if chunk is None:
+            for activity in self._iter_call('getActivityStream', begin, end):
+                yield self._to_model('getActivityStream', activity)
+            return
 
-    def get_activity_details(self, id):
+        previous_ids = set()
+        chunk_begin = begin
+
+        while chunk_begin < end:
+            chunk_end = min(chunk_begin + chunk, end)
+            chunk_ids = set()
+
+            for activity in self._iter_call('getActivityStream', chunk_begin.isoformat(), chunk_end.isoformat()):
+                chunk_ids.add(activity['id'])
+                if activity['id'] not in previous_ids:
+                    yield self._to_model('getActivityStream', activity)
+
+            previous_ids = chunk_ids
+            chunk_begin = chunk_end
+
+    def get_activity_details_many(self, ids, max_workers=8, timeout=None, batch=False):
         """
-        Retrieves the details of an activity, including its signup options.
+        Retrieves the details of multiple activities, like `get_activity_details`, concurrently.
 
-        The authentication token is used to check if the user is signed up for an activity.
+        Duplicate ids are requested once. Failures are isolated per activity: the result maps each id to either the
+        activity details or the exception raised for that activity.
 
-        For a detailed description of the result, please consult the official API documentation.
+        By default the calls are performed by a pool of worker threads, which share the connection pool and cache of
+        this consumer. Activities for which no result was received within the timeout are mapped to a `TimeoutError`.
+        Alternatively, all calls can be sent as a single JSON-RPC batch request.
 
-        JSON-RPC method: `getActivityDetailed`.
+        :param ids: An iterable of activity ids.
+        :param max_workers: (Optional) The maximum number of concurrent calls.
+        :param timeout: (Optional) The maximum number of seconds to wait for all results. Defaults to no limit.
+        :param batch: (Optional) Whether to send the calls as a single batch request instead.
+        :return: A dictionary mapping the activity ids to their details or to an exception.
+        """
+        ids = list(OrderedDict.fromkeys(ids))
+        results = OrderedDict()
+
+        if not ids:
+            return results
+
+        if batch:
+            activity_batch = self.batch()
+            calls = [(id, activity_batch.get_activity_details(id)) for id in ids]
+            try:
+                activity_batch.send()
+            except Exception as e:
+                return OrderedDict((id, e) for id in ids)
+            for id, call in calls:
+                results[id] = call.exception() or call.result()
+            return results
+
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(ids)))
+        try:
+            futures = dict(
+                (executor.submit(contextvars.copy_context().run, self.get_activity_details, id), id) for id in ids
+            )
+            done, not_done = wait(futures, timeout=timeout)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for id in ids:
+            results[id] = None
+        for future in done:
+            results[futures[future]] = future.exception() or future.result()
+        for future in not_done:
+            results[futures[future]] = TimeoutError("No result received within %s seconds." % timeout)
+
+        return results
+
+    def batch(self):
+        """
+        Returns a batch for combining multiple API calls into a single JSON-RPC batch request.
 
-        :param id: The id of the activity.
-        :return: A dictionary containing the activity details.
+        The batch provides the same endpoint methods as this consumer, but instead of performing the call immediately
+        each method returns a `BatchCall` placeholder. The calls are sent when the batch is used as a context manager
+        and the block exits without an exception, or when `send` is called explicitly::
+
+            with api.batch() as batch:
+                details = [batch.get_activity_details(id) for id in ids]
+            results = [call.result() for call in details]
+
+        :return: The `APIBatch` object.
         """
-        return self._call('getActivityDetailed', id)
+        return APIBatch(self)
 
-    def activity_signup(self, id, price, options):
+
+class BoundAPIConsumer(APIEndpoints):
+    """
+    Consumer for a single user, performing calls through a shared consumer with the access token of the user. Obtain
+    an instance using `APIConsumer.bind` (or `AsyncAPIConsumer.bind`).
+    """
+    __slots__ = ('consumer', 'access_token')
+
+    def __init__(self, consumer, access_token):
         """
-        Marks the user as an attendee to an activity.
+        :param consumer: The shared consumer to perform the calls with.
+        :param access_token: The access token of the user.
+        """
+        self.consumer = consumer
+        self.access_token = access_token
 
-        The calculated costs for the activity are used to check if the user was presented with the right price. The
-        selected options may change the price of the activity.
+    def _call(self, method, *params):
+        """
+        Performs a JSON-RPC call through the shared consumer using the access token of the user.
 
-        The options must be given as an list of dictionaries containing an id (of the option) and appropriate value.
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The result of the call, or an awaitable for the result if the shared consumer is asynchronous.
+        """
+        if inspect.iscoroutinefunction(self.consumer._call):
+            return self._call_async(method, *params)
 
-        JSON-RPC method: `activitySignup`.
+        with using_token(self.access_token):
+            return self.consumer._call(method, *params)
 
-        :param id: The id of the activity.
-        :param price: The calculated costs for the activity.
-        :param options: The selected options for the activity.
+    async def _call_async(self, method, *params):
+        with using_token(self.access_token):
+            return await self.consumer._call(method, *params)
+
+
+class BatchCall(object):
+    """
+    Placeholder for the result of an API call in a batch. The result is available after the batch has been sent.
+    """
+    def __init__(self, method, params, call_id):
         """
-        self._call('activitySignup', id, price, options)
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :param call_id: The identifier of the call within the batch.
+        """
+        self.method = method
+        self.params = params
+        self.call_id = call_id
+        self.done = False
+        self._result = None
+        self._exception = None
+
+    def _set_result(self, result):
+        self._result = result
+        self.done = True
+
+    def _set_exception(self, exception):
+        self._exception = exception
+        self.done = True
+
+    def result(self):
+        """
+        Returns the result of the call. Raises the APIError (or subclassed) exception if the call failed.
 
-    def revoke_activity_signup(self, id):
+        :return: The result of the call as Python objects.
         """
-        Unmarks the current user as an attendee to an activity.
+        if not self.done:
+            raise RuntimeError("The batch containing this call has not been sent yet.")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
 
-        JSON-RPC method: `activityRevokeSignup`.
+    def exception(self):
+        """
+        Returns the exception raised by the call, or `None` if the call succeeded.
 
-        :param id: The id of the activity.
+        :return: The exception object or `None`.
         """
-        self._call('activityRevokeSignup', id)
+        if not self.done:
+            raise RuntimeError("The batch containing this call has not been sent yet.")
+        return self._exception
+
+
+class APIBatch(APIEndpoints):
+    """
+    A JSON-RPC batch of API calls. Obtain an instance using `APIConsumer.batch`.
+
+    The endpoint methods queue the call and return a `BatchCall` placeholder. All queued calls are sent in a single
+    request by `send`.
+    """
+    def __init__(self, consumer):
+        """
+        :param consumer: The `APIConsumer` to send the batch with.
+        """
+        self.consumer = consumer
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.send()
+
+    def __len__(self):
+        return len(self.calls)
+
+    def _call(self, method, *params):
+        """
+        Queues a JSON-RPC call.
+
+        :param method: The API method to call.
+        :param params: The parameters for the method call.
+        :return: The `BatchCall` placeholder for the result.
+        """
+        call = BatchCall(method, params, self.consumer._generate_call_id())
+        self.calls.append(call)
+        return call
+
+    def _build_payload(self):
+        """
+        Takes the queued calls and builds the JSON-RPC batch request for them.
+
+        :return: A tuple of the list of calls and the list of JSON-RPC request objects.
+        """
+        calls, self.calls = self.calls, []
+
+        logger.debug("API batch request: %d calls.", len(calls))
+
+        return calls, [
+            {
+                'method': call.method,
+                'params': call.params,
+                'id': call.call_id,
+            }
+            for call in calls
+        ]
+
+    def _set_results(self, calls, response_json):
+        """
+        Sets the results of the placeholders of the given calls from a JSON-RPC batch response.
+
+        :param calls: The list of calls in the batch.
+        :param response_json: The decoded JSON-RPC batch response.
+        """
+        if not isinstance(response_json, list):
+            # The server rejected the batch as a whole
+            try:
+                self.consumer._get_result(response_json)
+                exception = APIError("Invalid batch response from server.")
+            except APIError as e:
+                exception = e
+            for call in calls:
+                call._set_exception(exception)
+            return
+
+        responses = dict((item.get('id'), item) for item in response_json if isinstance(item, dict))
+
+        for call in calls:
+            if call.call_id not in responses:
+                call._set_exception(APIError("No response from server for call %s." % call.call_id))
+                continue
+            try:
+                result = self.consumer._get_result(responses[call.call_id])
+            except APIError as e:
+                if isinstance(e, NotLoggedInError):
+                    self.consumer._forget_token()
+                call._set_exception(e)
+                continue
+
+            self.consumer._update_cache(call.method, call.params, result)
+            self.consumer._update_token_info(call.method, result)
+            call._set_result(self.consumer._to_model(call.method, result))
+
+    def send(self):
+        """
+        Sends all queued calls in a single request and sets the results of their placeholders. Failures of individual
+        calls are stored in their placeholder and raised by `BatchCall.result`.
+        """
+        if not self.calls:
+            return
+
+        calls, payload = self._build_payload()
+        self._set_results(calls, self.consumer._post(payload))
@@ -0,0 +1,86 @@
+"""
+Circuit breaker for API methods.
+
+After a number of consecutive failures the circuit opens and calls fail fast without contacting the API. After a
+timeout a single trial call is let through; the circuit closes again if it succeeds.
+"""
+import threading
+import time
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker with the closed, open and half-open states. All methods are thread-safe.
+    """
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        """
+        :param name: The name of the protected endpoint, for logging.
+        :param failure_threshold: (Optional) The number of consecutive failures after which the circuit opens.
+        :param reset_timeout: (Optional) The number of seconds after which an open circuit lets a trial call through.
+        :param clock: (Optional) The function returning the current time in seconds.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.closed
+        self.failures = 0
+
+        self._opened = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may be performed. When the reset timeout of an open circuit has passed, a single trial
+        call is allowed.
+
+        :return: Whether the call may be performed.
+        """
+        with self._lock:
+            if self.state == self.closed:
+                return True
+            if self.state == self.open and self.clock() - self._opened >= self.reset_timeout:
+                self.state = self.half_open
+                return True
+            return False
+
+    def record_success(self):
+        """
+        Records a successful call, which closes the circuit.
+        """
+        with self._lock:
+            if self.state != self.closed:
+                logger.info("Circuit for %s closed.", self.name)
+            self.state = self.closed
+            self.failures = 0
+
+    def release(self):
+        """
+        Records a call of which the outcome is unknown, such as a cancelled call or a call which failed before reaching
+        the API. The failures are not counted, but a trial call of a half-open circuit is given up, so that the next
+        call is a trial call again.
+        """
+        with self._lock:
+            if self.state == self.half_open:
+                self.state = self.open
+
+    def record_failure(self):
+        """
+        Records a failed call, which opens the circuit if the threshold is reached or the trial call failed.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.half_open or (self.state == self.closed and self.failures >= self.failure_threshold):
+                if self.state == self.closed:
+                    logger.warning("Circuit for %s opened after %d failures.", self.name, self.failures)
+                self.state = self.open
+                self._opened = self.clock()
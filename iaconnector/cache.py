@@ -0,0 +1,577 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import logging
+
+from iaconnector.codec import default_codec
+
+
+logger = logging.getLogger('iaconnector')
+
+
+_epoch = datetime(1970, 1, 1)
+
+
+class ResponseCache(object):
+    """
+    In-memory cache for API responses with a time to live per entry and least recently used eviction.
+
+    Keys are tuples of the JSON-RPC method name, the encoded parameters and the token scope. A single cache may be
+    shared between consumers. All methods are thread-safe.
+
+    Cached results are returned as-is, so they should be treated as read-only.
+
+    Expired entries can be kept for a while to serve as a fallback when the API is unavailable (see `get_stale`).
+    """
+    def __init__(self, maxsize=1024, clock=time.monotonic, stale_ttl=0):
+        """
+        :param maxsize: (Optional) The maximum number of entries. The least recently used entry is evicted when full.
+        :param clock: (Optional) The function returning the current time in seconds.
+        :param stale_ttl: (Optional) The number of seconds expired entries are kept for `get_stale`.
+        """
+        self.maxsize = maxsize
+        self.clock = clock
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._stale_hits = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """
+        Looks up an entry.
+
+        :param key: The key of the entry.
+        :return: A tuple of a boolean indicating whether the entry was found and the cached value.
+        """
+        method = key[0]
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] <= self.clock():
+                if entry[0] + self.stale_ttl <= self.clock():
+                    del self._entries[key]
+                    self._expirations += 1
+                entry = None
+
+            if entry is None:
+                self._misses[method] = self._misses.get(method, 0) + 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._hits[method] = self._hits.get(method, 0) + 1
+            return True, entry[1]
+
+    def get_stale(self, key):
+        """
+        Looks up an entry, including an expired entry which is still kept as stale entry.
+
+        :param key: The key of the entry.
+        :return: A tuple of a boolean indicating whether the entry was found and the cached value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] + self.stale_ttl <= self.clock():
+                return False, None
+
+            self._stale_hits += 1
+            return True, entry[1]
+
+    def set(self, key, value, ttl):
+        """
+        Stores an entry, replacing any existing entry with the same key.
+
+        :param key: The key of the entry.
+        :param value: The value to cache.
+        :param ttl: The time to live of the entry in seconds.
+        """
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key):
+        """
+        Removes an entry, if it exists.
+
+        :param key: The key of the entry.
+        :return: Whether an entry was removed.
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+            self._invalidations += 1
+            return True
+
+    def invalidate(self, predicate):
+        """
+        Removes all entries for which the predicate holds.
+
+        :param predicate: A function which is called with the key and value of each entry.
+        :return: The number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(key, entry[1])]
+
+            for key in keys:
+                del self._entries[key]
+
+            self._invalidations += len(keys)
+
+        if keys:
+            logger.debug("Cache invalidated {count:d} entries.".format(count=len(keys)))
+
+        return len(keys)
+
+    def invalidate_item(self, id, method, params):
+        """
+        Removes the entries of an object which has changed, such as an activity after a signup: the entries of the
+        given method and parameters for all tokens, and the entries of list results containing an object with its id.
+
+        :param id: The id of the object.
+        :param method: The method of which the result is the object.
+        :param params: The encoded parameters of the call of which the result is the object.
+        :return: The number of removed entries.
+        """
+        def affected(key, value):
+            if key[0] == method:
+                return key[1] == params
+            return isinstance(value, list) and any(isinstance(item, dict) and item.get('id') == id for item in value)
+
+        return self.invalidate(affected)
+
+    def clear(self):
+        """
+        Removes all entries. The statistics are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the statistics of this cache.
+
+        The result contains the total number of `hits`, `misses` and `stale_hits`, the number of entries removed
+        because of `evictions`, `expirations` and `invalidations`, the current `size`, and the hits and misses per
+        method in `methods`.
+
+        :return: A dictionary of statistics.
+        """
+        with self._lock:
+            methods = dict(
+                (method, {'hits': self._hits.get(method, 0), 'misses': self._misses.get(method, 0)})
+                for method in set(self._hits) | set(self._misses)
+            )
+            return {
+                'hits': sum(self._hits.values()),
+                'misses': sum(self._misses.values()),
+                'stale_hits': self._stale_hits,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+                'size': len(self._entries),
+                'methods': methods,
+            }
+
+
+class SQLiteCache(object):
+    """
+    Persistent cache for API responses backed by an SQLite database file, with the same interface as `ResponseCache`.
+
+    The cache survives restarts and can be shared by processes on the same machine, so new workers start with the
+    results cached by others. Entries expire by wall clock time. Expired entries are removed when an entry is stored,
+    and when the cache is full the entries which expire first are evicted, so that looking up entries does not have to
+    write to the database.
+
+    Results are stored as JSON, so a lookup returns a new copy of the result. The ids of the objects in list results
+    are stored in a separate table, so `invalidate_item` does not have to read the results. The statistics are kept per
+    instance.
+    """
+    def __init__(self, path, maxsize=10000, clock=time.time, stale_ttl=0, timeout=30, codec=None):
+        """
+        :param path: The path to the database file. The file is created if it does not exist.
+        :param maxsize: (Optional) The maximum number of entries.
+        :param clock: (Optional) The function returning the current time in seconds, which must be the same for all
+        processes sharing the cache.
+        :param stale_ttl: (Optional) The number of seconds expired entries are kept for `get_stale`.
+        :param timeout: (Optional) The number of seconds to wait for a lock held by another process.
+        :param codec: (Optional) The `JSONCodec` to store the results with.
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.clock = clock
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.codec = codec if codec is not None else default_codec
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._stale_hits = 0
+
+        connection = self._connection()
+        # Write-ahead logging lets processes read while another process writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(method TEXT NOT NULL, params TEXT NOT NULL, token TEXT NOT NULL, value BLOB, expires REAL, "
+            "PRIMARY KEY (method, params, token))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS items "
+            "(method TEXT NOT NULL, params TEXT NOT NULL, token TEXT NOT NULL, item NOT NULL, "
+            "PRIMARY KEY (method, params, token, item))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS items_item ON items (item)")
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN "
+            "DELETE FROM items WHERE method = OLD.method AND params = OLD.params AND token = OLD.token; END"
+        )
+
+    def _connection(self):
+        """
+        Returns the connection of the current thread, as SQLite connections cannot be shared between threads.
+        """
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+        return connection
+
+    @staticmethod
+    def _get_row_key(key):
+        method, params, token = key
+        return method, params, token or ''
+
+    def _count(self, counts, method):
+        with self._lock:
+            counts[method] = counts.get(method, 0) + 1
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Looks up an entry.
+
+        :param key: The key of the entry.
+        :return: A tuple of a boolean indicating whether the entry was found and the cached value.
+        """
+        row = self._connection().execute(
+            "SELECT value FROM responses WHERE method = ? AND params = ? AND token = ? AND expires > ?",
+            self._get_row_key(key) + (self.clock(),),
+        ).fetchone()
+
+        if row is None:
+            self._count(self._misses, key[0])
+            return False, None
+
+        self._count(self._hits, key[0])
+        return True, self.codec.decode(row[0])
+
+    def get_stale(self, key):
+        """
+        Looks up an entry, including an expired entry which is still kept as stale entry.
+
+        :param key: The key of the entry.
+        :return: A tuple of a boolean indicating whether the entry was found and the cached value.
+        """
+        row = self._connection().execute(
+            "SELECT value FROM responses WHERE method = ? AND params = ? AND token = ? AND expires + ? > ?",
+            self._get_row_key(key) + (self.stale_ttl, self.clock()),
+        ).fetchone()
+
+        if row is None:
+            return False, None
+
+        with self._lock:
+            self._stale_hits += 1
+        return True, self.codec.decode(row[0])
+
+    def set(self, key, value, ttl):
+        """
+        Stores an entry, replacing any existing entry with the same key. Entries which are no longer kept are removed,
+        and entries are evicted when the cache is full.
+
+        :param key: The key of the entry.
+        :param value: The value to cache.
+        :param ttl: The time to live of the entry in seconds.
+        """
+        connection = self._connection()
+        row_key = self._get_row_key(key)
+        now = self.clock()
+        items = set(
+            item['id'] for item in value if isinstance(item, dict) and item.get('id') is not None
+        ) if isinstance(value, list) else ()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            expired = connection.execute("DELETE FROM responses WHERE expires + ? <= ?", (self.stale_ttl, now)).rowcount
+            # Replacing a row does not fire the delete trigger
+            connection.execute("DELETE FROM responses WHERE method = ? AND params = ? AND token = ?", row_key)
+            connection.execute(
+                "INSERT INTO responses (method, params, token, value, expires) VALUES (?, ?, ?, ?, ?)",
+                row_key + (self.codec.encode(value), now + ttl),
+            )
+            connection.executemany(
+                "INSERT INTO items (method, params, token, item) VALUES (?, ?, ?, ?)",
+                [row_key + (item,) for item in items],
+            )
+            evicted = connection.execute(
+                "DELETE FROM responses WHERE rowid IN "
+                "(SELECT rowid FROM responses ORDER BY expires LIMIT max(0, (SELECT COUNT(*) FROM responses) - ?))",
+                (self.maxsize,),
+            ).rowcount
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+        with self._lock:
+            self._expirations += expired
+            self._evictions += evicted
+
+    def delete(self, key):
+        """
+        Removes an entry, if it exists.
+
+        :param key: The key of the entry.
+        :return: Whether an entry was removed.
+        """
+        deleted = self._connection().execute(
+            "DELETE FROM responses WHERE method = ? AND params = ? AND token = ?", self._get_row_key(key)
+        ).rowcount
+
+        with self._lock:
+            self._invalidations += deleted
+        return deleted > 0
+
+    def invalidate(self, predicate):
+        """
+        Removes all entries for which the predicate holds. All entries are read, so this is relatively expensive.
+
+        :param predicate: A function which is called with the key and value of each entry.
+        :return: The number of removed entries.
+        """
+        connection = self._connection()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [
+                (method, params, token)
+                for method, params, token, value in connection.execute(
+                    "SELECT method, params, token, value FROM responses"
+                )
+                if predicate((method, params, token or None), self.codec.decode(value))
+            ]
+            connection.executemany("DELETE FROM responses WHERE method = ? AND params = ? AND token = ?", keys)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+        with self._lock:
+            self._invalidations += len(keys)
+
+        if keys:
+            logger.debug("Cache invalidated {count:d} entries.".format(count=len(keys)))
+
+        return len(keys)
+
+    def invalidate_item(self, id, method, params):
+        """
+        Removes the entries of an object which has changed, like `ResponseCache.invalidate_item`. The entries are found
+        using the stored ids, without reading the results.
+
+        :param id: The id of the object.
+        :param method: The method of which the result is the object.
+        :param params: The encoded parameters of the call of which the result is the object.
+        :return: The number of removed entries.
+        """
+        deleted = self._connection().execute(
+            "DELETE FROM responses WHERE (method = ? AND params = ?) OR rowid IN "
+            "(SELECT responses.rowid FROM responses JOIN items USING (method, params, token) WHERE items.item = ?)",
+            (method, params, id),
+        ).rowcount
+
+        with self._lock:
+            self._invalidations += deleted
+
+        if deleted:
+            logger.debug("Cache invalidated {count:d} entries.".format(count=deleted))
+
+        return deleted
+
+    def clear(self):
+        """
+        Removes all entries. The statistics are not reset.
+        """
+        self._connection().execute("DELETE FROM responses")
+
+    def stats(self):
+        """
+        Returns the statistics of this cache instance, like `ResponseCache.stats`. The size is the number of entries in
+        the database.
+
+        :return: A dictionary of statistics.
+        """
+        size = len(self)
+
+        with self._lock:
+            methods = dict(
+                (method, {'hits': self._hits.get(method, 0), 'misses': self._misses.get(method, 0)})
+                for method in set(self._hits) | set(self._misses)
+            )
+            return {
+                'hits': sum(self._hits.values()),
+                'misses': sum(self._misses.values()),
+                'stale_hits': self._stale_hits,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+                'size': size,
+                'methods': methods,
+            }
+
+    def close(self):
+        """
+        Closes the database connection of the current thread. The cache can still be used afterwards.
+        """
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class TokenInfoCache(object):
+    """
+    Cache of the validity and identity of access tokens, so that checking a token and looking up its user can be
+    answered locally on repeated use (for example on every page load of a session).
+
+    A token is known to be valid until it expires (if its expiry is known) or until `revalidate_after` seconds have
+    passed since it was validated, whichever comes first. Consumers forget a token when it is revoked or rejected by the
+    API. Tokens are stored as hashes. All methods are thread-safe.
+    """
+    def __init__(self, revalidate_after=300, maxsize=10000, clock=time.time):
+        """
+        :param revalidate_after: (Optional) The number of seconds after which a token is validated with the API again.
+        :param maxsize: (Optional) The maximum number of tokens. The least recently used token is evicted when full.
+        :param clock: (Optional) The function returning the current (UNIX) time in seconds.
+        """
+        self.revalidate_after = revalidate_after
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @staticmethod
+    def _get_key(access_token):
+        return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+    def _get_entry(self, access_token):
+        """
+        Returns the entry of a token if it is still known to be valid. Must be called while holding the lock.
+        """
+        key = self._get_key(access_token)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        if self.clock() >= entry[0]:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def is_valid(self, access_token):
+        """
+        Returns whether the token is known to be valid.
+
+        :param access_token: The access token.
+        :return: `True` if the token is known to be valid, `False` if it has to be validated with the API.
+        """
+        with self._lock:
+            return self._get_entry(access_token) is not None
+
+    def get_person(self, access_token):
+        """
+        Looks up the person details of a token which is known to be valid.
+
+        :param access_token: The access token.
+        :return: A tuple of a boolean indicating whether the details were found and the details.
+        """
+        with self._lock:
+            entry = self._get_entry(access_token)
+            if entry is None or entry[1] is None:
+                return False, None
+            return True, entry[1]
+
+    def set_valid(self, access_token, expiry=None, person=None):
+        """
+        Records that a token has been validated by the API, keeping person details known already.
+
+        :param access_token: The access token.
+        :param expiry: (Optional) The (UTC) datetime the token expires, if known.
+        :param person: (Optional) The person details of the token.
+        """
+        valid_until = self.clock() + self.revalidate_after
+        if expiry is not None:
+            valid_until = min(valid_until, (expiry - _epoch).total_seconds())
+
+        with self._lock:
+            key = self._get_key(access_token)
+            previous = self._entries.get(key)
+            if person is None and previous is not None:
+                person = previous[1]
+
+            self._entries[key] = (valid_until, person)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, access_token):
+        """
+        Forgets a token, so that it is validated with the API on next use.
+
+        :param access_token: The access token.
+        """
+        with self._lock:
+            if self._entries.pop(self._get_key(access_token), None) is not None:
+                logger.debug("Token forgotten by the token cache.")
+
+    def clear(self):
+        """
+        Forgets all tokens.
+        """
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,76 @@
+"""
+JSON codecs for encoding JSON-RPC requests and decoding responses.
+
+The default codec uses orjson if it is installed, which is considerably faster for large responses such as activity
+streams, and the standard library otherwise. Both codecs decode directly from the raw response bytes.
+"""
+import json
+
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class JSONCodec(object):
+    """
+    Base class for JSON codecs. Subclasses implement `encode` and `decode`.
+    """
+    name = None
+
+    def encode(self, value):
+        """
+        Encodes a value as JSON.
+
+        :param value: The value to encode.
+        :return: The UTF-8 encoded JSON document as bytes.
+        """
+        raise NotImplementedError()
+
+    def decode(self, content):
+        """
+        Decodes a JSON document. Raises a ValueError if the document is invalid.
+
+        :param content: The UTF-8 encoded JSON document as bytes.
+        :return: The decoded value.
+        """
+        raise NotImplementedError()
+
+
+class StdlibCodec(JSONCodec):
+    """
+    Codec using the `json` module of the standard library.
+    """
+    name = 'json'
+
+    def encode(self, value):
+        return json.dumps(value).encode('utf-8')
+
+    def decode(self, content):
+        return json.loads(content)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Codec using orjson. Values which the standard library cannot encode either, such as dates, are encoded by orjson in
+    their ISO 8601 representation.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("The orjson codec requires orjson, install 'iaconnector[fast]'.")
+
+    def encode(self, value):
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, content):
+        return orjson.loads(content)
+
+
+default_codec = OrjsonCodec() if orjson is not None else StdlibCodec()
@@ -0,0 +1,222 @@
+"""
+Columnar export of activity streams for analytics.
+
+Activities are converted in batches to typed columns: Python lists (`iter_column_batches`), NumPy arrays
+(`iter_numpy_batches`) or Arrow record batches (`iter_record_batches`). Only one batch of activities is held at a time,
+so combined with `APIConsumer.iter_activity_stream` the memory usage is bounded by the batch size instead of the size of
+the range::
+
+    activities = api.iter_activity_stream(begin, end, chunk=timedelta(days=30))
+    table = to_arrow_table(activities, columns=['id', 'begin_date', 'price'])
+
+Dates are converted to timestamps with microsecond precision; dates with a UTC offset are converted to UTC. Prices are
+converted to floating point numbers. Missing values are nulls in Arrow, and NaT or NaN in NumPy.
+
+NumPy and pyarrow are optional dependencies, which can be installed using `pip install iaconnector[numpy]` and
+`pip install iaconnector[arrow]` respectively.
+"""
+from datetime import timezone
+from itertools import islice
+
+import logging
+
+from iaconnector.models import parse_datetime
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+logger = logging.getLogger('iaconnector')
+
+
+def _parse_date(value):
+    if value is None:
+        return None
+    value = parse_datetime(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _parse_price(value):
+    return float(value) if value is not None else None
+
+
+# Tuples of the column name, the JSON key, the function converting the values and the type of the columns
+activity_columns = (
+    ('id', 'id', int, 'int'),
+    ('title', 'title', None, 'str'),
+    ('begin_date', 'beginDate', _parse_date, 'datetime'),
+    ('end_date', 'endDate', _parse_date, 'datetime'),
+    ('location', 'location', None, 'str'),
+    ('price', 'price', _parse_price, 'float'),
+    ('signed_up', 'signedUp', bool, 'bool'),
+)
+
+# The NumPy data types of the column types
+_numpy_dtypes = {'int': 'int64', 'str': object, 'datetime': 'datetime64[us]', 'float': 'float64', 'bool': 'bool'}
+
+
+def _require_numpy():
+    """
+    Raises an ImportError if the optional `numpy` dependency is not installed.
+    """
+    if numpy is None:
+        raise ImportError("The NumPy export requires numpy, install 'iaconnector[numpy]'.")
+
+
+def _require_pyarrow():
+    """
+    Raises an ImportError if the optional `pyarrow` dependency is not installed.
+    """
+    if pyarrow is None:
+        raise ImportError("The Arrow export requires pyarrow, install 'iaconnector[arrow]'.")
+
+
+def _get_columns(columns):
+    """
+    Returns the definitions of the given columns, in the given order.
+
+    :param columns: The names of the columns, or `None` for all columns.
+    :return: A list of column definitions from `activity_columns`.
+    """
+    if columns is None:
+        return list(activity_columns)
+
+    definitions = dict((column[0], column) for column in activity_columns)
+    unknown = [name for name in columns if name not in definitions]
+    if unknown:
+        raise ValueError("Unknown columns: %s." % ', '.join(unknown))
+
+    return [definitions[name] for name in columns]
+
+
+def iter_column_batches(activities, batch_size=10000, columns=None):
+    """
+    Converts activities to columns of typed Python values, a batch at a time.
+
+    :param activities: An iterable of activity dictionaries (or models), such as `APIConsumer.iter_activity_stream`.
+    :param batch_size: (Optional) The maximum number of activities in a batch.
+    :param columns: (Optional) The names of the columns to export, from `activity_columns`. Defaults to all columns.
+    :return: A generator yielding dictionaries mapping the column names to lists of values.
+    """
+    definitions = _get_columns(columns)
+    activities = iter(activities)
+
+    while True:
+        batch = list(islice(activities, batch_size))
+        if not batch:
+            return
+
+        result = {}
+        for name, key, convert, type in definitions:
+            values = [activity.get(key) for activity in batch]
+            if convert is not None:
+                values = [convert(value) if value is not None else None for value in values]
+            result[name] = values
+
+        yield result
+
+
+def iter_numpy_batches(activities, batch_size=10000, columns=None):
+    """
+    Converts activities to NumPy arrays, a batch at a time. Missing dates are NaT, missing prices NaN and missing
+    signups false; ids may not be missing.
+
+    :param activities: An iterable of activity dictionaries (or models).
+    :param batch_size: (Optional) The maximum number of activities in a batch.
+    :param columns: (Optional) The names of the columns to export. Defaults to all columns.
+    :return: A generator yielding dictionaries mapping the column names to arrays.
+    """
+    _require_numpy()
+    types = dict((column[0], column[3]) for column in _get_columns(columns))
+
+    for batch in iter_column_batches(activities, batch_size, columns):
+        yield dict(
+            (name, numpy.array(values, dtype=_numpy_dtypes[types[name]]))
+            for name, values in batch.items()
+        )
+
+
+def to_numpy(activities, batch_size=10000, columns=None):
+    """
+    Converts activities to NumPy arrays, one per column. The activities are converted in batches, so only the Python
+    objects of a single batch are held in memory besides the arrays.
+
+    :param activities: An iterable of activity dictionaries (or models).
+    :param batch_size: (Optional) The number of activities converted at a time.
+    :param columns: (Optional) The names of the columns to export. Defaults to all columns.
+    :return: A dictionary mapping the column names to arrays.
+    """
+    _require_numpy()
+    definitions = _get_columns(columns)
+    batches = list(iter_numpy_batches(activities, batch_size, columns))
+
+    return dict(
+        (name, numpy.concatenate([batch[name] for batch in batches]) if batches else
+         numpy.array([], dtype=_numpy_dtypes[type]))
+        for name, key, convert, type in definitions
+    )
+
+
+def arrow_schema(columns=None):
+    """
+    Returns the Arrow schema of the exported columns.
+
+    :param columns: (Optional) The names of the columns. Defaults to all columns.
+    :return: The `pyarrow.Schema`.
+    """
+    _require_pyarrow()
+    types = {
+        'int': pyarrow.int64(),
+        'str': pyarrow.string(),
+        'datetime': pyarrow.timestamp('us'),
+        'float': pyarrow.float64(),
+        'bool': pyarrow.bool_(),
+    }
+
+    return pyarrow.schema([
+        pyarrow.field(name, types[type], nullable=name != 'id')
+        for name, key, convert, type in _get_columns(columns)
+    ])
+
+
+def iter_record_batches(activities, batch_size=10000, columns=None):
+    """
+    Converts activities to Arrow record batches. Missing values are null.
+
+    :param activities: An iterable of activity dictionaries (or models).
+    :param batch_size: (Optional) The maximum number of activities in a record batch.
+    :param columns: (Optional) The names of the columns to export. Defaults to all columns.
+    :return: A generator yielding `pyarrow.RecordBatch` objects.
+    """
+    schema = arrow_schema(columns)
+
+    for batch in iter_column_batches(activities, batch_size, columns):
+        yield pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(batch[field.name], type=field.type) for field in schema],
+            schema=schema,
+        )
+
+
+def to_arrow_table(activities, batch_size=10000, columns=None):
+    """
+    Converts activities to an Arrow table, which consists of a record batch per batch of activities.
+
+    :param activities: An iterable of activity dictionaries (or models).
+    :param batch_size: (Optional) The maximum number of activities in a record batch.
+    :param columns: (Optional) The names of the columns to export. Defaults to all columns.
+    :return: The `pyarrow.Table`.
+    """
+    _require_pyarrow()
+    return pyarrow.Table.from_batches(
+        list(iter_record_batches(activities, batch_size, columns)),
+        schema=arrow_schema(columns),
+    )
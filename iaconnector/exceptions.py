@@ -36,3 +36,11 @@ class SignupError(APIError):
 class OtherError(APIError):
     """Unexpected error."""
     error_code = 500
+
+
+class TransportError(APIError):
+    """The API could not be reached or returned an invalid response."""
+
+
+class CircuitOpenError(TransportError):
+    """The API is considered unavailable after repeated failures; the call was not performed."""
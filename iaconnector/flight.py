@@ -0,0 +1,112 @@
+"""
+Coalescing of identical concurrent calls ("single flight").
+
+When a call is made while an identical call is still in flight, the second caller waits for the outstanding call and
+receives its result or exception instead of performing the call again.
+"""
+import threading
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class _Flight(object):
+    """
+    An outstanding call of a `SingleFlight`.
+    """
+    __slots__ = ('done', 'result', 'exception')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls from multiple threads.
+    """
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, function):
+        """
+        Calls the function, unless a call with the same key is in flight, in which case the result (or exception) of
+        that call is returned (or raised) instead.
+
+        :param key: The hashable key identifying the call.
+        :param function: The function performing the call.
+        :return: The result of the call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            logger.debug("Joining call in flight: %s.", key[0] if isinstance(key, tuple) else key)
+            flight.done.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.result
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+
+class AsyncSingleFlight(object):
+    """
+    Coalesces identical concurrent calls from multiple asyncio tasks.
+
+    The call is performed in a separate task, so cancelling one of the waiting tasks does not cancel the call for the
+    others.
+    """
+    def __init__(self):
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def do(self, key, function):
+        """
+        Awaits the coroutine function, unless a call with the same key is in flight on the same event loop, in which
+        case the result (or exception) of that call is returned (or raised) instead.
+
+        :param key: The hashable key identifying the call.
+        :param function: The coroutine function performing the call.
+        :return: The result of the call.
+        """
+        # Imported here, as importing asyncio is slow and only needed by the asynchronous consumers
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+
+        if task is None or task.get_loop() is not loop:
+            task = self._tasks[key] = loop.create_task(function())
+
+            def discard(task):
+                if self._tasks.get(key) is task:
+                    del self._tasks[key]
+
+            task.add_done_callback(discard)
+        else:
+            logger.debug("Joining call in flight: %s.", key[0] if isinstance(key, tuple) else key)
+
+        return await asyncio.shield(task)
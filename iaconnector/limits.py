@@ -0,0 +1,228 @@
+"""
+Client-side rate limiting and adaptive concurrency control.
+
+A `RateLimiter` combines a token bucket, which bounds the rate of requests, with an adaptive concurrency limit, which
+bounds the number of requests in flight. The concurrency limit follows AIMD (additive increase, multiplicative
+decrease): it grows slowly while requests succeed, and is cut when the server signals overload by errors or by
+latency above a threshold. The limit thereby converges to the capacity of the server.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing `rate` requests per second on average, with bursts of at most `burst` requests.
+    """
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        """
+        :param rate: The number of tokens added per second.
+        :param burst: (Optional) The maximum number of tokens in the bucket. Defaults to the rate (at least 1).
+        :param clock: (Optional) The clock function returning the time in seconds.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token from the bucket. If the bucket is empty, the token is reserved ahead of time.
+
+        :return: The number of seconds the caller has to wait before using the token.
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class _ThreadWaiter(object):
+    __slots__ = ('event',)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter(object):
+    __slots__ = ('loop', 'future')
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _Permit(object):
+    """
+    Permission to perform a request. The caller sets `overloaded` if the response signals that the server is overloaded.
+    """
+    __slots__ = ('overloaded',)
+
+    def __init__(self):
+        self.overloaded = False
+
+
+class RateLimiter(object):
+    """
+    Rate limiter with a token bucket and an AIMD adaptive concurrency limit, which can be used from threads and asyncio
+    tasks at the same time. Waiting requests are admitted in order of arrival.
+
+    Use `permit` (or `permit_async`) around a request. Exceptions raised within count as overload signals.
+    """
+    def __init__(self, rate=None, burst=None, concurrency=10, min_concurrency=1, max_concurrency=100,
+                 latency_threshold=None, backoff=0.5, clock=time.monotonic):
+        """
+        :param rate: (Optional) The maximum average number of requests per second. Defaults to no rate limit.
+        :param burst: (Optional) The maximum number of requests in a burst. Defaults to the rate.
+        :param concurrency: (Optional) The initial concurrency limit.
+        :param min_concurrency: (Optional) The minimum concurrency limit.
+        :param max_concurrency: (Optional) The maximum concurrency limit.
+        :param latency_threshold: (Optional) The latency in seconds above which a request counts as an overload signal.
+        Defaults to only using errors as overload signals.
+        :param backoff: (Optional) The factor by which the concurrency limit is multiplied on overload.
+        :param clock: (Optional) The clock function returning the time in seconds.
+        """
+        self.bucket = TokenBucket(rate, burst, clock=clock) if rate is not None else None
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_threshold = latency_threshold
+        self.backoff = backoff
+        self.clock = clock
+        self.in_flight = 0
+
+        self._waiters = deque()
+        self._decreased = None
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter_class):
+        """
+        Takes a concurrency slot if one is free and no request is waiting, or queues a new waiter otherwise.
+
+        :param waiter_class: The class of the waiter to queue.
+        :return: The queued waiter, or `None` if a slot was taken.
+        """
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return None
+            waiter = waiter_class()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _grant(self):
+        """
+        Hands free concurrency slots to waiting requests. Must be called while holding the lock.
+        """
+        while self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self._waiters.popleft().wake()
+
+    def _release(self, started, overloaded):
+        """
+        Releases a concurrency slot and adapts the concurrency limit to the outcome of the request.
+
+        :param started: The time at which the request started.
+        :param overloaded: Whether the request signalled overload.
+        """
+        now = self.clock()
+        latency = now - started
+
+        if self.latency_threshold is not None and latency > self.latency_threshold:
+            overloaded = True
+
+        with self._lock:
+            self.in_flight -= 1
+
+            if overloaded:
+                # Decrease at most once per round trip, as the requests in flight all observe the same overload
+                if self._decreased is None or now - self._decreased > latency:
+                    self.limit = max(self.min_concurrency, self.limit * self.backoff)
+                    self._decreased = now
+                    logger.debug("Concurrency limit decreased to %d.", int(self.limit))
+            else:
+                # Increases by one when a full window of requests succeeds
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            self._grant()
+
+    @contextmanager
+    def permit(self):
+        """
+        Returns a context manager which waits for permission to perform a request and yields a permit. On exit, the
+        outcome of the request is used to adapt the concurrency limit.
+        """
+        waiter = self._try_acquire(_ThreadWaiter)
+        if waiter is not None:
+            waiter.event.wait()
+
+        permit = _Permit()
+        started = self.clock()
+        try:
+            if self.bucket is not None:
+                time.sleep(self.bucket.reserve())
+            started = self.clock()
+            yield permit
+        except Exception:
+            permit.overloaded = True
+            raise
+        finally:
+            self._release(started, permit.overloaded)
+
+    @asynccontextmanager
+    async def permit_async(self):
+        """
+        Asynchronous version of `permit`, which waits without blocking the event loop.
+        """
+        waiter = self._try_acquire(_AsyncWaiter)
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        raise
+                # The slot was granted already
+                with self._lock:
+                    self.in_flight -= 1
+                    self._grant()
+                raise
+
+        permit = _Permit()
+        started = self.clock()
+        try:
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+            started = self.clock()
+            yield permit
+        except Exception:
+            permit.overloaded = True
+            raise
+        finally:
+            self._release(started, permit.overloaded)
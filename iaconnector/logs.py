@@ -0,0 +1,161 @@
+import zlib
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class _Rendered(object):
+    """
+    Lazily rendered, size-capped and redacted representation of a value, for use as a logging argument. The value is
+    only rendered if the log record is actually emitted.
+    """
+    __slots__ = ('value', 'request_log')
+
+    def __init__(self, value, request_log):
+        self.value = value
+        self.request_log = request_log
+
+    def __str__(self):
+        return self.request_log.render(self.value)
+
+
+class RequestLogger(object):
+    """
+    Logging of API requests and responses which costs (next to) nothing unless enabled.
+
+    Requests and responses are logged to the `iaconnector` logger at DEBUG level by default. Logging can be sampled,
+    in which case both the request and response of a sampled call are logged. Logged values are truncated to
+    `max_length` characters and values of keys in `redact_keys` are replaced. Values are only rendered when a record is
+    emitted, so the cost of a call with logging disabled is a level check.
+    """
+    redact_keys = frozenset(['access_token', 'refresh_token', 'renew_token', 'token', 'password', 'client_secret'])
+
+    # Parameters which are redacted per method, by position
+    redact_params = {
+        'getAuthToken': (1,),
+    }
+
+    # Methods of which the result is redacted
+    redact_results = frozenset(['getAuthToken'])
+
+    def __init__(self, logger=logger, level=logging.DEBUG, sample_rate=1.0, max_length=1000, redact_keys=None):
+        """
+        :param logger: (Optional) The logger to log to. Defaults to the `iaconnector` logger.
+        :param level: (Optional) The level to log at. Defaults to DEBUG.
+        :param sample_rate: (Optional) The fraction of calls to log, between 0 and 1.
+        :param max_length: (Optional) The maximum length of a logged value in characters.
+        :param redact_keys: (Optional) The dictionary keys of which values are redacted, replacing the defaults.
+        """
+        self.logger = logger
+        self.level = level
+        self.sample_rate = sample_rate
+        self.max_length = max_length
+        if redact_keys is not None:
+            self.redact_keys = frozenset(redact_keys)
+
+    def is_enabled(self, call_id):
+        """
+        Returns whether the call with the given identifier is logged. The decision is deterministic per identifier, so
+        the request and response of a call are either both logged or both not logged.
+
+        :param call_id: The JSON-RPC call identifier.
+        :return: Whether the call is logged.
+        """
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        if self.sample_rate >= 1:
+            return True
+        return zlib.crc32(str(call_id).encode('utf-8')) % 10000 < self.sample_rate * 10000
+
+    def log_request(self, call_id, method, params):
+        """
+        Logs a JSON-RPC request, if enabled.
+
+        :param call_id: The JSON-RPC call identifier.
+        :param method: The API method.
+        :param params: The parameters of the method call.
+        """
+        if not self.is_enabled(call_id):
+            return
+
+        if method in self.redact_params:
+            params = [
+                '<redacted>' if index in self.redact_params[method] else param
+                for index, param in enumerate(params)
+            ]
+
+        self.logger.log(self.level, "API request %s: %s%s.", call_id, method, _Rendered(tuple(params), self))
+
+    def log_response(self, call_id, method, response_json):
+        """
+        Logs a JSON-RPC response, if enabled.
+
+        :param call_id: The JSON-RPC call identifier.
+        :param method: The API method, or `batch` for a batch request.
+        :param response_json: The decoded JSON-RPC response.
+        """
+        if not self.is_enabled(call_id):
+            return
+
+        if method in self.redact_results and isinstance(response_json, dict) and 'result' in response_json:
+            response_json = dict(response_json, result='<redacted>')
+
+        self.logger.log(self.level, "API response %s: %s", call_id, _Rendered(response_json, self))
+
+    def render(self, value):
+        """
+        Renders a value for logging, truncated to `max_length` characters and with sensitive values redacted. The cost
+        is proportional to the length of the output, not to the size of the value.
+
+        :param value: The value to render.
+        :return: The rendered value.
+        """
+        parts = []
+        self._render(value, parts, [self.max_length])
+        text = ''.join(parts)
+
+        if len(text) > self.max_length:
+            text = text[:self.max_length] + '...'
+
+        return text
+
+    def _render(self, value, parts, budget):
+        if budget[0] <= 0:
+            return
+
+        if isinstance(value, dict):
+            items = value.items()
+            opening, closing = '{', '}'
+        elif isinstance(value, (list, tuple)):
+            items = value
+            opening, closing = ('[', ']') if isinstance(value, list) else ('(', ')')
+        else:
+            text = repr(value)[:budget[0] + 1]
+            parts.append(text)
+            budget[0] -= len(text)
+            return
+
+        parts.append(opening)
+        budget[0] -= 1
+
+        for index, item in enumerate(items):
+            if budget[0] <= 0:
+                return
+            if index:
+                parts.append(', ')
+                budget[0] -= 2
+            if opening == '{':
+                key, item = item
+                parts.append('%r: ' % (key,))
+                budget[0] -= len(parts[-1])
+                if key in self.redact_keys:
+                    item = '<redacted>'
+            self._render(item, parts, budget)
+
+        parts.append(closing)
+        budget[0] -= 1
+
+
+default_request_log = RequestLogger()
@@ -0,0 +1,239 @@
+import threading
+from bisect import bisect_left
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class MetricsHook(object):
+    """
+    Base class for receiving metrics from the consumers. All methods do nothing by default; subclasses override the
+    methods for the metrics they are interested in.
+
+    Methods are called from the thread performing the call, so implementations must be thread-safe and fast.
+    """
+    def observe_call(self, method, duration, request_size, response_size, error=None):
+        """
+        Called after every JSON-RPC request, including failed requests.
+
+        :param method: The JSON-RPC method name, or `batch` for batch requests.
+        :param duration: The duration of the request in seconds.
+        :param request_size: The size of the request body in bytes.
+        :param response_size: The size of the response body in bytes.
+        :param error: The class name of the exception for the call, if it failed.
+        """
+
+    def observe_token_request(self, endpoint, duration, error=None):
+        """
+        Called after every OAuth token request, including failed requests.
+
+        :param endpoint: The name of the OAuth endpoint, `token` or `refresh`.
+        :param duration: The duration of the request in seconds.
+        :param error: The class name of the exception for the request, if it failed.
+        """
+
+    def observe_retry(self, method):
+        """
+        Called when a JSON-RPC call is retried.
+
+        :param method: The JSON-RPC method name.
+        """
+
+    def observe_cache(self, method, hit):
+        """
+        Called when the cache is consulted for a JSON-RPC call.
+
+        :param method: The JSON-RPC method name.
+        :param hit: Whether the result was found in the cache.
+        """
+
+
+class CallbackMetrics(MetricsHook):
+    """
+    Metrics hook which passes every observation to a callback, as the name of the observation and a dictionary of its
+    arguments. For example: `callback('call', {'method': ..., 'duration': ..., ...})`.
+    """
+    def __init__(self, callback):
+        """
+        :param callback: The function to call for every observation.
+        """
+        self.callback = callback
+
+    def observe_call(self, method, duration, request_size, response_size, error=None):
+        self.callback('call', {
+            'method': method,
+            'duration': duration,
+            'request_size': request_size,
+            'response_size': response_size,
+            'error': error,
+        })
+
+    def observe_token_request(self, endpoint, duration, error=None):
+        self.callback('token_request', {'endpoint': endpoint, 'duration': duration, 'error': error})
+
+    def observe_retry(self, method):
+        self.callback('retry', {'method': method})
+
+    def observe_cache(self, method, hit):
+        self.callback('cache', {'method': method, 'hit': hit})
+
+
+class _Histogram(object):
+    """
+    Cumulative histogram with fixed bucket boundaries.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            lines.append('{name:s}_bucket{{{labels:s}le="{bound!s}"}} {count:d}'.format(
+                name=name,
+                labels=''.join('{:s}="{:s}",'.format(key, _escape(value)) for key, value in labels),
+                bound=bound,
+                count=total,
+            ))
+        lines.append('{name:s}_sum{labels:s} {sum!r}'.format(name=name, labels=_labels(labels), sum=self.sum))
+        lines.append('{name:s}_count{labels:s} {count:d}'.format(name=name, labels=_labels(labels), count=total))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{:s}="{:s}"'.format(key, _escape(value)) for key, value in labels) + '}'
+
+
+class PrometheusMetrics(MetricsHook):
+    """
+    Metrics hook which aggregates the observations and renders them in the Prometheus text exposition format.
+
+    Caches and session pools can be registered to include their statistics. The output of `render` can be served on a
+    metrics endpoint of the application.
+    """
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, prefix='iaconnector', buckets=None):
+        """
+        :param prefix: (Optional) The prefix of the metric names.
+        :param buckets: (Optional) The upper bounds in seconds of the latency histogram buckets.
+        """
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets)) if buckets is not None else self.default_buckets
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._request_bytes = {}
+        self._response_bytes = {}
+        self._errors = {}
+        self._token_durations = {}
+        self._token_errors = {}
+        self._retries = {}
+        self._cache = {}
+        self._caches = []
+        self._pools = []
+
+    def register_cache(self, cache):
+        """
+        Includes the statistics of the given `ResponseCache` in the output.
+        """
+        self._caches.append(cache)
+
+    def register_pool(self, pool):
+        """
+        Includes the number of sessions of the given `SessionPool` in the output.
+        """
+        self._pools.append(pool)
+
+    def _histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(self.buckets)
+        return histogram
+
+    def observe_call(self, method, duration, request_size, response_size, error=None):
+        with self._lock:
+            self._histogram(self._durations, method).observe(duration)
+            self._request_bytes[method] = self._request_bytes.get(method, 0) + request_size
+            self._response_bytes[method] = self._response_bytes.get(method, 0) + response_size
+            if error is not None:
+                self._errors[method, error] = self._errors.get((method, error), 0) + 1
+
+    def observe_token_request(self, endpoint, duration, error=None):
+        with self._lock:
+            self._histogram(self._token_durations, endpoint).observe(duration)
+            if error is not None:
+                self._token_errors[endpoint, error] = self._token_errors.get((endpoint, error), 0) + 1
+
+    def observe_retry(self, method):
+        with self._lock:
+            self._retries[method] = self._retries.get(method, 0) + 1
+
+    def observe_cache(self, method, hit):
+        key = (method, 'hit' if hit else 'miss')
+        with self._lock:
+            self._cache[key] = self._cache.get(key, 0) + 1
+
+    def render(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        :return: The metrics as a string.
+        """
+        lines = []
+
+        def family(name, kind, description, samples):
+            name = '{:s}_{:s}'.format(self.prefix, name)
+            lines.append('# HELP {:s} {:s}'.format(name, description))
+            lines.append('# TYPE {:s} {:s}'.format(name, kind))
+            for labels, value in samples:
+                if kind == 'histogram':
+                    lines.extend(value.render(name, labels))
+                else:
+                    lines.append('{:s}{:s} {!r}'.format(name, _labels(labels), value))
+
+        with self._lock:
+            family('call_duration_seconds', 'histogram', "Duration of JSON-RPC requests.",
+                   [((('method', key),), value) for key, value in sorted(self._durations.items())])
+            family('request_bytes_total', 'counter', "Size of JSON-RPC request bodies.",
+                   [((('method', key),), value) for key, value in sorted(self._request_bytes.items())])
+            family('response_bytes_total', 'counter', "Size of JSON-RPC response bodies.",
+                   [((('method', key),), value) for key, value in sorted(self._response_bytes.items())])
+            family('errors_total', 'counter', "Failed JSON-RPC calls by exception class.",
+                   [((('method', key[0]), ('error', key[1])), value) for key, value in sorted(self._errors.items())])
+            family('retries_total', 'counter', "Retried JSON-RPC calls.",
+                   [((('method', key),), value) for key, value in sorted(self._retries.items())])
+            family('cache_lookups_total', 'counter', "Cache lookups by result.",
+                   [((('method', key[0]), ('result', key[1])), value) for key, value in sorted(self._cache.items())])
+            family('token_request_duration_seconds', 'histogram', "Duration of OAuth token requests.",
+                   [((('endpoint', key),), value) for key, value in sorted(self._token_durations.items())])
+            family('token_errors_total', 'counter', "Failed OAuth token requests by exception class.",
+                   [((('endpoint', key[0]), ('error', key[1])), value)
+                    for key, value in sorted(self._token_errors.items())])
+
+        if self._caches:
+            stats = [cache.stats() for cache in self._caches]
+            family('cache_entries', 'gauge', "Number of entries in registered caches.",
+                   [((('cache', str(index)),), item['size']) for index, item in enumerate(stats)])
+            family('cache_evictions_total', 'counter', "Entries evicted from registered caches.",
+                   [((('cache', str(index)),), item['evictions']) for index, item in enumerate(stats)])
+
+        if self._pools:
+            family('pool_sessions', 'gauge', "Number of shared HTTP sessions in registered session pools.",
+                   [((('pool', str(index)),), len(pool)) for index, pool in enumerate(self._pools)])
+
+        return '\n'.join(lines) + '\n'
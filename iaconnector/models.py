@@ -0,0 +1,290 @@
+"""
+Compact typed models for results of the API.
+
+The models store their fields in slots instead of a dictionary, which makes them considerably smaller than the decoded
+JSON objects and their attributes faster to access. Fields which are costly to convert, such as dates and nested
+objects, keep their value as received and are converted on first access.
+
+The models also support read-only dictionary access by the JSON keys (`activity['beginDate']`), which returns the
+values as received, so code written for the plain results keeps working. Keys which are not known to the model are
+kept as well, and `to_dict` converts a model back to the JSON object.
+"""
+from datetime import datetime
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+def parse_datetime(value):
+    """
+    Parses a date as given by the API (ISO 8601).
+
+    :param value: The date string.
+    :return: The `datetime` object.
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+class LazyField(object):
+    """
+    Descriptor of a model field which is converted on first access. The value as received is stored in the slot with
+    the name of the field prefixed by an underscore, and is replaced by the converted value when it is accessed.
+    """
+    def __init__(self, type, parse, serialize):
+        """
+        :param type: The type of converted values.
+        :param parse: The function converting a value as received.
+        :param serialize: The function converting a converted value back to its JSON representation.
+        """
+        self.type = type
+        self.parse = parse
+        self.serialize = serialize
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.slot = '_' + name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        try:
+            value = getattr(instance, self.slot)
+        except AttributeError:
+            return None
+
+        if value is not None and not isinstance(value, self.type):
+            value = self.parse(value)
+            setattr(instance, self.slot, value)
+
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
+
+    def to_json(self, value):
+        """
+        Returns the JSON representation of a stored value, which may or may not have been converted yet.
+
+        :param value: The stored value.
+        :return: The JSON representation.
+        """
+        if value is not None and isinstance(value, self.type):
+            return self.serialize(value)
+        return value
+
+
+def datetime_field():
+    """
+    Returns a field of a date, which is converted to a `datetime` object.
+    """
+    return LazyField(datetime, parse_datetime, datetime.isoformat)
+
+
+def model_list_field(model):
+    """
+    Returns a field of a list of nested objects, which is converted to a tuple of models.
+
+    :param model: The model class of the nested objects.
+    """
+    return LazyField(
+        tuple,
+        lambda items: tuple(model.from_dict(item) for item in items),
+        lambda items: [item.to_dict() for item in items],
+    )
+
+
+class Model(object):
+    """
+    Base class of the models.
+
+    Subclasses list their fields in `fields` as tuples of the attribute name and the JSON key. Every field needs a slot:
+    plain fields are stored in the slot with the attribute name, fields which are a `LazyField` in the slot with the
+    prefixed name. Fields which are missing from the JSON object are `None`.
+    """
+    __slots__ = ('_extra',)
+
+    # Tuples of the attribute names and JSON keys of the fields
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super(Model, cls).__init_subclass__(**kwargs)
+
+        # Tuples of the slot, the JSON key and the lazy field (or None) of the fields
+        cls._layout = tuple(
+            (field.slot, key, field) if isinstance(field, LazyField) else (name, key, None)
+            for name, key, field in ((name, key, cls.__dict__.get(name)) for name, key in cls.fields)
+        )
+        cls._slots = dict((key, slot) for slot, key, field in cls._layout)
+        cls._keys = dict((key, (slot, field)) for slot, key, field in cls._layout)
+        cls._names = frozenset(name for name, key in cls.fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a model from a decoded JSON object. Lazy fields are not converted yet.
+
+        :param data: The dictionary.
+        :return: The model instance.
+        """
+        instance = cls.__new__(cls)
+        slots = cls._slots
+        extra = None
+
+        for key, value in data.items():
+            slot = slots.get(key)
+            if slot is not None:
+                setattr(instance, slot, value)
+            elif extra is None:
+                extra = {key: value}
+            else:
+                extra[key] = value
+
+        instance._extra = extra
+        return instance
+
+    @classmethod
+    def from_list(cls, items):
+        """
+        Creates models from a list of decoded JSON objects.
+
+        :param items: The list of dictionaries.
+        :return: The list of model instances.
+        """
+        from_dict = cls.from_dict
+        return [from_dict(item) for item in items]
+
+    def __getattr__(self, name):
+        # Only called for fields which were missing from the JSON object
+        if name in self._names:
+            return None
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def _get_json(self, slot, field):
+        value = object.__getattribute__(self, slot)
+        return field.to_json(value) if field is not None else value
+
+    def to_dict(self):
+        """
+        Converts the model back to a dictionary like the decoded JSON object, including the keys unknown to the model.
+
+        :return: The dictionary.
+        """
+        result = {}
+
+        for slot, key, field in self._layout:
+            try:
+                result[key] = self._get_json(slot, field)
+            except AttributeError:
+                pass
+
+        if self._extra:
+            result.update(self._extra)
+
+        return result
+
+    def __getitem__(self, key):
+        entry = self._keys.get(key)
+
+        if entry is None:
+            if self._extra is None:
+                raise KeyError(key)
+            return self._extra[key]
+
+        try:
+            return self._get_json(*entry)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, Model):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        other = self.from_dict(state)
+        for slot in ('_extra',) + tuple(slot for slot, key, field in self._layout):
+            try:
+                setattr(self, slot, object.__getattribute__(other, slot))
+            except AttributeError:
+                pass
+
+    def __repr__(self):
+        return "<{cls:s}: {id}>".format(cls=type(self).__name__, id=self.get('id'))
+
+
+class ActivityOption(Model):
+    """
+    A signup option of an activity.
+    """
+    __slots__ = ('id', 'name', 'type', 'price')
+
+    fields = (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('type', 'type'),
+        ('price', 'price'),
+    )
+
+
+class Activity(Model):
+    """
+    An activity, as returned by the activity stream and the activity details.
+
+    The begin and end date are converted to `datetime` objects and the signup options to a tuple of `ActivityOption`
+    models on first access. The price is kept as received, so it can be passed to `activity_signup` as-is.
+    """
+    __slots__ = ('id', 'title', 'description', '_begin_date', '_end_date', 'location', 'price', 'signed_up',
+                 '_options')
+
+    begin_date = datetime_field()
+    end_date = datetime_field()
+    options = model_list_field(ActivityOption)
+
+    fields = (
+        ('id', 'id'),
+        ('title', 'title'),
+        ('description', 'description'),
+        ('begin_date', 'beginDate'),
+        ('end_date', 'endDate'),
+        ('location', 'location'),
+        ('price', 'price'),
+        ('signed_up', 'signedUp'),
+        ('options', 'options'),
+    )
+
+
+class Person(Model):
+    """
+    The details of a person. Details other than the id and name are available by their JSON key.
+    """
+    __slots__ = ('id', 'name')
+
+    fields = (
+        ('id', 'id'),
+        ('name', 'name'),
+    )
@@ -1,8 +1,16 @@
+import threading
+import time
+from base64 import b64encode
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import logging
+from oauthlib.common import urldecode
+from oauthlib.oauth2 import InsecureTransportError, is_secure_transport
 from requests_oauthlib import OAuth2Session
 
+from iaconnector.transport import DEFAULT_TIMEOUT, TransportAdapter
+
 
 logger = logging.getLogger('iaconnector')
 
@@ -20,8 +28,12 @@ class OAuthConsumer(object):
         'refresh': 'token/',
     }
 
+    # Seconds to wait before retrying a failed background refresh
+    refresh_retry_interval = 30
+
     def __init__(self, client_id, client_secret, redirect_uri, scope, access_token=None, renew_token=None,
-                 base_url=None, connector=None):
+                 base_url=None, connector=None, token_expiry=None, auto_refresh=False, refresh_margin=60,
+                 token_store=None, token_key=None, metrics=None, transport=None, timeout=DEFAULT_TIMEOUT):
         """
         Creates a new OAuth consumer.
 
@@ -30,17 +42,41 @@ class OAuthConsumer(object):
         :param redirect_uri: The URI to which the server redirects. This URI must be registered with the application.
         :param scope: The permission scope to request.
         :param access_token: (Optional) The current access token, if known.
+        :param renew_token: (Optional) The current renew token, if known.
         :param base_url: (Optional) The base URL for the OAuth implementation. This is by default the (production)
         Inter-Actief web site (`https://www.inter-actief.utwente.nl/o/`).
+        :param connector: (Optional) The `IAConnector` instance this consumer is used with.
+        :param token_expiry: (Optional) The (UTC) datetime the current access token expires, if known.
+        :param auto_refresh: (Optional) Whether to renew the access token in the background before it expires.
+        :param refresh_margin: (Optional) The number of seconds before expiry at which the access token is renewed.
+        :param token_store: (Optional) The `TokenStore` to share tokens with other consumers and processes. Stored
+        tokens take precedence over the given tokens.
+        :param token_key: (Optional) The key of the tokens of the user in the token store, such as the user's id.
+        Required when a token store is given, as the tokens of every user need their own key.
+        :param metrics: (Optional) The `MetricsHook` to report metrics of the token requests to.
+        :param transport: (Optional) The `Transport` to perform the token requests with, for example to record or
+        replay them. Only applies to the synchronous token requests. Defaults to a regular `requests` session.
+        :param timeout: (Optional) The timeout in seconds of a token request, as a number or a tuple of the connect and
+        read timeout. `None` disables the timeout. Does not apply to requests performed by a given transport.
         """
+        if token_store is not None and token_key is None:
+            raise ValueError("A token store requires the key of the tokens of the user.")
+
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.scope = scope
         self.access_token = access_token
         self.renew_token = renew_token
-        self.token_expiry = None
+        self.token_expiry = token_expiry
         self.connector = connector
+        self.auto_refresh = auto_refresh
+        self.refresh_margin = refresh_margin
+        self.token_store = token_store
+        self.token_key = token_key
+        self.metrics = metrics
+        self.transport = transport
+        self.timeout = timeout
 
         if base_url is not None:
             if base_url[-1:] != '/':
@@ -48,12 +84,20 @@ class OAuthConsumer(object):
             self.base_url = base_url
 
         self._session = None
+        self._refresh_lock = threading.Lock()
+        self._async_refresh_lock = None
+        self._refresh_timer = None
 
         logger.debug("OAuth initialized at {url:s} with client id {client:s}.".format(
             url=self.base_url,
             client=self.client_id,
         ))
 
+        if self.token_store is not None:
+            self.load_tokens()
+
+        self._schedule_refresh()
+
     def _get_session(self):
         """
         Returns the OAuth session object and creates a new one if necessary.
@@ -66,6 +110,10 @@ class OAuthConsumer(object):
                 scope=self.scope,
                 redirect_uri=self.redirect_uri,
             )
+            if self.transport is not None:
+                adapter = TransportAdapter(self.transport)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
         return self._session
 
     def _get_url(self, endpoint):
@@ -98,16 +146,16 @@ class OAuthConsumer(object):
         :param authorization_response: The full URL to which the Inter-Actief site redirected the user after
         authorizing.
         """
-        logger.debug("Fetching access token for response {url:s}.".format(url=authorization_response))
-        response = self._get_session().fetch_token(
-            token_url=self._get_url('token'),
-            authorization_response=authorization_response,
-            client_secret=self.client_secret,
-            client_id=self.client_id,
-        )
-        self.access_token = response['access_token']
-        self.renew_token = response['refresh_token']
-        self.token_expiry = datetime.utcnow() + timedelta(seconds=response['expires_in'])
+        logger.debug("Fetching access token.")
+        with self._observe_token_request('token'):
+            response = self._get_session().fetch_token(
+                token_url=self._get_url('token'),
+                authorization_response=authorization_response,
+                client_secret=self.client_secret,
+                client_id=self.client_id,
+                timeout=self.timeout,
+            )
+        self._set_tokens(response)
         self._propagate_tokens()
 
     def renew_access_token(self):
@@ -115,24 +163,203 @@ class OAuthConsumer(object):
         Retrieves a new access token for the authorized user. This can be used when a token has expired.
 
         Afterwards the access token and renew token can be read using their respective methods.
+
+        Concurrent calls share a single request: callers which have to wait for a renewal in progress do not renew the
+        token again. If a token store is used, this also holds for consumers in other processes using the same store.
         """
-        logger.debug("Renewing access token, old token {token:s}.".format(token=self.access_token))
-        response = self._get_session().refresh_token(
-            self._get_url('refresh'),
-            refresh_token=self.renew_token,
+        token = self.access_token
+
+        with self._refresh_lock:
+            if self.access_token != token:
+                logger.debug("Access token was renewed while waiting.")
+                return
+
+            if self.token_store is None:
+                self._renew_access_token()
+                return
+
+            with self.token_store.lock(self.token_key):
+                if self.load_tokens() and self.access_token != token and not self._needs_refresh():
+                    logger.debug("Access token was renewed by another consumer.")
+                    return
+                self._renew_access_token()
+
+    def _renew_access_token(self):
+        """
+        Retrieves a new access token using the renew token.
+        """
+        logger.debug("Renewing access token.")
+        with self._observe_token_request('refresh'):
+            response = self._get_session().refresh_token(
+                self._get_url('refresh'),
+                refresh_token=self.renew_token,
+                client_secret=self.client_secret,
+                client_id=self.client_id,
+                timeout=self.timeout,
+            )
+        self._set_tokens(response)
+        self._propagate_tokens()
+
+    @contextmanager
+    def _observe_token_request(self, endpoint):
+        """
+        Returns a context manager measuring a token request and reporting it to the metrics hook, if any.
+
+        :param endpoint: The name of the OAuth endpoint.
+        """
+        if self.metrics is None:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.metrics.observe_token_request(endpoint, time.perf_counter() - started, type(e).__name__)
+            raise
+        self.metrics.observe_token_request(endpoint, time.perf_counter() - started)
+
+    async def _post_token_request(self, endpoint, body, client_auth=False):
+        """
+        Sends a token request to the given OAuth endpoint without blocking the event loop and parses the response.
+
+        :param endpoint: The name of the OAuth endpoint.
+        :param body: The url-encoded request body.
+        :param client_auth: (Optional) Whether to authenticate with the client credentials using basic authentication.
+        :return: The token dictionary.
+        """
+        from iaconnector.aio import _client_timeout, _require_aiohttp
+        _require_aiohttp()
+        import aiohttp
+
+        url = self._get_url(endpoint)
+        if not is_secure_transport(url):
+            raise InsecureTransportError()
+
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
+        }
+
+        if client_auth:
+            credentials = '{:s}:{:s}'.format(self.client_id, self.client_secret or '').encode('utf-8')
+            headers['Authorization'] = 'Basic ' + b64encode(credentials).decode('ascii')
+
+        async with aiohttp.ClientSession(timeout=_client_timeout(self.timeout)) as session:
+            async with session.post(url, data=dict(urldecode(body)), headers=headers) as response:
+                text = await response.text()
+
+        return self._get_session()._client.parse_request_body_response(text, scope=self.scope)
+
+    async def fetch_access_token_async(self, authorization_response):
+        """
+        Asynchronous version of `fetch_access_token`, for use with asyncio.
+
+        :param authorization_response: The full URL to which the Inter-Actief site redirected the user after
+        authorizing.
+        """
+        logger.debug("Fetching access token.")
+        session = self._get_session()
+        session._client.parse_request_uri_response(authorization_response, state=session._state)
+        body = session._client.prepare_request_body(
+            code=session._client.code,
+            redirect_uri=self.redirect_uri,
             client_secret=self.client_secret,
             client_id=self.client_id,
         )
-        self.access_token = response['access_token']
-        self.renew_token = response['refresh_token']
+        with self._observe_token_request('token'):
+            response = await self._post_token_request('token', body, client_auth=True)
+        self._set_tokens(response)
         self._propagate_tokens()
 
+    def _get_async_refresh_lock(self):
+        """
+        Returns the lock serialising asynchronous renewals, which is created for the running event loop.
+
+        :return: The `asyncio.Lock`.
+        """
+        # Imported here, as importing asyncio is slow and only needed by the asynchronous methods
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if self._async_refresh_lock is None or self._async_refresh_lock[0] is not loop:
+            self._async_refresh_lock = (loop, asyncio.Lock())
+        return self._async_refresh_lock[1]
+
+    async def renew_access_token_async(self):
+        """
+        Asynchronous version of `renew_access_token`, for use with asyncio.
+
+        Concurrent calls share a single request, like those of `renew_access_token`. If a token store is used, its lock
+        is held by a worker thread while the request is sent from the event loop.
+        """
+        import asyncio
+
+        token = self.access_token
+
+        async with self._get_async_refresh_lock():
+            if self.access_token != token:
+                logger.debug("Access token was renewed while waiting.")
+                return
+
+            if self.token_store is None:
+                self._set_tokens(await self._request_renewal_async())
+                self._propagate_tokens()
+                return
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._renew_access_token_locked, token, loop)
+
+    def _renew_access_token_locked(self, token, loop):
+        """
+        Renews the access token while holding the lock of the token store, unless another consumer renewed it already.
+        Called from a worker thread; the request is sent from the event loop.
+
+        :param token: The access token which was to be renewed.
+        :param loop: The event loop to send the request from.
+        """
+        import asyncio
+
+        with self.token_store.lock(self.token_key):
+            if self.load_tokens() and self.access_token != token and not self._needs_refresh():
+                logger.debug("Access token was renewed by another consumer.")
+                return
+            response = asyncio.run_coroutine_threadsafe(self._request_renewal_async(), loop).result()
+            self._set_tokens(response)
+        self._propagate_tokens()
+
+    async def _request_renewal_async(self):
+        """
+        Requests a new access token using the renew token without blocking the event loop.
+
+        :return: The token dictionary.
+        """
+        logger.debug("Renewing access token.")
+        body = self._get_session()._client.prepare_refresh_body(
+            refresh_token=self.renew_token,
+            scope=self.scope,
+            client_secret=self.client_secret,
+            client_id=self.client_id,
+        )
+        with self._observe_token_request('refresh'):
+            response = await self._post_token_request('refresh', body)
+        response.setdefault('refresh_token', self.renew_token)
+        return response
+
     def get_access_token(self):
         """
         Returns the access token for the current session. Throws an exception if there is no access token present.
 
+        If the token is about to expire, a newer token is read from the token store (if any). If automatic renewal is
+        enabled and the token is still about to expire, the token is renewed first. Callers arriving during a renewal
+        wait for it to complete.
+
         :return: The access token.
         """
+        if self.token_store is not None and self._needs_refresh():
+            self.load_tokens()
+        if self.auto_refresh and self.renew_token is not None and self._needs_refresh():
+            self.renew_access_token()
         if self.access_token is None:
             raise ValueError("There is no access token present. Request a token using fetch_access_token.")
         return self.access_token
@@ -155,6 +382,99 @@ class OAuthConsumer(object):
         """
         return self.token_expiry
 
+    def _set_tokens(self, response):
+        """
+        Stores the tokens and their expiry from a token response and schedules their renewal, if enabled.
+
+        :param response: The token dictionary returned by the token endpoint.
+        """
+        self.access_token = response['access_token']
+        self.renew_token = response['refresh_token']
+
+        if response.get('expires_in') is not None:
+            self.token_expiry = datetime.utcnow() + timedelta(seconds=int(response['expires_in']))
+
+        if self.token_store is not None:
+            self.token_store.save(self.token_key, {
+                'access_token': self.access_token,
+                'renew_token': self.renew_token,
+                'token_expiry': self.token_expiry,
+            })
+
+        self._schedule_refresh()
+
+    def load_tokens(self):
+        """
+        Reads the tokens from the token store, if they differ from the current tokens. Tokens read from the store are
+        propagated to the connector.
+
+        :return: Whether the tokens were read from the store.
+        """
+        if self.token_store is None:
+            return False
+
+        tokens = self.token_store.load(self.token_key)
+
+        if tokens is None or (tokens['access_token'], tokens['renew_token']) == (self.access_token, self.renew_token):
+            return False
+
+        self.access_token = tokens['access_token']
+        self.renew_token = tokens['renew_token']
+        self.token_expiry = tokens['token_expiry']
+        self._propagate_tokens()
+        self._schedule_refresh()
+        return True
+
+    def _needs_refresh(self):
+        """
+        Returns whether the access token expires within the refresh margin.
+
+        :return: Whether the access token should be renewed.
+        """
+        if self.token_expiry is None:
+            return False
+        return self.token_expiry - timedelta(seconds=self.refresh_margin) <= datetime.utcnow()
+
+    def _schedule_refresh(self, delay=None):
+        """
+        Schedules the background renewal of the access token, replacing any previously scheduled renewal. Does nothing
+        if automatic renewal is disabled or the expiry of the token is unknown.
+
+        :param delay: (Optional) The number of seconds to wait. Defaults to the time until the refresh margin.
+        """
+        if not self.auto_refresh or self.renew_token is None or self.token_expiry is None:
+            return
+
+        if delay is None:
+            refresh_at = self.token_expiry - timedelta(seconds=self.refresh_margin)
+            delay = max((refresh_at - datetime.utcnow()).total_seconds(), 0)
+
+        self.stop_auto_refresh()
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+        logger.debug("Access token renewal scheduled in {delay:.0f} seconds.".format(delay=delay))
+
+    def _background_refresh(self):
+        """
+        Renews the access token from the background timer. Failures are logged and retried later.
+        """
+        self._refresh_timer = None
+        try:
+            self.renew_access_token()
+        except Exception:
+            logger.exception("Background renewal of the access token failed.")
+            self._schedule_refresh(delay=self.refresh_retry_interval)
+
+    def stop_auto_refresh(self):
+        """
+        Cancels the scheduled background renewal of the access token, if any.
+        """
+        timer, self._refresh_timer = self._refresh_timer, None
+        if timer is not None:
+            timer.cancel()
+
     def _propagate_tokens(self):
         """
         Propagates the access_token and renew_token to the connector.
@@ -0,0 +1,98 @@
+import threading
+
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger('iaconnector')
+
+
+class SessionPool(object):
+    """
+    Registry of long-lived, pooled HTTP sessions.
+
+    Sessions are shared between all consumers targeting the same base URL with the same pool settings, so that
+    connections (and their TLS handshakes) are reused across consumers. Sessions are reference counted and closed when
+    the last consumer releases them.
+
+    All methods are thread-safe.
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _create_session(pool_connections, pool_maxsize, pool_block):
+        """
+        Creates a new session with a connection pool of the given size.
+
+        :param pool_connections: The number of per-host connection pools to cache.
+        :param pool_maxsize: The maximum number of connections to keep per host.
+        :param pool_block: Whether to block when all connections to a host are in use instead of opening a new one.
+        :return: The session object.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def acquire(self, base_url, pool_connections=10, pool_maxsize=10, pool_block=False):
+        """
+        Returns the shared session for the given base URL and pool settings and creates a new one if necessary.
+
+        Every call must be balanced by a call to `release` with the same arguments.
+
+        :param base_url: The base URL the session is used for.
+        :param pool_connections: (Optional) The number of per-host connection pools to cache.
+        :param pool_maxsize: (Optional) The maximum number of connections to keep per host.
+        :param pool_block: (Optional) Whether to block when all connections to a host are in use.
+        :return: The session object.
+        """
+        key = (base_url, pool_connections, pool_maxsize, pool_block)
+
+        with self._lock:
+            entry = self._sessions.get(key)
+
+            if entry is None:
+                entry = self._sessions[key] = [self._create_session(pool_connections, pool_maxsize, pool_block), 0]
+                logger.debug("Session created for {url:s}.".format(url=base_url))
+
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, base_url, pool_connections=10, pool_maxsize=10, pool_block=False):
+        """
+        Releases a session obtained using `acquire`. The session is closed when it is no longer used.
+
+        :param base_url: The base URL the session is used for.
+        :param pool_connections: (Optional) The number of per-host connection pools to cache.
+        :param pool_maxsize: (Optional) The maximum number of connections to keep per host.
+        :param pool_block: (Optional) Whether to block when all connections to a host are in use.
+        """
+        key = (base_url, pool_connections, pool_maxsize, pool_block)
+
+        with self._lock:
+            entry = self._sessions.get(key)
+
+            if entry is None:
+                return
+
+            entry[1] -= 1
+
+            if entry[1] <= 0:
+                del self._sessions[key]
+                entry[0].close()
+                logger.debug("Session closed for {url:s}.".format(url=base_url))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+default_pool = SessionPool()
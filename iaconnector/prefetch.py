@@ -0,0 +1,211 @@
+"""
+Background prefetching of activity details.
+
+After an activity stream has been fetched, the details of the first upcoming activities are likely to be requested
+next. A `DetailPrefetcher` requests them in the background, so that they are in the cache of the consumer by then. A
+detail call made while the prefetch of the same activity is in flight joins that call.
+
+Prefetching yields to other calls: it uses at most a fraction of the concurrency limit of the rate limiter of the
+method, stops while its circuit is open, and pauses after the API has been unavailable.
+"""
+import contextvars
+import itertools
+import queue
+import threading
+import time
+
+import logging
+
+from iaconnector.exceptions import APIError
+from iaconnector.models import parse_datetime
+
+
+logger = logging.getLogger('iaconnector')
+
+
+def _timestamp(value):
+    """
+    Returns the UNIX timestamp of a date as given by the API, or `None` if it is missing or invalid.
+    """
+    try:
+        return parse_datetime(value).timestamp()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class DetailPrefetcher(object):
+    """
+    Prefetches the details of upcoming activities of fetched activity streams in the background, in order of their
+    begin date, using a fixed number of worker threads. Use it by passing it as `prefetcher` to an `APIConsumer` with a
+    cache; a prefetcher can be shared by consumers.
+    """
+    method = 'getActivityDetailed'
+
+    def __init__(self, count=5, max_workers=2, utilization=0.5, backoff=1.0, backoff_max=30.0, clock=time.time):
+        """
+        :param count: (Optional) The number of upcoming activities of a stream of which the details are prefetched.
+        :param max_workers: (Optional) The maximum number of concurrent prefetches.
+        :param utilization: (Optional) The fraction of the concurrency limit of the rate limiter of the method above
+        which prefetching waits.
+        :param backoff: (Optional) The number of seconds to wait when the rate limiter is busy, and after the first
+        prefetch which failed because the API was unavailable. The latter doubles with every consecutive failure.
+        :param backoff_max: (Optional) The maximum number of seconds to wait after failures.
+        :param clock: (Optional) The function returning the current (UNIX) time in seconds, to determine which
+        activities are upcoming.
+        """
+        self.count = count
+        self.max_workers = max_workers
+        self.utilization = utilization
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.clock = clock
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._pending = set()
+        self._workers = []
+        self._failures = 0
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'scheduled': 0, 'prefetched': 0, 'failed': 0, 'dropped': 0}
+
+    def schedule(self, consumer, activities):
+        """
+        Schedules prefetching the details of the first upcoming activities of a stream. Activities which have ended
+        already and activities of which the details are scheduled already are skipped.
+
+        The details are fetched with the access token of the current context.
+
+        :param consumer: The `APIConsumer` which fetched the stream.
+        :param activities: The list of activity dictionaries of the stream.
+        """
+        if self._closed.is_set():
+            return
+
+        now = self.clock()
+        upcoming = []
+
+        for activity in activities:
+            if not isinstance(activity, dict) or activity.get('id') is None:
+                continue
+            begin = _timestamp(activity.get('beginDate'))
+            end = _timestamp(activity.get('endDate'))
+            if begin is None or (end is not None and end < now):
+                continue
+            upcoming.append((begin, activity['id']))
+
+        upcoming.sort(key=lambda item: item[0])
+
+        with self._lock:
+            for begin, id in upcoming[:self.count]:
+                key = consumer._get_cache_key(self.method, (id,))
+                if key in self._pending:
+                    continue
+                self._pending.add(key)
+                # A context can only be entered by one thread at a time, so every prefetch gets its own copy
+                self._queue.put((begin, next(self._sequence), consumer, id, key, contextvars.copy_context()))
+                self._stats['scheduled'] += 1
+
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            if len(self._workers) < self.max_workers and self._queue.qsize() > len(self._workers):
+                worker = threading.Thread(target=self._work, name='iaconnector-prefetch', daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item[2] is None:
+                    return
+                begin, sequence, consumer, id, key, context = item
+                try:
+                    self._prefetch(consumer, id, context)
+                except Exception:
+                    logger.exception("Prefetching details of activity %s failed.", id)
+                    with self._lock:
+                        self._stats['failed'] += 1
+                finally:
+                    with self._lock:
+                        self._pending.discard(key)
+            finally:
+                self._queue.task_done()
+
+    def _wait_for_capacity(self, consumer):
+        """
+        Waits while the API is under pressure.
+
+        :param consumer: The `APIConsumer` to prefetch with.
+        :return: Whether the prefetch may proceed.
+        """
+        breaker = consumer._get_breaker(self.method)
+        if breaker is not None and breaker.state != breaker.closed:
+            return False
+
+        if self._failures:
+            if self._closed.wait(min(self.backoff_max, self.backoff * 2 ** (self._failures - 1))):
+                return False
+
+        limiter = consumer._get_limiter({'method': self.method})
+        while limiter is not None and limiter.in_flight >= max(1, int(limiter.limit * self.utilization)):
+            if self._closed.wait(self.backoff):
+                return False
+
+        return not self._closed.is_set()
+
+    def _prefetch(self, consumer, id, context):
+        """
+        Fetches the details of an activity into the cache of the consumer, unless the API is under pressure.
+
+        :param consumer: The `APIConsumer` to fetch the details with.
+        :param id: The activity id.
+        :param context: The context to perform the call in.
+        """
+        if not self._wait_for_capacity(consumer):
+            with self._lock:
+                self._stats['dropped'] += 1
+            return
+
+        try:
+            context.run(consumer.get_activity_details, id)
+        except APIError as e:
+            logger.debug("Prefetching details of activity %s failed: %s", id, e)
+            with self._lock:
+                self._stats['failed'] += 1
+                if consumer._is_unavailable(e):
+                    self._failures += 1
+            return
+
+        with self._lock:
+            self._stats['prefetched'] += 1
+            self._failures = 0
+
+    def join(self):
+        """
+        Waits until all scheduled prefetches are done.
+        """
+        self._queue.join()
+
+    def stats(self):
+        """
+        Returns the numbers of `scheduled`, `prefetched` and `failed` prefetches, and of prefetches `dropped` because
+        the API was under pressure or the prefetcher was closed.
+
+        :return: A dictionary of statistics.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        """
+        Stops the worker threads. Scheduled prefetches which have not started yet are dropped.
+        """
+        self._closed.set()
+
+        with self._lock:
+            workers, self._workers = self._workers, []
+
+        for worker in workers:
+            self._queue.put((float('inf'), next(self._sequence), None, None, None, None))
+        for worker in workers:
+            worker.join()
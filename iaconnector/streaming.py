@@ -0,0 +1,137 @@
+import codecs
+import json
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+_delimiters = ',:]}' + _whitespace
+
+
+class _Buffer(object):
+    """
+    Text buffer over an iterator of encoded chunks, which is consumed from the front.
+    """
+    compact_size = 65536
+
+    def __init__(self, chunks, encoding='utf-8'):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.text = ''
+        self.position = 0
+        self.exhausted = False
+
+    def fill(self):
+        """
+        Reads the next chunk into the buffer.
+
+        :return: Whether more data was read.
+        """
+        if self.exhausted:
+            return False
+
+        if self.position > self.compact_size:
+            self.text = self.text[self.position:]
+            self.position = 0
+
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.exhausted = True
+            self.text += self.decoder.decode(b'', final=True)
+            return False
+
+        self.text += self.decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character, or an empty string at the end of the input.
+        """
+        while True:
+            while self.position < len(self.text) and self.text[self.position] in _whitespace:
+                self.position += 1
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, characters):
+        """
+        Skips whitespace and consumes the next character, which must be one of the given characters.
+
+        :return: The consumed character.
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError("Expected one of '{expected:s}' at position {position:d}.".format(
+                expected=characters,
+                position=self.position,
+            ))
+        self.position += 1
+        return character
+
+    def value(self):
+        """
+        Decodes the next complete JSON value, reading more chunks as necessary.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.position)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # A value which is not followed by a delimiter (such as a number split after '.' or 'e') might continue in
+            # the next chunk
+            if (end == len(self.text) or self.text[end] not in _delimiters) and self.fill():
+                continue
+            self.position = end
+            return value
+
+
+def iter_json_array(chunks, key='result'):
+    """
+    Incrementally parses a JSON object from an iterator of encoded chunks and yields the items of the array at the given
+    key one by one, without decoding the full document into memory.
+
+    The other members of the object are decoded normally and returned as a dictionary when the generator finishes
+    (use `yield from` to obtain it). If the value at the given key is not an array it is included in this dictionary
+    instead.
+
+    :param chunks: An iterator of bytes objects.
+    :param key: (Optional) The key of the array to stream.
+    :return: A generator yielding the items of the array.
+    """
+    buffer = _Buffer(chunks)
+    fields = {}
+
+    buffer.expect('{')
+
+    if buffer.peek() == '}':
+        buffer.position += 1
+        return fields
+
+    while True:
+        name = buffer.value()
+        buffer.expect(':')
+
+        if name == key and buffer.peek() == '[':
+            buffer.position += 1
+            if buffer.peek() == ']':
+                buffer.position += 1
+            else:
+                while True:
+                    yield buffer.value()
+                    if buffer.expect(',]') == ']':
+                        break
+        else:
+            fields[name] = buffer.value()
+
+        if buffer.expect(',}') == '}':
+            return fields
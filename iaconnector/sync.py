@@ -0,0 +1,249 @@
+import threading
+import time
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+def activity_bounds(activity):
+    """
+    Returns the begin and end date of an activity as given by the API.
+
+    :param activity: The activity dictionary.
+    :return: A tuple of the begin and end date.
+    """
+    return activity['beginDate'], activity['endDate']
+
+
+class SyncResult(object):
+    """
+    The result of synchronizing a window of the activity stream.
+
+    Contains the merged list of activities in the window, and the changes since the previous synchronization as
+    dictionaries mapping activity ids to activities: `added`, `changed` and `removed`.
+    """
+    def __init__(self, activities, added, changed, removed):
+        self.activities = activities
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+
+    def __repr__(self):
+        return "<SyncResult: {total:d} activities, {added:d} added, {changed:d} changed, {removed:d} removed>".format(
+            total=len(self.activities),
+            added=len(self.added),
+            changed=len(self.changed),
+            removed=len(self.removed),
+        )
+
+
+class ActivityStreamSync(object):
+    """
+    Incremental synchronization of the activity stream over (overlapping) date windows.
+
+    The date ranges which have been fetched are kept in an index of disjoint intervals with the time they were fetched.
+    When a window is synchronized, only the parts of the window which have not been fetched before or were fetched
+    longer than `max_age` ago are requested, adjacent parts in a single request. Other activities are served from
+    memory.
+
+    Window bounds are compared to each other and to the dates of the activities as returned by `bounds`, so they should
+    be given in the same representation as the API uses (ISO 8601 strings), or `bounds` should convert the dates of
+    the activities to the representation of the window bounds.
+    """
+    def __init__(self, api, max_age=300, bounds=activity_bounds, clock=time.monotonic):
+        """
+        :param api: The `APIConsumer` to fetch the activity stream with.
+        :param max_age: (Optional) The time in seconds after which a fetched interval is refreshed. If `None`,
+        intervals are never refreshed.
+        :param bounds: (Optional) A function returning the begin and end date of an activity dictionary.
+        :param clock: (Optional) The function returning the current time in seconds.
+        """
+        self.api = api
+        self.max_age = max_age
+        self.bounds = bounds
+        self.clock = clock
+
+        # Sorted list of disjoint intervals: [begin, end, fetch time, set of activity ids]. Adjacent intervals are only
+        # merged if they were fetched at the same time, so that each part of a range is refreshed when it is stale.
+        self._intervals = []
+        self._activities = {}
+        self._lock = threading.Lock()
+
+    @property
+    def intervals(self):
+        """
+        The fetched date ranges, as a list of (begin, end) tuples.
+        """
+        with self._lock:
+            ranges = []
+            for interval in self._intervals:
+                if ranges and ranges[-1][1] == interval[0]:
+                    ranges[-1] = (ranges[-1][0], interval[1])
+                else:
+                    ranges.append((interval[0], interval[1]))
+            return ranges
+
+    def clear(self):
+        """
+        Forgets all fetched intervals and activities.
+        """
+        with self._lock:
+            self._intervals = []
+            self._activities = {}
+
+    def _is_stale(self, interval, now):
+        return self.max_age is not None and now - interval[2] > self.max_age
+
+    def _plan(self, begin, end, now):
+        """
+        Determines which ranges need to be fetched for the given window: the parts of the window which are missing or
+        stale. Adjacent parts are combined.
+
+        :param begin: The begin of the window.
+        :param end: The end of the window.
+        :param now: The current time.
+        :return: A list of (begin, end) ranges.
+        """
+        ranges = []
+        position = begin
+
+        def add(range_begin, range_end):
+            if ranges and ranges[-1][1] == range_begin:
+                ranges[-1] = (ranges[-1][0], range_end)
+            else:
+                ranges.append((range_begin, range_end))
+
+        for interval in self._intervals:
+            if interval[1] <= begin:
+                continue
+            if interval[0] >= end:
+                break
+            if interval[0] > position:
+                add(position, interval[0])
+            if self._is_stale(interval, now):
+                add(max(interval[0], begin), min(interval[1], end))
+            position = max(position, interval[1])
+
+        if position < end:
+            add(position, end)
+
+        return ranges
+
+    def _overlapping(self, ids, begin, end):
+        """
+        Returns the ids of the known activities which overlap a range.
+
+        :param ids: The ids of the activities.
+        :param begin: The begin of the range.
+        :param end: The end of the range.
+        :return: A set of activity ids.
+        """
+        result = set()
+
+        for id in ids:
+            activity_begin, activity_end = self.bounds(self._activities[id])
+            if activity_end >= begin and activity_begin < end:
+                result.add(id)
+
+        return result
+
+    def _replace(self, range_begin, range_end, now, ids):
+        """
+        Replaces the part of the index covered by a fetched range. Intervals which partially overlap the range are
+        split, and keep their fetch time outside of the range.
+
+        :param range_begin: The begin of the fetched range.
+        :param range_end: The end of the fetched range.
+        :param now: The time the range was fetched.
+        :param ids: The ids of the fetched activities.
+        :return: The ids of the activities which were previously known in the range.
+        """
+        intervals = []
+        previous = set()
+
+        for interval in self._intervals:
+            if interval[1] <= range_begin or interval[0] >= range_end:
+                intervals.append(interval)
+                continue
+
+            previous |= self._overlapping(interval[3], range_begin, range_end)
+            if interval[0] < range_begin:
+                intervals.append([interval[0], range_begin, interval[2],
+                                  self._overlapping(interval[3], interval[0], range_begin)])
+            if interval[1] > range_end:
+                intervals.append([range_end, interval[1], interval[2],
+                                  self._overlapping(interval[3], range_end, interval[1])])
+
+        intervals.append([range_begin, range_end, now, ids])
+        self._intervals = intervals
+        return previous
+
+    def _merge_intervals(self):
+        """
+        Sorts the intervals and merges adjacent intervals which were fetched at the same time.
+        """
+        merged = []
+
+        for interval in sorted(self._intervals, key=lambda interval: interval[0]):
+            if merged and merged[-1][1] == interval[0] and merged[-1][2] == interval[2]:
+                merged[-1][1] = interval[1]
+                merged[-1][3] = merged[-1][3] | interval[3]
+            else:
+                merged.append(interval)
+
+        self._intervals = merged
+
+    def _fetch(self, begin, end):
+        """
+        Fetches the activities in a range from the API.
+
+        :return: A dictionary mapping activity ids to activities.
+        """
+        logger.debug("Synchronizing activity stream from {begin!s} to {end!s}.".format(begin=begin, end=end))
+        return dict((activity['id'], activity) for activity in self.api.get_activity_stream(begin, end))
+
+    def sync(self, begin, end):
+        """
+        Synchronizes the activity stream for the given window, fetching only the missing and stale parts of it.
+
+        :param begin: The minimal end date (inclusive) of the activities.
+        :param end: The maximal begin date (exclusive) of the activities.
+        :return: The `SyncResult` for the window.
+        """
+        with self._lock:
+            now = self.clock()
+            ranges = [(range_begin, range_end, self._fetch(range_begin, range_end))
+                      for range_begin, range_end in self._plan(begin, end, now)]
+
+            # The changes are only applied once all ranges have been fetched, so a failure leaves the state unchanged
+            added, changed, removed = {}, {}, {}
+            fetched = {}
+            previous = set()
+
+            for range_begin, range_end, activities in ranges:
+                fetched.update(activities)
+                previous |= self._replace(range_begin, range_end, now, set(activities))
+
+            self._merge_intervals()
+
+            for id in previous - set(fetched):
+                if id in self._activities and not any(id in interval[3] for interval in self._intervals):
+                    removed[id] = self._activities.pop(id)
+
+            for id, activity in fetched.items():
+                if id not in self._activities:
+                    added[id] = activity
+                elif self._activities[id] != activity:
+                    changed[id] = activity
+                self._activities[id] = activity
+
+            activities = []
+            for activity in self._activities.values():
+                activity_begin, activity_end = self.bounds(activity)
+                if activity_end >= begin and activity_begin < end:
+                    activities.append(activity)
+            activities.sort(key=lambda activity: (self.bounds(activity)[0], activity['id']))
+
+            return SyncResult(activities, added, changed, removed)
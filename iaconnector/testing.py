@@ -0,0 +1,280 @@
+"""
+Local stand-in for the Inter-Actief JSON-RPC API and OAuth endpoint, for use in tests.
+
+The stand-in server runs in a background thread and implements a small in-memory version of the API. It is not meant to
+reproduce the behaviour of the real API exactly, only to allow exercising the consumers without network access.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import logging
+
+from iaconnector.exceptions import APIError, NotLoggedInError, SignupError
+
+
+logger = logging.getLogger('iaconnector')
+
+
+def make_activities(count, description_size=100, options=2, begin=datetime(2016, 1, 1)):
+    """
+    Generates activities for the stand-in server, of which the size of the payload can be controlled. The activities
+    start one day after another.
+
+    :param count: The number of activities.
+    :param description_size: (Optional) The length of the description of each activity in characters.
+    :param options: (Optional) The number of signup options of each activity.
+    :param begin: (Optional) The begin date of the first activity.
+    :return: A list of activity dictionaries.
+    """
+    description = ('Lorem ipsum dolor sit amet. ' * (description_size // 28 + 1))[:description_size]
+
+    return [
+        {
+            'id': id,
+            'title': 'Activity %d' % id,
+            'description': description,
+            'beginDate': (begin + timedelta(days=id - 1)).isoformat(),
+            'endDate': (begin + timedelta(days=id - 1, hours=3)).isoformat(),
+            'location': 'Stand-in',
+            'price': '0.00',
+            'options': [
+                {'id': option, 'name': 'Option %d' % option, 'type': 'checkbox', 'price': '0.50'}
+                for option in range(1, options + 1)
+            ],
+        }
+        for id in range(1, count + 1)
+    ]
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the stand-in server, which passes the requests to `StandInServer.handle_http`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, which would otherwise be delayed on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug("Stand-in server: " + format, *args)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, headers, content = self.server.handle_http('POST', self.path, dict(self.headers.items()), body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    In-process stand-in for the Inter-Actief API and OAuth endpoint::
+
+        with StandInServer() as server:
+            api = APIConsumer(base_url=server.api_url, access_token=server.access_token)
+
+    The JSON-RPC methods are looked up in `methods`, a dictionary mapping method names to callables which are called
+    with the access token and the call parameters. Callables may raise an `APIError` (or subclassed) exception. Every
+    call is recorded in `calls` as a tuple of the method name and the parameters.
+    """
+    daemon_threads = True
+    api_path = '/app/'
+    token_path = '/o/token/'
+
+    def __init__(self, activities=None, latency=0, host='127.0.0.1', port=0):
+        """
+        :param activities: (Optional) A list of activity dictionaries to serve. Each activity must have an `id`.
+        :param latency: (Optional) The number of seconds to wait before handling each request.
+        :param host: (Optional) The host to bind to.
+        :param port: (Optional) The port to bind to. Defaults to a free port.
+        """
+        super(StandInServer, self).__init__((host, port), StandInRequestHandler)
+
+        self.activities = dict((activity['id'], activity) for activity in (activities or []))
+        self.latency = latency
+        self.signups = set()
+        self.calls = []
+        self.token_generation = 0
+        self.access_token = 'access-0'
+        self.renew_token = 'renew-0'
+        self.expires_in = 3600
+        self.person = {'id': 1, 'name': 'Stand-in Member'}
+        self.methods = {
+            'getDeviceId': lambda token: 'device',
+            'checkAuthToken': lambda token: token == self.access_token,
+            'revokeAuthToken': self._revoke_auth_token,
+            'getPersonDetails': self._get_person_details,
+            'getActivityStream': self._get_activity_stream,
+            'getActivityDetailed': self._get_activity_detailed,
+            'activitySignup': self._activity_signup,
+            'activityRevokeSignup': self._activity_revoke_signup,
+        }
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    @property
+    def api_url(self):
+        return self.url + self.api_path
+
+    @property
+    def oauth_url(self):
+        return self.url + self.token_path[:-len('token/')]
+
+    def start(self):
+        """
+        Starts serving requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops serving requests and closes the server socket.
+        """
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    # Dispatching
+
+    def handle_http(self, method, url, headers, body):
+        """
+        Handles an HTTP request. This can be used with `iaconnector.transport.InProcessTransport` to use the stand-in
+        server without sockets.
+
+        :param method: The HTTP method.
+        :param url: The URL or path of the request.
+        :param headers: A dictionary of request headers.
+        :param body: The request body as bytes.
+        :return: A tuple of the HTTP status, a dictionary of response headers and the response body.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        authorization = dict((name.lower(), value) for name, value in headers.items()).get('authorization') or ''
+        token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+
+        if urlsplit(url).path == self.token_path:
+            status, data = self.handle_token(dict(parse_qsl((body or b'').decode('utf-8'))))
+        else:
+            status, data = 200, self.handle_rpc(json.loads(body.decode('utf-8')), token)
+
+        return status, {'Content-Type': 'application/json'}, json.dumps(data).encode('utf-8')
+
+    def handle_token(self, data):
+        """
+        Handles an OAuth token request for the authorization code and refresh token grants.
+
+        :param data: The decoded form data of the request.
+        :return: A tuple of the HTTP status and the response data.
+        """
+        with self._lock:
+            grant_type = data.get('grant_type')
+
+            if grant_type == 'refresh_token' and data.get('refresh_token') != self.renew_token:
+                return 400, {'error': 'invalid_grant'}
+            if grant_type not in ('authorization_code', 'refresh_token'):
+                return 400, {'error': 'unsupported_grant_type'}
+
+            self.token_generation += 1
+            self.access_token = 'access-%d' % self.token_generation
+            self.renew_token = 'renew-%d' % self.token_generation
+
+            return 200, {
+                'access_token': self.access_token,
+                'refresh_token': self.renew_token,
+                'expires_in': self.expires_in,
+                'token_type': 'Bearer',
+            }
+
+    def handle_rpc(self, request, token):
+        """
+        Handles a JSON-RPC request or batch request.
+
+        :param request: The decoded JSON-RPC request object or list of request objects.
+        :param token: The access token of the request, if any.
+        :return: The JSON-RPC response object or list of response objects.
+        """
+        if isinstance(request, list):
+            return [self._dispatch(item, token) for item in request]
+        return self._dispatch(request, token)
+
+    def _dispatch(self, request, token):
+        method = request.get('method')
+        params = request.get('params') or []
+        response = {'id': request.get('id'), 'result': None, 'error': None}
+
+        with self._lock:
+            self.calls.append((method, tuple(params)))
+
+        if method not in self.methods:
+            response['error'] = {'code': -32601, 'message': 'Method not found'}
+            return response
+
+        try:
+            response['result'] = self.methods[method](token, *params)
+        except APIError as e:
+            response['error'] = {'code': e.error_code, 'message': e.message}
+
+        return response
+
+    # API methods
+
+    def _check_token(self, token):
+        if token != self.access_token:
+            raise NotLoggedInError("Invalid token")
+
+    def _revoke_auth_token(self, token):
+        self._check_token(token)
+        self.access_token = None
+        return True
+
+    def _get_person_details(self, token):
+        self._check_token(token)
+        return self.person
+
+    def _with_signup(self, activity, token):
+        return dict(activity, signedUp=(token, activity['id']) in self.signups)
+
+    def _get_activity_stream(self, token, begin, end):
+        return [
+            self._with_signup(activity, token)
+            for activity in self.activities.values()
+            if activity.get('endDate', end) >= begin and activity.get('beginDate', begin) < end
+        ]
+
+    def _get_activity_detailed(self, token, id):
+        if id not in self.activities:
+            raise APIError("Unknown activity", 404)
+        return self._with_signup(self.activities[id], token)
+
+    def _activity_signup(self, token, id, price, options):
+        self._check_token(token)
+        if id not in self.activities or (token, id) in self.signups:
+            raise SignupError("Signup not possible")
+        self.signups.add((token, id))
+        return True
+
+    def _activity_revoke_signup(self, token, id):
+        self._check_token(token)
+        self.signups.discard((token, id))
+        return True
@@ -1,7 +1,49 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime, timedelta
+from unittest import mock
 
-from iaconnector import exceptions, OAuthConsumer
+import urllib3
+
+from iaconnector import exceptions, IAConnector, OAuthConsumer
 from iaconnector import APIConsumer
+from iaconnector.api import using_token
+from iaconnector.cache import ResponseCache, SQLiteCache, TokenInfoCache
+from iaconnector.codec import orjson, OrjsonCodec, StdlibCodec
+from iaconnector.columnar import iter_column_batches, numpy, pyarrow, to_arrow_table, to_numpy
+from iaconnector.limits import RateLimiter, TokenBucket
+from iaconnector.logs import RequestLogger
+from iaconnector.metrics import CallbackMetrics, PrometheusMetrics
+from iaconnector.models import Activity, ActivityOption, Person
+from iaconnector.pool import SessionPool
+from iaconnector.prefetch import DetailPrefetcher
+from iaconnector.streaming import iter_json_array
+from iaconnector.sync import ActivityStreamSync
+from iaconnector.tokens import MemoryTokenStore, SQLiteTokenStore
+from iaconnector.testing import make_activities, StandInServer
+from iaconnector.transport import InProcessTransport, RecordingTransport, ReplayError, ReplayTransport, \
+    RequestsTransport, Urllib3Transport
+
+try:
+    import httpx
+    from iaconnector.transport import HTTPXTransport
+except ImportError:
+    httpx = None
+
+try:
+    from iaconnector.aio import AsyncAPIConsumer
+except ImportError:
+    AsyncAPIConsumer = None
 
 
 class APITest(unittest.TestCase):
@@ -28,6 +70,1230 @@ class APITest(unittest.TestCase):
         self.assertEqual(self.api._get_exception(412), exceptions.SignupError)
         self.assertEqual(self.api._get_exception(500), exceptions.OtherError)
 
+    def test_session_pool(self):
+        """Tests whether consumers share and release pooled sessions."""
+        pool = SessionPool()
+        first = APIConsumer(session_pool=pool)
+        second = APIConsumer(session_pool=pool)
+        other = APIConsumer(base_url='https://test.example/api', session_pool=pool)
+
+        self.assertIs(first.transport._get_session(), second.transport._get_session())
+        self.assertIsNot(first.transport._get_session(), other.transport._get_session())
+        self.assertEqual(len(pool), 2)
+
+        first.close()
+        self.assertEqual(len(pool), 2)
+
+        with second, other:
+            pass
+        self.assertEqual(len(pool), 0)
+
+    def test_batch(self):
+        """Tests whether batched calls are sent in one request and mapped back by id."""
+        def post(payload):
+            self.assertEqual([call['method'] for call in payload], ['getActivityDetailed'] * 2 + ['activitySignup'])
+            return [
+                {'id': payload[2]['id'], 'error': {'code': 412, 'message': 'Full'}},
+                {'id': payload[1]['id'], 'result': {'id': 2}},
+                {'id': payload[0]['id'], 'result': {'id': 1}},
+            ]
+
+        with mock.patch.object(self.api, '_post', side_effect=post) as mock_post:
+            with self.api.batch() as batch:
+                first = batch.get_activity_details(1)
+                second = batch.get_activity_details(2)
+                signup = batch.activity_signup(2, '0.00', [])
+                self.assertRaises(RuntimeError, first.result)
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(first.result(), {'id': 1})
+        self.assertEqual(second.result(), {'id': 2})
+        self.assertIsInstance(signup.exception(), exceptions.SignupError)
+        self.assertRaises(exceptions.SignupError, signup.result)
+
+        with mock.patch.object(self.api, '_post', return_value={'error': {'code': 500, 'message': 'Down'}}):
+            with self.api.batch() as batch:
+                call = batch.get_person_details()
+        self.assertRaises(exceptions.OtherError, call.result)
+
+
+class ImportTest(unittest.TestCase):
+    """
+    Test case for the lazy imports of the package.
+    """
+    def test_lazy_imports(self):
+        """Tests whether the OAuth stack and asyncio are only imported when used."""
+        code = (
+            "import sys\n"
+            "from iaconnector import APIConsumer, IAConnector\n"
+            "IAConnector().init_api()\n"
+            "print(' '.join(sorted(set(sys.modules) & {'asyncio', 'httpx', 'oauthlib', 'requests_oauthlib'})))\n"
+            "from iaconnector import OAuthConsumer\n"
+            "print('requests_oauthlib' in sys.modules)\n"
+        )
+        output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+        self.assertEqual(output.splitlines(), ['', 'True'])
+
+    def test_star_import(self):
+        """Tests whether a star import exports the lazily imported consumers."""
+        namespace = {}
+        exec('from iaconnector import *', namespace)
+        self.assertIs(namespace['APIConsumer'], APIConsumer)
+        self.assertIs(namespace['OAuthConsumer'], OAuthConsumer)
+        self.assertIs(namespace['IAConnector'], IAConnector)
+        self.assertIs(namespace['NotLoggedInError'], exceptions.NotLoggedInError)
+
+
+class CacheTest(unittest.TestCase):
+    """
+    Test case for the response cache, using the stand-in server.
+    """
+    activities = [
+        {'id': 1, 'title': 'Lunch lecture', 'beginDate': '2016-01-04T12:30:00', 'endDate': '2016-01-04T13:30:00'},
+        {'id': 2, 'title': 'Drinks', 'beginDate': '2016-01-05T16:00:00', 'endDate': '2016-01-05T20:00:00'},
+    ]
+
+    def setUp(self):
+        self.server = StandInServer(activities=self.activities)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.now = 0
+        self.cache = self.make_cache()
+        self.api = APIConsumer(base_url=self.server.api_url, access_token=self.server.access_token, cache=self.cache,
+                               cache_ttls={'getActivityDetailed': 10})
+        self.addCleanup(self.api.close)
+
+    def make_cache(self):
+        return ResponseCache(maxsize=3, clock=lambda: self.now)
+
+    def test_ttl(self):
+        """Tests whether results are served from the cache until they expire."""
+        self.api.get_activity_details(1)
+        self.api.get_activity_details(1)
+        self.assertEqual(len(self.server.calls), 1)
+
+        self.now = 11
+        self.api.get_activity_details(1)
+        self.assertEqual(len(self.server.calls), 2)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 2, 1))
+        self.assertEqual(stats['methods']['getActivityDetailed'], {'hits': 1, 'misses': 2})
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_dates(self):
+        """Tests whether calls with parameters which only the codec can encode, such as dates, are cached."""
+        with APIConsumer(base_url=self.server.api_url, access_token=self.server.access_token, cache=self.cache,
+                         cache_ttls={'getActivityStream': 10}, codec=OrjsonCodec()) as api:
+            api.get_activity_stream(datetime(2016, 1, 1), datetime(2016, 1, 8))
+            result = api.get_activity_stream(datetime(2016, 1, 1), datetime(2016, 1, 8))
+
+        self.assertEqual([activity['id'] for activity in result], [1, 2])
+        self.assertEqual(len(self.server.calls), 1)
+
+    def test_token_scope(self):
+        """Tests whether cached results are not shared between tokens."""
+        self.api.get_activity_details(1)
+        self.api.access_token = 'other'
+        self.api.get_activity_details(1)
+        self.assertEqual(len(self.server.calls), 2)
+
+    def test_eviction(self):
+        """Tests whether the least recently used entry is evicted."""
+        self.api.get_activity_details(1)
+        self.api.get_activity_details(2)
+        self.api.get_activity_stream('2016-01-01', '2016-01-05')
+        self.api.get_activity_details(1)
+        self.api.get_person_details()
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+        self.api.get_activity_details(1)
+        self.assertEqual(len(self.server.calls), 4)
+        self.api.get_activity_details(2)
+        self.assertEqual(len(self.server.calls), 5)
+
+    def test_invalidation(self):
+        """Tests whether signups invalidate the cached results containing the activity."""
+        self.api.get_activity_details(1)
+        self.api.get_activity_details(2)
+        self.api.get_activity_stream('2016-01-01', '2016-01-05')
+        self.api.activity_signup(1, '0.00', [])
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertTrue(self.api.get_activity_details(1)['signedUp'])
+
+    def test_batch(self):
+        """Tests whether batched calls update the cache."""
+        self.assertFalse(self.api.get_activity_details(1)['signedUp'])
+
+        with self.api.batch() as batch:
+            batch.activity_signup(1, '0.00', [])
+            batch.get_activity_details(2)
+
+        self.assertTrue(self.api.get_activity_details(1)['signedUp'])
+        self.api.get_activity_details(2)
+        self.assertEqual([call[0] for call in self.server.calls],
+                         ['getActivityDetailed', 'activitySignup', 'getActivityDetailed', 'getActivityDetailed'])
+
+
+class SQLiteCacheTest(CacheTest):
+    """
+    Test case for the persistent response cache, using the stand-in server.
+    """
+    def make_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.db')
+        cache = SQLiteCache(self.path, maxsize=3, clock=lambda: self.now)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_eviction(self):
+        """Tests whether the entries which expire first are evicted."""
+        self.api.get_activity_details(1)
+        self.api.get_activity_stream('2016-01-01', '2016-01-05')
+        self.api.get_person_details()
+        self.api.get_activity_details(2)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+        self.api.get_activity_stream('2016-01-01', '2016-01-05')
+        self.assertEqual(len(self.server.calls), 4)
+        self.api.get_activity_details(1)
+        self.assertEqual(len(self.server.calls), 5)
+
+    def test_shared(self):
+        """Tests whether the cache is shared between instances and threads, and kept stale entries."""
+        self.api.get_activity_details(1)
+
+        other = SQLiteCache(self.path, clock=lambda: self.now, stale_ttl=100)
+        self.addCleanup(other.close)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(other.get(self.api._get_cache_key(
+            'getActivityDetailed', (1,)))))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [(True, self.api.get_activity_details(1))])
+
+        self.now = 11
+        self.assertEqual(other.get_stale(self.api._get_cache_key('getActivityDetailed', (1,)))[1]['id'], 1)
+
+    def test_items(self):
+        """Tests whether the ids of the objects in list results are stored with the entries and used to invalidate."""
+        connection = sqlite3.connect(self.path)
+        self.addCleanup(connection.close)
+
+        def count_items():
+            return connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+        self.api.get_activity_stream('2016-01-01', '2016-01-06')
+        self.api.get_activity_details(2)
+        self.assertEqual(count_items(), 2)
+
+        self.api.activity_signup(2, '0.00', [])
+        self.assertEqual((len(self.cache), count_items()), (0, 0))
+
+        self.api.get_activity_stream('2016-01-01', '2016-01-06')
+        self.api.get_activity_stream('2016-01-01', '2016-01-06')
+        self.assertEqual(count_items(), 2)
+        self.now = 61
+        self.api.get_activity_details(1)
+        self.assertEqual((len(self.cache), count_items()), (1, 0))
+
+
+class TokenInfoCacheTest(unittest.TestCase):
+    """
+    Test case for the token validity and identity cache, using the stand-in server.
+    """
+    def setUp(self):
+        self.server = StandInServer(activities=CacheTest.activities)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.now = 0
+        self.token_cache = TokenInfoCache(revalidate_after=60, clock=lambda: self.now)
+        self.api = APIConsumer(base_url=self.server.api_url, access_token=self.server.access_token,
+                               token_cache=self.token_cache)
+        self.addCleanup(self.api.close)
+
+    def test_revalidate(self):
+        """Tests whether token checks and person details are answered locally until revalidation."""
+        self.assertTrue(self.api.check_auth_token())
+        self.assertTrue(self.api.check_auth_token())
+        self.assertEqual(self.api.get_person_details(), self.server.person)
+        self.assertEqual(self.api.get_person_details(), self.server.person)
+        self.assertEqual([call[0] for call in self.server.calls], ['checkAuthToken', 'getPersonDetails'])
+
+        self.now = 61
+        self.assertTrue(self.api.check_auth_token())
+        self.api.get_person_details()
+        self.assertEqual(len(self.server.calls), 4)
+
+    def test_expiry(self):
+        """Tests whether tokens are not valid beyond their expiry."""
+        self.token_cache.set_valid('abc', expiry=datetime(1970, 1, 1, 0, 0, 10), person={'id': 1})
+        self.assertEqual(self.token_cache.get_person('abc'), (True, {'id': 1}))
+        self.token_cache.set_valid('abc')
+        self.assertEqual(self.token_cache.get_person('abc'), (True, {'id': 1}))
+
+        self.token_cache.set_valid('abc', expiry=datetime(1970, 1, 1, 0, 0, 10))
+        self.now = 10
+        self.assertFalse(self.token_cache.is_valid('abc'))
+        self.assertEqual(len(self.token_cache), 0)
+
+    def test_invalidation(self):
+        """Tests whether revoked and rejected tokens are forgotten."""
+        self.api.get_person_details()
+        self.api.revoke_auth_token()
+        self.assertEqual(len(self.token_cache), 0)
+        self.assertFalse(self.api.check_auth_token())
+
+        self.server.access_token = self.api.access_token
+        self.api.get_person_details()
+        self.server.access_token = 'other'
+        self.server.methods['getActivityDetailed'] = lambda token, id: self.server._check_token(token)
+        self.assertRaises(exceptions.NotLoggedInError, self.api.get_activity_details, 1)
+        self.assertEqual(len(self.token_cache), 0)
+
+    def test_response_cache(self):
+        """Tests whether revoked and rejected tokens are forgotten by the response cache and within batches."""
+        cache = ResponseCache()
+        api = APIConsumer(base_url=self.server.api_url, access_token=self.server.access_token, cache=cache,
+                          token_cache=self.token_cache)
+        self.addCleanup(api.close)
+
+        api.get_person_details()
+        api.revoke_auth_token()
+        self.assertEqual(len(cache), 0)
+        self.assertRaises(exceptions.NotLoggedInError, api.get_person_details)
+
+        self.server.access_token = api.access_token
+        with api.batch() as batch:
+            batch.get_person_details()
+        self.assertTrue(api.check_auth_token())
+        self.assertEqual((len(cache), len(self.token_cache)), (1, 1))
+
+        self.server.access_token = 'other'
+        self.server.methods['getActivityStream'] = lambda token, begin, end: self.server._check_token(token)
+        with api.batch() as batch:
+            call = batch.get_activity_stream('2016-01-01', '2016-01-06')
+        self.assertIsInstance(call.exception(), exceptions.NotLoggedInError)
+        self.assertEqual((len(cache), len(self.token_cache)), (0, 0))
+        self.assertFalse(api.check_auth_token())
+
+
+class CodecTest(unittest.TestCase):
+    """
+    Test case for the JSON codecs.
+    """
+    value = {'id': 'abc', 'params': ('Caf\u00e9 \u2615', 1, 2.5, None, True), 'result': {1: [{'a': []}]}}
+    expected = {'id': 'abc', 'params': ['Caf\u00e9 \u2615', 1, 2.5, None, True], 'result': {'1': [{'a': []}]}}
+
+    def check_codec(self, codec):
+        encoded = codec.encode(self.value)
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(codec.decode(encoded), self.expected)
+        self.assertEqual(codec.decode(StdlibCodec().encode(self.value)), self.expected)
+        self.assertRaises(ValueError, codec.decode, b'{"result": [')
+
+        with StandInServer(activities=SyncTest.activities) as server, \
+                APIConsumer(base_url=server.api_url, codec=codec) as api:
+            self.assertEqual(api.get_activity_details(2)['title'], SyncTest.activities[1]['title'])
+
+    def test_stdlib(self):
+        """Tests the standard library codec."""
+        self.check_codec(StdlibCodec())
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_orjson(self):
+        """Tests the orjson codec."""
+        self.check_codec(OrjsonCodec())
+
+
+class ModelTest(unittest.TestCase):
+    """
+    Test case for the compact result models.
+    """
+    def test_activity(self):
+        """Tests lazy conversion of fields and conversion back to dictionaries."""
+        data = dict(make_activities(1)[0], signedUp=True, imageUrl='https://example.com/1.png')
+        activity = Activity.from_dict(data)
+
+        self.assertFalse(hasattr(activity, '__dict__'))
+        self.assertEqual((activity.id, activity.title, activity.signed_up), (1, 'Activity 1', True))
+        self.assertIsInstance(activity._options, list)
+        self.assertEqual(activity.to_dict(), data)
+
+        self.assertEqual(activity.begin_date, datetime(2016, 1, 1))
+        self.assertIsInstance(activity.options[0], ActivityOption)
+        self.assertEqual([option.name for option in activity.options], ['Option 1', 'Option 2'])
+        self.assertIs(activity.options, activity.options)
+        self.assertEqual(activity.to_dict(), data)
+        self.assertEqual(activity, data)
+
+        self.assertEqual(activity['beginDate'], data['beginDate'])
+        self.assertEqual(activity['imageUrl'], data['imageUrl'])
+        self.assertEqual(activity.get('vCal', 'missing'), 'missing')
+        self.assertRaises(KeyError, lambda: activity['vCal'])
+        self.assertRaises(AttributeError, getattr, activity, 'image_url')
+
+        activity = Activity.from_dict({'id': 2})
+        self.assertEqual((activity.title, activity.end_date, activity.options), (None, None, None))
+        self.assertNotIn('title', activity)
+        self.assertEqual(activity.to_dict(), {'id': 2})
+
+        activity = Activity.from_dict(data)
+        self.assertEqual(pickle.loads(pickle.dumps(activity)), activity)
+
+    def test_consumer(self):
+        """Tests whether results are returned as models when enabled."""
+        cache = ResponseCache()
+
+        with StandInServer(activities=make_activities(3)) as server, \
+                APIConsumer(base_url=server.api_url, access_token=server.access_token, cache=cache, models=True) as api:
+            activities = api.get_activity_stream('2016-01-01', '2016-01-03')
+            self.assertEqual([type(activity) for activity in activities], [Activity, Activity])
+            self.assertIs(type(api.get_activity_stream('2016-01-01', '2016-01-03')[0]), Activity)
+            self.assertEqual(len(server.calls), 1)
+            self.assertIs(type(cache.get(api._get_cache_key('getActivityStream', ('2016-01-01', '2016-01-03')))[1][0]),
+                          dict)
+
+            self.assertEqual(api.get_activity_details(3).end_date, datetime(2016, 1, 3, 3))
+            self.assertIsInstance(api.get_person_details(), Person)
+            self.assertIs(api.activity_signup(3, '0.00', {}), True)
+            self.assertEqual([activity.id for activity in api.iter_activity_stream('2016-01-01', '2016-01-03')],
+                             [1, 2])
+
+            with api.batch() as batch:
+                call = batch.get_activity_details(1)
+            self.assertIs(type(call.result()), Activity)
+
+
+class RequestLoggerTest(unittest.TestCase):
+    """
+    Test case for request and response logging.
+    """
+    def setUp(self):
+        self.logger = logging.getLogger('iaconnector.test')
+        self.request_log = RequestLogger(logger=self.logger, max_length=40)
+
+    def test_render(self):
+        """Tests truncation and redaction of logged values."""
+        self.assertEqual(self.request_log.render({'a': [1, 'b'], 'access_token': 'x'}),
+                         "{'a': [1, 'b'], 'access_token': '<redacted>'}"[:40] + '...')
+        self.assertEqual(self.request_log.render(('x' * 100,)), "('" + 'x' * 38 + '...')
+        self.assertEqual(len(self.request_log.render([{'id': id} for id in range(100000)])), 43)
+
+    def test_disabled(self):
+        """Tests whether nothing is rendered unless logging is enabled."""
+        self.logger.setLevel(logging.INFO)
+        with mock.patch.object(self.request_log, 'render') as render:
+            self.request_log.log_request('abc', 'getActivityStream', ('2016-01-01', '2016-02-01'))
+            self.request_log.log_response('abc', 'getActivityStream', {'result': []})
+        self.assertFalse(render.called)
+
+    def test_sampling(self):
+        """Tests whether sampling is consistent per call."""
+        self.logger.setLevel(logging.DEBUG)
+        self.request_log.sample_rate = 0.25
+        sampled = [self.request_log.is_enabled('call%d' % i) for i in range(1000)]
+
+        self.assertTrue(150 < sum(sampled) < 350)
+        self.assertEqual(sampled, [self.request_log.is_enabled('call%d' % i) for i in range(1000)])
+
+        self.request_log.sample_rate = 1
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            self.request_log.log_request('abc', 'getAuthToken', ('member', 'secret', 'device'))
+        self.assertNotIn('secret', logs.output[0])
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Test case for the metrics hooks, using the stand-in server.
+    """
+    def test_callback(self):
+        """Tests whether calls and cache lookups are reported to the callback."""
+        events = []
+
+        with StandInServer(activities=[{'id': 1}]) as server:
+            with APIConsumer(base_url=server.api_url, cache=ResponseCache(),
+                             metrics=CallbackMetrics(lambda name, data: events.append((name, data)))) as api:
+                api.get_activity_details(1)
+                api.get_activity_details(1)
+                self.assertRaises(exceptions.NotLoggedInError, api.get_person_details)
+
+        self.assertEqual([name for name, data in events], ['cache', 'call', 'cache', 'cache', 'call'])
+        self.assertEqual(events[1][1]['method'], 'getActivityDetailed')
+        self.assertGreater(events[1][1]['request_size'], 0)
+        self.assertGreater(events[1][1]['response_size'], 0)
+        self.assertTrue(events[2][1]['hit'])
+        self.assertEqual(events[4][1]['error'], 'NotLoggedInError')
+
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_prometheus(self):
+        """Tests the Prometheus text output."""
+        metrics = PrometheusMetrics(buckets=[0.1, 1])
+        pool = SessionPool()
+        metrics.register_pool(pool)
+
+        with StandInServer() as server:
+            with APIConsumer(base_url=server.api_url, session_pool=pool, metrics=metrics) as api:
+                api.get_device_id()
+                self.assertRaises(exceptions.APIError, api.get_activity_details, 1)
+                output = metrics.render()
+
+            config = dict(OAuthTest.config, access_token=server.access_token, renew_token=server.renew_token)
+            oauth = OAuthConsumer(base_url=server.oauth_url, metrics=metrics, **config)
+            oauth.renew_access_token()
+            oauth.renew_token = 'invalid'
+            self.assertRaises(Exception, oauth.renew_access_token)
+
+        self.assertIn('iaconnector_call_duration_seconds_bucket{method="getDeviceId",le="+Inf"} 1', output)
+        self.assertIn('iaconnector_call_duration_seconds_count{method="getActivityDetailed"} 1', output)
+        self.assertIn('iaconnector_errors_total{method="getActivityDetailed",error="APIError"} 1', output)
+        self.assertIn('iaconnector_pool_sessions{pool="0"} 1', output)
+        self.assertIn('# TYPE iaconnector_response_bytes_total counter', output)
+
+        output = metrics.render()
+        self.assertIn('iaconnector_token_request_duration_seconds_count{endpoint="refresh"} 2', output)
+        self.assertIn('iaconnector_token_errors_total{endpoint="refresh",error="InvalidGrantError"} 1', output)
+
+
+class FanOutTest(unittest.TestCase):
+    """
+    Test case for retrieving the details of multiple activities, using the stand-in server.
+    """
+    def setUp(self):
+        self.server = StandInServer(activities=[{'id': id, 'title': 'Activity %d' % id} for id in range(1, 6)])
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.api = APIConsumer(base_url=self.server.api_url)
+        self.addCleanup(self.api.close)
+
+    def test_threads(self):
+        """Tests concurrent retrieval with de-duplication and isolated failures."""
+        results = self.api.get_activity_details_many([3, 1, 3, 99, 2], max_workers=3)
+
+        self.assertEqual(list(results), [3, 1, 99, 2])
+        self.assertEqual(results[3]['title'], 'Activity 3')
+        self.assertIsInstance(results[99], exceptions.APIError)
+        self.assertEqual(len(self.server.calls), 4)
+
+    def test_timeout(self):
+        """Tests whether activities without a result within the deadline are mapped to a timeout."""
+        release = threading.Event()
+        detailed = self.server.methods['getActivityDetailed']
+
+        def slow_detailed(token, id):
+            if id == 2:
+                release.wait(5)
+            return detailed(token, id)
+
+        self.server.methods['getActivityDetailed'] = slow_detailed
+        self.addCleanup(release.set)
+
+        results = self.api.get_activity_details_many([1, 2], timeout=0.5)
+        self.assertEqual(results[1]['id'], 1)
+        self.assertIsInstance(results[2], TimeoutError)
+
+    def test_batch(self):
+        """Tests retrieval in a single batch request."""
+        with mock.patch.object(self.api, '_post', wraps=self.api._post) as mock_post:
+            results = self.api.get_activity_details_many([1, 2, 1, 99], batch=True)
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual([results[id]['id'] for id in (1, 2)], [1, 2])
+        self.assertIsInstance(results[99], exceptions.APIError)
+
+
+class CoalescingTest(unittest.TestCase):
+    """
+    Test case for coalescing identical concurrent calls, using the stand-in server with latency.
+    """
+    def setUp(self):
+        self.server = StandInServer(activities=SyncTest.activities, latency=0.2)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_threads(self):
+        """Tests whether identical concurrent calls from threads share a request, its result and its exception."""
+        results = []
+
+        with APIConsumer(base_url=self.server.api_url, pool_maxsize=20) as api:
+            def call(api, id):
+                try:
+                    results.append(api.get_activity_details(id))
+                except exceptions.APIError as e:
+                    results.append(e)
+
+            threads = [threading.Thread(target=call, args=(api, id)) for id in (1, 4) * 5]
+            threads += [threading.Thread(target=call, args=(api.bind('other'), 1))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(self.server.calls), 3)
+        self.assertEqual(len([result for result in results if isinstance(result, dict)]), 6)
+        self.assertEqual(len(set(id(result) for result in results if isinstance(result, exceptions.APIError))), 1)
+
+    @unittest.skipIf(AsyncAPIConsumer is None, "aiohttp is not installed")
+    def test_asyncio(self):
+        """Tests whether identical concurrent calls from asyncio tasks share a request."""
+        async def run():
+            async with AsyncAPIConsumer(base_url=self.server.api_url) as api:
+                return await asyncio.gather(*[api.get_activity_details(1) for i in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(len(self.server.calls), 1)
+        self.assertEqual([result['id'] for result in results], [1] * 5)
+
+
+class ResilienceTest(unittest.TestCase):
+    """
+    Test case for retries, token renewal, circuit breaking and stale results, using the stand-in server.
+    """
+    def setUp(self):
+        self.server = StandInServer(activities=SyncTest.activities)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.failures = 0
+
+    def flaky(self, token, id):
+        if self.failures:
+            self.failures -= 1
+            raise exceptions.OtherError("Overloaded")
+        return {'id': id}
+
+    def test_retries(self):
+        """Tests whether read-only calls are retried and other calls are not."""
+        observations = []
+        self.server.methods['getActivityDetailed'] = self.flaky
+        self.server.methods['activitySignup'] = lambda token, id, price, options: self.flaky(token, id)
+
+        with APIConsumer(base_url=self.server.api_url, retry_backoff=0.01,
+                         metrics=CallbackMetrics(lambda name, data: observations.append(name))) as api:
+            self.failures = 2
+            self.assertEqual(api.get_activity_details(1), {'id': 1})
+            self.assertEqual(observations.count('retry'), 2)
+
+            self.failures = 3
+            self.assertRaises(exceptions.OtherError, api.get_activity_details, 1)
+
+            self.failures = 1
+            del self.server.calls[:]
+            self.assertRaises(exceptions.OtherError, api.activity_signup, 1, '0.00', [])
+            self.assertEqual(len(self.server.calls), 1)
+
+    def test_invalid_response(self):
+        """Tests whether invalid responses are wrapped in a TransportError."""
+        transport = InProcessTransport(lambda method, url, headers, body: (502, {}, b'<html>Bad gateway</html>'))
+        api = APIConsumer(transport=transport, retries=0)
+        self.assertRaises(exceptions.TransportError, api.get_activity_details, 1)
+
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_renew(self):
+        """Tests whether a rejected access token is renewed and the call replayed once."""
+        ia = IAConnector()
+        ia.init_oauth('test', 'vault', ['scope'], 'https://example.test/oauth', access_token='expired',
+                      renew_token=self.server.renew_token, base_url=self.server.oauth_url)
+        ia.init_api(base_url=self.server.api_url)
+        ia.api.access_token = 'expired'
+
+        self.assertEqual(ia.api.get_person_details(), self.server.person)
+        self.assertEqual(self.server.token_generation, 1)
+        self.assertEqual(ia.api.access_token, 'access-1')
+
+        self.assertRaises(exceptions.NotLoggedInError, ia.api.bind('other').get_person_details)
+        self.assertEqual(self.server.token_generation, 1)
+
+    def test_circuit_breaker(self):
+        """Tests whether the circuit opens after repeated failures and stale results are served meanwhile."""
+        now = [0.0]
+        cache = ResponseCache(clock=lambda: now[0], stale_ttl=3600)
+        self.server.methods['getActivityDetailed'] = self.flaky
+
+        with APIConsumer(base_url=self.server.api_url, cache=cache, retries=0, breaker_threshold=2) as api:
+            self.assertEqual(api.get_activity_details(1), {'id': 1})
+            now[0] = 120.0
+            self.failures = 10
+
+            self.assertEqual(api.get_activity_details(1), {'id': 1})
+            self.assertRaises(exceptions.OtherError, api.get_activity_details, 2)
+            calls = len(self.server.calls)
+
+            self.assertEqual(api.get_activity_details(1), {'id': 1})
+            self.assertRaises(exceptions.CircuitOpenError, api.get_activity_details, 2)
+            self.assertEqual(len(self.server.calls), calls)
+            self.assertEqual(cache.stats()['stale_hits'], 2)
+
+    def test_client_errors(self):
+        """Tests whether requests which cannot be encoded are not sent, retried or counted as failures."""
+        with APIConsumer(base_url=self.server.api_url, codec=StdlibCodec(), coalesce=False, retry_backoff=0.01,
+                         breaker_threshold=2) as api:
+            for i in range(3):
+                self.assertRaises(TypeError, api.get_activity_stream, datetime(2016, 1, 1), datetime(2016, 1, 8))
+            self.assertRaises(TypeError, list, api.iter_activity_stream(datetime(2016, 1, 1), datetime(2016, 1, 8)))
+
+            breaker = api._get_breaker('getActivityStream')
+            self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+        self.assertEqual(self.server.calls, [])
+
+    def test_circuit_breaker_trial(self):
+        """Tests whether a trial call ending in an error other than an APIError opens the circuit again."""
+        self.server.methods['getActivityDetailed'] = self.flaky
+
+        with APIConsumer(base_url=self.server.api_url, retries=0, breaker_threshold=1, breaker_timeout=0) as api:
+            self.failures = 1
+            self.assertRaises(exceptions.OtherError, api.get_activity_details, 1)
+
+            with mock.patch.object(api, '_attempt', side_effect=RuntimeError()):
+                self.assertRaises(RuntimeError, api.get_activity_details, 1)
+            self.assertEqual(api._get_breaker('getActivityDetailed').state, 'open')
+
+            self.assertEqual(api.get_activity_details(1), {'id': 1})
+
+
+class LimiterTest(unittest.TestCase):
+    """
+    Test case for rate limiting and adaptive concurrency control.
+    """
+    def setUp(self):
+        self.time = 0.0
+
+    def clock(self):
+        return self.time
+
+    def test_token_bucket(self):
+        """Tests whether tokens are reserved ahead of time when the bucket is empty."""
+        bucket = TokenBucket(10, burst=2, clock=self.clock)
+        self.assertEqual([bucket.reserve() for i in range(4)], [0, 0, 0.1, 0.2])
+        self.time = 1.0
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_aimd(self):
+        """Tests whether the concurrency limit increases additively and decreases multiplicatively."""
+        limiter = RateLimiter(concurrency=4, min_concurrency=1, max_concurrency=5, latency_threshold=2.0,
+                              clock=self.clock)
+
+        for i in range(4):
+            with limiter.permit():
+                self.time += 0.1
+        self.assertAlmostEqual(limiter.limit, 5.0, delta=0.1)
+
+        for i in range(2):
+            with limiter.permit() as permit:
+                self.time += 0.1
+                permit.overloaded = True
+        self.assertEqual(int(limiter.limit), 2)
+
+        with self.assertRaises(IOError):
+            with limiter.permit():
+                self.time += 1.0
+                raise IOError()
+        self.assertEqual(int(limiter.limit), 1)
+
+        self.time += 5.0
+        with limiter.permit():
+            self.time += 3.0
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_consumer(self):
+        """Tests whether per-method limiters bound concurrency and back off on server errors."""
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow(token, id):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return {'id': id}
+
+        def overloaded(token, begin, end):
+            raise exceptions.OtherError("Overloaded")
+
+        signups = RateLimiter(concurrency=4)
+        limiters = {None: RateLimiter(concurrency=2, max_concurrency=2), 'activitySignup': signups}
+
+        with StandInServer(activities=SyncTest.activities) as server, \
+                APIConsumer(base_url=server.api_url, limiters=limiters, coalesce=False) as api:
+            server.methods['getActivityDetailed'] = slow
+            server.methods['getActivityStream'] = overloaded
+
+            results = api.get_activity_details_many(range(6))
+            self.assertEqual([result['id'] for result in results.values()], list(range(6)))
+            self.assertEqual(peak[0], 2)
+
+            self.assertRaises(exceptions.OtherError, api.get_activity_stream, '2016-01-01', '2016-01-10')
+            self.assertEqual(int(limiters[None].limit), 1)
+            self.assertEqual(signups.limit, 4)
+
+
+class PrefetchTest(unittest.TestCase):
+    """
+    Test case for prefetching activity details, using the stand-in server.
+    """
+    def setUp(self):
+        self.server = StandInServer(activities=list(reversed(make_activities(10))))
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.limiter = RateLimiter(concurrency=2)
+        # Activities 1 to 3 have ended
+        self.prefetcher = DetailPrefetcher(count=3, max_workers=1, backoff=0.01,
+                                           clock=lambda: datetime(2016, 1, 3, 12).timestamp())
+        self.addCleanup(self.prefetcher.close)
+        self.api = APIConsumer(base_url=self.server.api_url, access_token=self.server.access_token,
+                               cache=ResponseCache(), limiters={None: self.limiter}, breaker_threshold=1,
+                               prefetcher=self.prefetcher)
+        self.addCleanup(self.api.close)
+
+    def details_calls(self):
+        return [call[1][0] for call in self.server.calls if call[0] == 'getActivityDetailed']
+
+    def test_prefetch(self):
+        """Tests whether the details of the first upcoming activities are prefetched in order."""
+        self.api.get_activity_stream('2016-01-01', '2016-01-11')
+        self.prefetcher.join()
+        self.assertEqual(self.details_calls(), [4, 5, 6])
+
+        self.api.get_activity_details(5)
+        self.api.get_activity_stream('2016-01-01', '2016-01-12')
+        self.prefetcher.join()
+        self.assertEqual(self.details_calls(), [4, 5, 6])
+        self.assertEqual(self.prefetcher.stats()['prefetched'], 6)
+
+        self.assertRaises(ValueError, APIConsumer, prefetcher=self.prefetcher)
+
+    def test_pressure(self):
+        """Tests whether prefetching waits for the rate limiter and stops while the circuit is open."""
+        with self.limiter.permit():
+            self.api.get_activity_stream('2016-01-01', '2016-01-11')
+            time.sleep(0.05)
+            self.assertEqual(self.details_calls(), [])
+        self.prefetcher.join()
+        self.assertEqual(self.details_calls(), [4, 5, 6])
+
+        self.api._get_breaker('getActivityDetailed').record_failure()
+        self.api.cache.clear()
+        self.api.get_activity_stream('2016-01-01', '2016-01-11')
+        self.prefetcher.join()
+        self.assertEqual(len(self.details_calls()), 3)
+        self.assertEqual(self.prefetcher.stats()['dropped'], 3)
+
+    def test_workers(self):
+        """Tests whether concurrent prefetches of multiple streams keep their workers alive, also after errors."""
+        self.server.latency = 0.05
+        prefetcher = DetailPrefetcher(count=3, max_workers=3, clock=lambda: datetime(2016, 1, 3, 12).timestamp())
+        self.addCleanup(prefetcher.close)
+        api = APIConsumer(base_url=self.server.api_url, access_token=self.server.access_token, cache=ResponseCache(),
+                          prefetcher=prefetcher)
+        self.addCleanup(api.close)
+
+        api.get_activity_stream('2016-01-01', '2016-01-11')
+        api.get_activity_stream('2016-01-07', '2016-01-11')
+        prefetcher.join()
+        self.assertEqual(sorted(self.details_calls()), [4, 5, 6, 7, 8, 9])
+        self.assertEqual(prefetcher.stats()['prefetched'], 6)
+
+        with mock.patch.object(api, 'get_activity_details', side_effect=RuntimeError()):
+            api.cache.clear()
+            api.get_activity_stream('2016-01-01', '2016-01-11')
+            prefetcher.join()
+        self.assertEqual(prefetcher.stats()['failed'], 3)
+        self.assertTrue(all(worker.is_alive() for worker in prefetcher._workers))
+
+        api.get_activity_stream('2016-01-01', '2016-01-12')
+        prefetcher.join()
+        self.assertEqual(prefetcher.stats()['prefetched'], 9)
+
+
+class MultiTenantTest(unittest.TestCase):
+    """
+    Test case for sharing a consumer between users, using the stand-in server.
+    """
+    def test_bind(self):
+        """Tests whether bound consumers use their own token through a shared consumer and cache."""
+        activities = [{'id': 1, 'title': 'Drinks', 'beginDate': '2016-01-05T16:00', 'endDate': '2016-01-05T20:00'}]
+
+        with StandInServer(activities=activities) as server, APIConsumer(base_url=server.api_url,
+                                                                         cache=ResponseCache()) as api:
+            server.methods['activitySignup'] = lambda token, id, price, options: server.signups.add((token, id))
+            users = [api.bind('token-%d' % i) for i in range(4)]
+            self.assertFalse(hasattr(users[0], '__dict__'))
+
+            threads = [threading.Thread(target=user.activity_signup, args=(1, '0.00', [])) for user in users[:2]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            for i in range(2):
+                self.assertEqual([user.get_activity_details(1)['signedUp'] for user in users], [True] * 2 + [False] * 2)
+            self.assertEqual(len(server.calls), 6)
+            self.assertIsNone(api.access_token)
+
+            with using_token('token-1'):
+                self.assertTrue(api.get_activity_details(1)['signedUp'])
+            self.assertFalse(api.get_activity_details(1)['signedUp'])
+
+
+class StreamingTest(unittest.TestCase):
+    """
+    Test case for streaming activity streams, partially using the stand-in server.
+    """
+    def test_iter_json_array(self):
+        """Tests whether array items are parsed incrementally regardless of chunk boundaries."""
+        document = {'id': 'abc', 'result': [{'id': 1, 'title': 'Caf\u00e9 \u2615'}, 12345, [], 'x'], 'error': None}
+        encoded = json.dumps(document, ensure_ascii=False).encode('utf-8')
+
+        for size in (1, 3, 7, len(encoded)):
+            chunks = [encoded[i:i + size] for i in range(0, len(encoded), size)]
+            items = []
+
+            def collect():
+                fields = yield from iter_json_array(chunks)
+                items.append(fields)
+
+            self.assertEqual(list(collect()), document['result'])
+            self.assertEqual(items, [{'id': 'abc', 'error': None}])
+
+        document = b'{"result": [1.5, 2.25e3, -3, 4E-2, true, "x"], "error": null}'
+        for split in range(1, len(document)):
+            self.assertEqual(list(iter_json_array([document[:split], document[split:]])),
+                             [1.5, 2250.0, -3, 0.04, True, 'x'])
+
+        self.assertEqual(list(iter_json_array([b'{"result": []}'])), [])
+        self.assertRaises(ValueError, list, iter_json_array([b'{"result": [1, 2']))
+
+    def test_iter_activity_stream(self):
+        """Tests whether chunked activity streams yield every activity once."""
+        with StandInServer(activities=SyncTest.activities) as server, APIConsumer(base_url=server.api_url) as api:
+            activities = list(api.iter_activity_stream(datetime(2016, 1, 1), datetime(2016, 1, 10), timedelta(days=2)))
+            self.assertEqual([activity['id'] for activity in activities], [1, 2, 3])
+            self.assertEqual(len(server.calls), 5)
+
+            activities = list(api.iter_activity_stream('2016-01-05', '2016-01-08'))
+            self.assertEqual([activity['id'] for activity in activities], [2, 3])
+
+            server.access_token = 'other'
+            server.methods['getActivityStream'] = lambda token, begin, end: server._check_token(token)
+            with self.assertRaises(exceptions.NotLoggedInError):
+                list(api.iter_activity_stream('2016-01-05', '2016-01-08'))
+
+
+class ColumnarTest(unittest.TestCase):
+    """
+    Test case for the columnar export of activity streams.
+    """
+    activities = make_activities(5, options=0) + [
+        {'id': 6, 'beginDate': '2016-01-06T12:00:00+01:00', 'endDate': '2016-01-06T13:00:00Z', 'price': 2.5,
+         'signedUp': True},
+    ]
+
+    def test_column_batches(self):
+        """Tests whether activities are converted to typed columns in batches."""
+        batches = list(iter_column_batches(iter(self.activities), batch_size=4, columns=['id', 'begin_date', 'price']))
+
+        self.assertEqual([len(batch['id']) for batch in batches], [4, 2])
+        self.assertEqual(list(batches[0]), ['id', 'begin_date', 'price'])
+        self.assertEqual(batches[0]['begin_date'][1], datetime(2016, 1, 2))
+        self.assertEqual(batches[1]['begin_date'][1], datetime(2016, 1, 6, 11))
+        self.assertEqual(batches[1]['price'], [0.0, 2.5])
+
+        batch = next(iter_column_batches([Activity.from_dict({'id': 7})]))
+        self.assertEqual((batch['id'], batch['title'], batch['end_date']), ([7], [None], [None]))
+        self.assertRaises(ValueError, list, iter_column_batches(self.activities, columns=['id', 'unknown']))
+
+    def test_missing_dependencies(self):
+        """Tests whether the exports raise an ImportError if their optional dependency is not installed."""
+        with mock.patch('iaconnector.columnar.numpy', None), mock.patch('iaconnector.columnar.pyarrow', None):
+            self.assertRaises(ImportError, to_numpy, self.activities)
+            self.assertRaises(ImportError, to_arrow_table, self.activities)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        """Tests the export to NumPy arrays."""
+        arrays = to_numpy(self.activities + [{'id': 7}], batch_size=4)
+
+        self.assertEqual(arrays['id'].dtype, numpy.int64)
+        self.assertEqual(arrays['begin_date'][5], numpy.datetime64('2016-01-06T11:00:00'))
+        self.assertTrue(numpy.isnat(arrays['end_date'][6]))
+        self.assertEqual(numpy.nansum(arrays['price']), 2.5)
+        self.assertEqual(arrays['signed_up'].sum(), 1)
+        self.assertEqual(len(to_numpy([])['begin_date']), 0)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        """Tests the export to Arrow record batches."""
+        table = to_arrow_table(self.activities + [{'id': 7}], batch_size=4)
+
+        self.assertEqual(table.num_rows, 7)
+        self.assertEqual(table.schema.field('begin_date').type, pyarrow.timestamp('us'))
+        self.assertEqual(table.column('price').null_count, 1)
+        self.assertEqual(table.column('end_date')[5].as_py(), datetime(2016, 1, 6, 13))
+
+
+class TransportTest(unittest.TestCase):
+    """
+    Test case for recording and replaying API calls and token requests using the stand-in server.
+    """
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_record_replay(self):
+        """Tests whether recorded exchanges are replayed without the server."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/exchanges.jsonl.gz'
+
+            with StandInServer(activities=SyncTest.activities) as server:
+                transport = RecordingTransport(RequestsTransport(server.api_url), path)
+                oauth = OAuthConsumer(base_url=server.oauth_url, transport=transport,
+                                      **dict(OAuthTest.config, renew_token=server.renew_token))
+                oauth.renew_access_token()
+
+                with APIConsumer(access_token=oauth.access_token, base_url=server.api_url, transport=transport) as api:
+                    stream = api.get_activity_stream('2016-01-01', '2016-01-10')
+                    details = api.get_activity_details(2)
+                    streamed = list(api.iter_activity_stream('2016-01-05', '2016-01-08'))
+                    with api.batch() as batch:
+                        calls = [batch.get_activity_details(id) for id in (1, 3)]
+                transport.close()
+                api_url = server.api_url
+                oauth_url = server.oauth_url
+
+            transport = ReplayTransport(path)
+            self.assertEqual(len(transport), 5)
+
+            oauth = OAuthConsumer(base_url=oauth_url, transport=transport,
+                                  **dict(OAuthTest.config, renew_token='renew-0'))
+            oauth.renew_access_token()
+            self.assertEqual(oauth.access_token, 'access-1')
+
+            api = APIConsumer(access_token=oauth.access_token, base_url=api_url, transport=transport)
+            self.assertEqual(api.get_activity_stream('2016-01-01', '2016-01-10'), stream)
+            self.assertEqual(api.get_activity_details(2), details)
+            self.assertEqual(list(api.iter_activity_stream('2016-01-05', '2016-01-08')), streamed)
+            with api.batch() as batch:
+                replayed = [batch.get_activity_details(id) for id in (1, 3)]
+            self.assertEqual([call.result() for call in replayed], [call.result() for call in calls])
+
+            with self.assertRaises(exceptions.TransportError) as context:
+                api.get_activity_details(4)
+            self.assertIsInstance(context.exception.__cause__, ReplayError)
+
+    def _check_transport(self, server, transport):
+        with APIConsumer(access_token=server.access_token, base_url=server.api_url, transport=transport) as api:
+            self.assertEqual(api.get_activity_details(2)['id'], 2)
+            self.assertEqual([activity['id'] for activity in api.iter_activity_stream('2016-01-05', '2016-01-08')],
+                             [2, 3])
+            self.assertRaises(exceptions.APIError, api.get_activity_details, 4)
+        transport.close()
+
+    def test_transports(self):
+        """Tests the API consumer with the alternative transports."""
+        server = StandInServer(activities=SyncTest.activities)
+        self._check_transport(server, InProcessTransport(server.handle_http))
+
+        with server:
+            self._check_transport(server, Urllib3Transport())
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    def test_httpx_transport(self):
+        """Tests the API consumer with the httpx transport."""
+        with StandInServer(activities=SyncTest.activities) as server:
+            self._check_transport(server, HTTPXTransport(http2=False))
+
+    def test_timeout(self):
+        """Tests whether requests exceeding the timeout fail."""
+        with StandInServer(latency=0.5) as server:
+            with APIConsumer(base_url=server.api_url, timeout=0.1) as api:
+                with self.assertRaises(exceptions.TransportError) as context:
+                    api.get_device_id()
+                self.assertIsInstance(context.exception.__cause__, IOError)
+            with APIConsumer(base_url=server.api_url, transport=Urllib3Transport(timeout=(1, 0.1))) as api:
+                with self.assertRaises(exceptions.TransportError) as context:
+                    api.get_device_id()
+                self.assertIsInstance(context.exception.__cause__, urllib3.exceptions.TimeoutError)
+
+
+class SyncTest(unittest.TestCase):
+    """
+    Test case for the incremental activity stream synchronization, using the stand-in server.
+    """
+    activities = [
+        {'id': 1, 'title': 'Lunch lecture', 'beginDate': '2016-01-04T12:30:00', 'endDate': '2016-01-04T13:30:00'},
+        {'id': 2, 'title': 'Drinks', 'beginDate': '2016-01-05T16:00:00', 'endDate': '2016-01-05T20:00:00'},
+        {'id': 3, 'title': 'Excursion', 'beginDate': '2016-01-07T08:00:00', 'endDate': '2016-01-09T18:00:00'},
+    ]
+
+    def setUp(self):
+        self.server = StandInServer(activities=[dict(activity) for activity in self.activities])
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.api = APIConsumer(base_url=self.server.api_url)
+        self.addCleanup(self.api.close)
+        self.now = 0
+        self.sync = ActivityStreamSync(self.api, max_age=60, clock=lambda: self.now)
+
+    def test_incremental(self):
+        """Tests whether only missing ranges are fetched and results are merged."""
+        result = self.sync.sync('2016-01-01', '2016-01-06')
+        self.assertEqual([activity['id'] for activity in result.activities], [1, 2])
+        self.assertEqual(sorted(result.added), [1, 2])
+
+        result = self.sync.sync('2016-01-05', '2016-01-08')
+        self.assertEqual([activity['id'] for activity in result.activities], [2, 3])
+        self.assertEqual(sorted(result.added), [3])
+        self.assertEqual(self.server.calls[-1], ('getActivityStream', ('2016-01-06', '2016-01-08')))
+
+        result = self.sync.sync('2016-01-02', '2016-01-07')
+        self.assertEqual(len(self.server.calls), 2)
+        self.assertEqual([activity['id'] for activity in result.activities], [1, 2])
+        self.assertEqual(self.sync.intervals, [('2016-01-01', '2016-01-08')])
+
+        self.now = 61
+        self.sync.sync('2016-01-02', '2016-01-07')
+        self.assertEqual(self.server.calls[-1], ('getActivityStream', ('2016-01-02', '2016-01-07')))
+        self.assertEqual(self.sync.intervals, [('2016-01-01', '2016-01-08')])
+
+        self.now = 100
+        result = self.sync.sync('2016-01-01', '2016-01-09')
+        self.assertEqual(self.server.calls[-2:], [('getActivityStream', ('2016-01-01', '2016-01-02')),
+                                                  ('getActivityStream', ('2016-01-07', '2016-01-09'))])
+        self.assertEqual([activity['id'] for activity in result.activities], [1, 2, 3])
+
+    def test_refresh(self):
+        """Tests whether stale ranges are refreshed and changes are reported."""
+        self.sync.sync('2016-01-01', '2016-01-06')
+        self.server.activities[1]['title'] = 'Lunch lecture (moved)'
+        del self.server.activities[2]
+
+        result = self.sync.sync('2016-01-01', '2016-01-06')
+        self.assertEqual((result.changed, result.removed), ({}, {}))
+
+        self.now = 61
+        result = self.sync.sync('2016-01-01', '2016-01-06')
+        self.assertEqual(list(result.changed), [1])
+        self.assertEqual(list(result.removed), [2])
+        self.assertEqual([activity['id'] for activity in result.activities], [1])
+
+    def test_failure(self):
+        """Tests whether a failed synchronization leaves the state unchanged."""
+        self.sync.sync('2016-01-01', '2016-01-03')
+        self.now = 30
+        self.sync.sync('2016-01-03', '2016-01-05')
+        self.server.activities[4] = {
+            'id': 4, 'title': 'Workshop', 'beginDate': '2016-01-02T10:00:00', 'endDate': '2016-01-02T12:00:00'}
+        get_activity_stream = self.server.methods['getActivityStream']
+
+        def failing(token, begin, end):
+            if begin == '2016-01-05':
+                raise exceptions.NotLoggedInError("Not logged in.")
+            return get_activity_stream(token, begin, end)
+
+        self.now = 61
+        self.server.methods['getActivityStream'] = failing
+        self.assertRaises(exceptions.NotLoggedInError, self.sync.sync, '2016-01-01', '2016-01-08')
+        self.assertEqual(self.sync.intervals, [('2016-01-01', '2016-01-05')])
+
+        self.server.methods['getActivityStream'] = get_activity_stream
+        result = self.sync.sync('2016-01-01', '2016-01-08')
+        self.assertEqual(self.server.calls[-2:], [('getActivityStream', ('2016-01-01', '2016-01-03')),
+                                                  ('getActivityStream', ('2016-01-05', '2016-01-08'))])
+        self.assertEqual(sorted(result.added), [2, 3, 4])
+        self.assertEqual([activity['id'] for activity in result.activities], [4, 1, 2, 3])
+
+
+@unittest.skipIf(AsyncAPIConsumer is None, "aiohttp is not installed")
+class AsyncAPITest(unittest.TestCase):
+    """
+    Test case for the asynchronous API functionality, using the stand-in server.
+    """
+    activities = [
+        {'id': 1, 'title': 'Lunch lecture', 'beginDate': '2016-01-04T12:30:00', 'endDate': '2016-01-04T13:30:00'},
+        {'id': 2, 'title': 'Drinks', 'beginDate': '2016-01-05T16:00:00', 'endDate': '2016-01-05T20:00:00'},
+    ]
+
+    def setUp(self):
+        self.server = StandInServer(activities=self.activities)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_endpoints(self):
+        """Tests the endpoint methods and error mapping of the asynchronous consumer."""
+        async def run():
+            async with AsyncAPIConsumer(base_url=self.server.api_url, access_token=self.server.access_token) as api:
+                stream = await api.get_activity_stream('2016-01-01', '2016-01-05')
+                details = await asyncio.gather(*[api.get_activity_details(id) for id in (1, 2)])
+                await api.activity_signup(2, '0.00', [])
+                with self.assertRaises(exceptions.SignupError):
+                    await api.activity_signup(2, '0.00', [])
+                with self.assertRaises(exceptions.NotLoggedInError):
+                    await api.bind('other').activity_signup(2, '0.00', [])
+                return stream, details
+
+        stream, details = asyncio.run(run())
+        self.assertEqual([activity['id'] for activity in stream], [1])
+        self.assertEqual([activity['title'] for activity in details], ['Lunch lecture', 'Drinks'])
+
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_renew(self):
+        """Tests whether concurrent calls with a rejected access token share a single renewal."""
+        ia = IAConnector()
+        ia.init_oauth('test', 'vault', ['scope'], 'https://example.test/oauth', access_token='expired',
+                      renew_token=self.server.renew_token, base_url=self.server.oauth_url)
+
+        async def run():
+            async with AsyncAPIConsumer(base_url=self.server.api_url, connector=ia, access_token='expired',
+                                        coalesce=False) as api:
+                results = await asyncio.gather(*[api.get_person_details() for i in range(4)])
+                return api.access_token, results
+
+        access_token, results = asyncio.run(run())
+        self.assertEqual(results, [self.server.person] * 4)
+        self.assertEqual((access_token, self.server.token_generation), ('access-1', 1))
+
+    def test_circuit_breaker_cancelled(self):
+        """Tests whether a cancelled trial call opens the circuit again."""
+        async def run():
+            async with AsyncAPIConsumer(base_url=self.server.api_url, retries=0, breaker_threshold=1,
+                                        breaker_timeout=0) as api:
+                breaker = api._get_breaker('getActivityDetailed')
+                breaker.record_failure()
+                with mock.patch.object(api, '_attempt', side_effect=asyncio.CancelledError()):
+                    with self.assertRaises(asyncio.CancelledError):
+                        await api.get_activity_details(1)
+                state = breaker.state
+                return state, await api.get_activity_details(1)
+
+        state, details = asyncio.run(run())
+        self.assertEqual(state, 'open')
+        self.assertEqual(details['id'], 1)
+
+    def test_limiter(self):
+        """Tests whether the asynchronous consumer waits for its limiter."""
+        limiter = RateLimiter(concurrency=1, max_concurrency=1)
+
+        async def run():
+            async with AsyncAPIConsumer(base_url=self.server.api_url, limiters={None: limiter}) as api:
+                return await asyncio.gather(*[api.get_activity_details(id) for id in (1, 2, 1)])
+
+        self.assertEqual([activity['id'] for activity in asyncio.run(run())], [1, 2, 1])
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_batch(self):
+        """Tests batched calls of the asynchronous consumer."""
+        async def run():
+            async with AsyncAPIConsumer(base_url=self.server.api_url) as api:
+                async with api.batch() as batch:
+                    calls = [batch.get_activity_details(id) for id in (1, 2, 3)]
+            return calls
+
+        calls = asyncio.run(run())
+        self.assertEqual(calls[1].result()['id'], 2)
+        self.assertIsInstance(calls[2].exception(), exceptions.APIError)
+        self.assertEqual(len(self.server.calls), 3)
+
 
 class OAuthTest(unittest.TestCase):
     """
@@ -75,3 +1341,120 @@ class OAuthTest(unittest.TestCase):
 
         self.assertEqual(self.oauth._get_url('authorization'), base_url + 'authorize/')
         self.assertEqual(self.oauth._get_url('token'), base_url + 'token/')
+
+    @unittest.skipIf(AsyncAPIConsumer is None, "aiohttp is not installed")
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_async_tokens(self):
+        """Tests fetching and renewing tokens asynchronously, using the stand-in server."""
+        with StandInServer() as server:
+            config = dict(self.config, access_token=None, renew_token=None)
+            oauth = OAuthConsumer(base_url=server.oauth_url, **config)
+
+            asyncio.run(oauth.fetch_access_token_async(config['redirect_uri'] + '?code=abc'))
+            self.assertEqual((oauth.access_token, oauth.renew_token), ('access-1', 'renew-1'))
+            self.assertIsNotNone(oauth.token_expiry)
+
+            asyncio.run(oauth.renew_access_token_async())
+            self.assertEqual((oauth.access_token, oauth.renew_token), ('access-2', 'renew-2'))
+
+    @unittest.skipIf(AsyncAPIConsumer is None, "aiohttp is not installed")
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_async_renew_single_flight(self):
+        """Tests whether concurrent asynchronous renewals share a single request, with and without a token store."""
+        async def renew(consumers):
+            await asyncio.gather(*[consumer.renew_access_token_async() for consumer in consumers for i in range(4)])
+
+        with StandInServer() as server, tempfile.TemporaryDirectory() as directory:
+            config = dict(self.config, access_token=server.access_token, renew_token=server.renew_token)
+            oauth = OAuthConsumer(base_url=server.oauth_url, **config)
+            asyncio.run(renew([oauth]))
+            self.assertEqual(server.token_generation, 1)
+            self.assertEqual((oauth.access_token, oauth.renew_token), ('access-1', 'renew-1'))
+
+            config = dict(self.config, access_token=server.access_token, renew_token=server.renew_token)
+            consumers = [
+                OAuthConsumer(base_url=server.oauth_url, token_store=SQLiteTokenStore(directory + '/tokens.db'),
+                              token_key='member', **config)
+                for i in range(3)
+            ]
+            asyncio.run(renew(consumers))
+            self.assertEqual(server.token_generation, 2)
+            self.assertEqual([consumer.access_token for consumer in consumers], ['access-2'] * 3)
+
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_renew_single_flight(self):
+        """Tests whether concurrent callers share a single renewal of an expired token."""
+        with StandInServer() as server:
+            config = dict(self.config, access_token=server.access_token, renew_token=server.renew_token)
+            oauth = OAuthConsumer(base_url=server.oauth_url, token_expiry=datetime.utcnow(), auto_refresh=True,
+                                  **config)
+            tokens = []
+            threads = [threading.Thread(target=lambda: tokens.append(oauth.get_access_token())) for i in range(8)]
+
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            oauth.stop_auto_refresh()
+            self.assertEqual(tokens, ['access-1'] * 8)
+            self.assertEqual(server.token_generation, 1)
+            self.assertGreater(oauth.token_expiry, datetime.utcnow() + timedelta(seconds=3000))
+
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_auto_refresh(self):
+        """Tests whether tokens are renewed in the background and propagated to the API."""
+        with StandInServer() as server:
+            connector = IAConnector()
+            connector.init_api(base_url=server.api_url)
+            connector.init_oauth(self.config['client_id'], self.config['client_secret'], self.config['scope'],
+                                 self.config['redirect_uri'], access_token=server.access_token,
+                                 renew_token=server.renew_token, base_url=server.oauth_url,
+                                 token_expiry=datetime.utcnow() + timedelta(seconds=60), auto_refresh=True,
+                                 refresh_margin=59.8)
+
+            for i in range(50):
+                if connector.api.access_token is not None:
+                    break
+                time.sleep(0.05)
+            connector.oauth.stop_auto_refresh()
+
+            self.assertEqual(connector.api.access_token, connector.oauth.access_token)
+            self.assertTrue(connector.api.check_auth_token())
+
+    @mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_token_store(self):
+        """Tests whether consumers sharing a token store renew tokens once and read each other's tokens."""
+        with StandInServer() as server, tempfile.TemporaryDirectory() as directory:
+            config = dict(self.config, access_token=server.access_token, renew_token=server.renew_token)
+            consumers = [
+                OAuthConsumer(base_url=server.oauth_url, token_store=SQLiteTokenStore(directory + '/tokens.db'),
+                              token_key='member', **config)
+                for i in range(3)
+            ]
+
+            for consumer in consumers:
+                consumer.renew_access_token()
+
+            self.assertEqual(server.token_generation, 1)
+            self.assertEqual([consumer.access_token for consumer in consumers], ['access-1'] * 3)
+            self.assertEqual([consumer.renew_token for consumer in consumers], ['renew-1'] * 3)
+            self.assertAlmostEqual(consumers[2].token_expiry, consumers[0].token_expiry, delta=timedelta(seconds=1))
+
+            store = SQLiteTokenStore(directory + '/tokens.db')
+            restored = OAuthConsumer(token_store=store, token_key='member', **self.config)
+            self.assertEqual(restored.get_access_token(), 'access-1')
+
+    def test_token_store_users(self):
+        """Tests whether users sharing a token store keep their own tokens and a key is required."""
+        store = MemoryTokenStore()
+        config = dict(self.config, access_token='alice-token', renew_token='alice-renew')
+        OAuthConsumer(token_store=store, token_key='alice', **config)._set_tokens(
+            {'access_token': 'alice-token2', 'refresh_token': 'alice-renew2'})
+
+        config = dict(self.config, access_token='bob-token', renew_token='bob-renew')
+        bob = OAuthConsumer(token_store=store, token_key='bob', **config)
+        self.assertEqual((bob.access_token, bob.renew_token), ('bob-token', 'bob-renew'))
+        self.assertEqual(OAuthConsumer(token_store=store, token_key='alice', **config).access_token, 'alice-token2')
+
+        self.assertRaises(ValueError, OAuthConsumer, token_store=store, **config)
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import logging
+
+
+logger = logging.getLogger('iaconnector')
+
+
+_epoch = datetime(1970, 1, 1)
+
+
+class TokenStore(object):
+    """
+    Base class for token stores, which share OAuth tokens between consumers (possibly in different processes).
+
+    Tokens are stored under a key, which identifies the user (session) the tokens belong to. Tokens are represented as
+    dictionaries with the `access_token`, `renew_token` and `token_expiry` (UTC datetime or `None`).
+
+    Subclasses implement `load`, `save` and `lock`.
+    """
+    def load(self, key):
+        """
+        Returns the stored tokens for the given key.
+
+        :param key: The key of the tokens.
+        :return: The tokens dictionary, or `None` if no tokens are stored.
+        """
+        raise NotImplementedError()
+
+    def save(self, key, tokens):
+        """
+        Stores the tokens for the given key, replacing any previously stored tokens.
+
+        :param key: The key of the tokens.
+        :param tokens: The tokens dictionary.
+        """
+        raise NotImplementedError()
+
+    def lock(self, key):
+        """
+        Returns a context manager which holds an exclusive lock on the tokens for the given key, for coordinating the
+        renewal of the tokens. `load` and `save` may be used while holding the lock.
+
+        :param key: The key of the tokens.
+        :return: The context manager.
+        """
+        raise NotImplementedError()
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Token store which keeps the tokens in memory, for sharing tokens between consumers within a single process.
+    """
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            tokens = self._tokens.get(key)
+            return dict(tokens) if tokens is not None else None
+
+    def save(self, key, tokens):
+        with self._lock:
+            self._tokens[key] = dict(tokens)
+
+    def lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.RLock())
+
+
+class SQLiteTokenStore(TokenStore):
+    """
+    Token store backed by an SQLite database file, for sharing tokens between processes on the same machine.
+
+    The lock is implemented as a write transaction on the database, so that processes renewing tokens wait for each
+    other and read the tokens stored by the process which renewed them first.
+    """
+    def __init__(self, path, timeout=30):
+        """
+        :param path: The path to the database file. The file is created if it does not exist.
+        :param timeout: (Optional) The number of seconds to wait for the lock held by another process.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tokens "
+                "(key TEXT PRIMARY KEY, access_token TEXT, renew_token TEXT, token_expiry REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    @contextmanager
+    def _connection(self):
+        """
+        Yields the connection of the lock held by the current thread, or a new connection.
+        """
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is not None:
+            yield connection
+            return
+
+        connection = self._connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def load(self, key):
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT access_token, renew_token, token_expiry FROM tokens WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            'access_token': row[0],
+            'renew_token': row[1],
+            'token_expiry': _epoch + timedelta(seconds=row[2]) if row[2] is not None else None,
+        }
+
+    def save(self, key, tokens):
+        expiry = tokens.get('token_expiry')
+
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO tokens (key, access_token, renew_token, token_expiry) VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    tokens.get('access_token'),
+                    tokens.get('renew_token'),
+                    (expiry - _epoch).total_seconds() if expiry is not None else None,
+                ),
+            )
+
+    @contextmanager
+    def lock(self, key):
+        if getattr(self._local, 'connection', None) is not None:
+            # Already holding the lock in this thread
+            yield
+            return
+
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.connection = connection
+            try:
+                yield
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+            finally:
+                self._local.connection = None
+        finally:
+            connection.close()
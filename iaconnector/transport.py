@@ -0,0 +1,463 @@
+"""
+HTTP transports for the consumers.
+
+A transport performs a single HTTP request and returns a `TransportResponse`. The API consumer sends all JSON-RPC calls
+through its transport, and the OAuth consumer can be configured to send its token requests through a transport as
+well. Besides the default transport using `requests`, this module provides transports using urllib3 directly, using
+httpx (with HTTP/2 support, which requires `pip install iaconnector[http2]`) and calling a handler in-process, and
+transports for recording exchanges to a file and replaying them, which allows exercising the consumers offline.
+
+Timeouts are given in seconds, either as a single number or as a tuple of the connect and read timeout. `None` disables
+the timeout.
+"""
+import gzip
+import json
+import threading
+import time
+
+import logging
+import urllib3
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from iaconnector.pool import default_pool
+
+
+logger = logging.getLogger('iaconnector')
+
+
+# Default timeout in seconds for connecting and for reading a response
+DEFAULT_TIMEOUT = 30
+
+
+def _split_timeout(timeout):
+    """
+    Returns the connect and read timeout of a timeout given as a number or a tuple.
+    """
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class ReplayError(LookupError):
+    """No recorded exchange matches the request."""
+
+
+class TransportResponse(object):
+    """
+    Response to an HTTP request performed by a transport.
+
+    The body is either available as a whole (`content`) or, for streamed responses, read incrementally using
+    `iter_content`. Reading `content` of a streamed response reads the remainder of the body.
+    """
+    def __init__(self, status, headers=None, content=None, iter_content=None, close=None):
+        """
+        :param status: The HTTP status code.
+        :param headers: (Optional) The response headers.
+        :param content: (Optional) The response body as bytes.
+        :param iter_content: (Optional) For streamed responses, a function taking a chunk size and returning an
+        iterator of chunks of the body.
+        :param close: (Optional) A function releasing the connection of a streamed response.
+        """
+        self.status = status
+        self.headers = CaseInsensitiveDict(headers or {})
+        self._content = content
+        self._iter_content = iter_content
+        self._close = close
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b''.join(self._iter_content(65536)) if self._iter_content is not None else b''
+            self.close()
+        return self._content
+
+    def iter_content(self, chunk_size):
+        """
+        Returns an iterator over chunks of the body.
+
+        :param chunk_size: The maximum size of a chunk in bytes.
+        :return: An iterator of bytes objects.
+        """
+        if self._content is not None:
+            return (self._content[i:i + chunk_size] for i in range(0, len(self._content), chunk_size))
+        return self._iter_content(chunk_size)
+
+    def close(self):
+        """
+        Releases the connection of a streamed response.
+        """
+        if self._close is not None:
+            self._close()
+
+
+class Transport(object):
+    """
+    Base class for transports. Subclasses implement `request`.
+    """
+    def request(self, method, url, headers, body, stream=False):
+        """
+        Performs an HTTP request.
+
+        :param method: The HTTP method.
+        :param url: The URL.
+        :param headers: A dictionary of request headers.
+        :param body: The request body as bytes, or `None`.
+        :param stream: (Optional) Whether the response body may be read incrementally.
+        :return: The `TransportResponse`.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Releases the resources of this transport.
+        """
+
+
+class RequestsTransport(Transport):
+    """
+    Transport using a pooled, keep-alive `requests` session obtained from a `SessionPool`. Transports using the same
+    pool, base URL and pool settings share their connections.
+    """
+    def __init__(self, base_url, pool_connections=10, pool_maxsize=10, pool_block=False, session_pool=None,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        :param base_url: The base URL the transport is used for, which identifies the shared session.
+        :param pool_connections: (Optional) The number of per-host connection pools to cache.
+        :param pool_maxsize: (Optional) The maximum number of connections to keep open per host.
+        :param pool_block: (Optional) Whether to wait for a free connection instead of exceeding `pool_maxsize`.
+        :param session_pool: (Optional) The `SessionPool` to obtain the session from. Defaults to a process-wide pool.
+        :param timeout: (Optional) The timeout of a request.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.session_pool = session_pool if session_pool is not None else default_pool
+
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def _get_session(self):
+        """
+        Returns the pooled HTTP session object and acquires it from the session pool if necessary.
+
+        :return: The HTTP session object.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self.session_pool.acquire(
+                        self.base_url,
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block,
+                    )
+        return self._session
+
+    def request(self, method, url, headers, body, stream=False):
+        response = self._get_session().request(
+            method,
+            url,
+            data=body,
+            headers=headers,
+            stream=stream,
+            timeout=self.timeout,
+        )
+
+        if stream:
+            return TransportResponse(
+                response.status_code,
+                response.headers,
+                iter_content=lambda chunk_size: response.iter_content(chunk_size=chunk_size),
+                close=response.close,
+            )
+
+        return TransportResponse(response.status_code, response.headers, content=response.content)
+
+    def close(self):
+        """
+        Releases the HTTP session. Connections are closed when no other transport uses the session.
+
+        The transport can still be used afterwards, in which case a new session is acquired.
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session = None
+                self.session_pool.release(
+                    self.base_url,
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block,
+                )
+
+
+class Urllib3Transport(Transport):
+    """
+    Transport using a urllib3 pool manager directly, avoiding the overhead of `requests`. The connections are kept
+    alive and are not shared with other transports.
+    """
+    def __init__(self, num_pools=10, maxsize=10, block=False, timeout=DEFAULT_TIMEOUT):
+        """
+        :param num_pools: (Optional) The number of per-host connection pools to cache.
+        :param maxsize: (Optional) The maximum number of connections to keep open per host.
+        :param block: (Optional) Whether to wait for a free connection instead of exceeding `maxsize`.
+        :param timeout: (Optional) The timeout of a request.
+        """
+        connect, read = _split_timeout(timeout)
+        self.timeout = timeout
+        self.pool_manager = urllib3.PoolManager(
+            num_pools=num_pools,
+            maxsize=maxsize,
+            block=block,
+            timeout=urllib3.Timeout(connect=connect, read=read),
+            retries=False,
+        )
+
+    def request(self, method, url, headers, body, stream=False):
+        response = self.pool_manager.request(method, url, body=body, headers=headers, preload_content=not stream)
+
+        if stream:
+            return TransportResponse(
+                response.status,
+                response.headers,
+                iter_content=lambda chunk_size: response.stream(chunk_size),
+                close=response.release_conn,
+            )
+
+        return TransportResponse(response.status, response.headers, content=response.data)
+
+    def close(self):
+        self.pool_manager.clear()
+
+
+class HTTPXTransport(Transport):
+    """
+    Transport using httpx, which supports HTTP/2. Over HTTP/2, concurrent requests (for example from the worker threads
+    of `APIConsumer.get_activity_details_many`) are multiplexed over a single connection per host.
+
+    Requires the optional `httpx` dependency with HTTP/2 support, which can be installed using
+    `pip install iaconnector[http2]`.
+    """
+    def __init__(self, http2=True, max_connections=10, max_keepalive_connections=10, timeout=DEFAULT_TIMEOUT):
+        """
+        :param http2: (Optional) Whether to use HTTP/2 if the server supports it.
+        :param max_connections: (Optional) The maximum number of open connections.
+        :param max_keepalive_connections: (Optional) The maximum number of idle connections to keep open.
+        :param timeout: (Optional) The timeout of a request.
+        """
+        # Imported here, as importing httpx is slow
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("The HTTP/2 transport requires httpx, install 'iaconnector[http2]'.")
+
+        connect, read = _split_timeout(timeout)
+        self.timeout = timeout
+        self.client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+
+    def request(self, method, url, headers, body, stream=False):
+        request = self.client.build_request(method, url, headers=headers, content=body)
+        response = self.client.send(request, stream=stream)
+
+        if stream:
+            return TransportResponse(
+                response.status_code,
+                response.headers,
+                iter_content=lambda chunk_size: response.iter_bytes(chunk_size),
+                close=response.close,
+            )
+
+        return TransportResponse(response.status_code, response.headers, content=response.content)
+
+    def close(self):
+        self.client.close()
+
+
+class InProcessTransport(Transport):
+    """
+    Transport which passes requests to a handler function in the same process, without any network I/O. For example,
+    the stand-in server of `iaconnector.testing` can be used without sockets::
+
+        api = APIConsumer(base_url=server.api_url, transport=InProcessTransport(server.handle_http))
+    """
+    def __init__(self, handler):
+        """
+        :param handler: A function called with the method, URL, headers and body of a request, returning a tuple of
+        the status, a dictionary of headers and the body of the response.
+        """
+        self.handler = handler
+
+    def request(self, method, url, headers, body, stream=False):
+        status, response_headers, content = self.handler(method, url, headers, body)
+        return TransportResponse(status, response_headers, content=content)
+
+
+class TransportAdapter(BaseAdapter):
+    """
+    Adapter for `requests` sessions which sends the requests of the session through a transport. This is used to send
+    the requests of the OAuth session through a transport.
+    """
+    def __init__(self, transport):
+        """
+        :param transport: The `Transport` to send the requests with.
+        """
+        super(TransportAdapter, self).__init__()
+        self.transport = transport
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        transport_response = self.transport.request(request.method, request.url, dict(request.headers), body)
+
+        response = Response()
+        response.status_code = transport_response.status
+        response.headers = transport_response.headers
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = transport_response.content
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def _request_key(method, url, body):
+    """
+    Builds the key by which a recorded exchange is matched to a request. JSON-RPC call identifiers are ignored, as they
+    are random.
+
+    :return: The key as a string.
+    """
+    text = body.decode('utf-8') if body else ''
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return '{:s} {:s} {:s}'.format(method, url, text)
+
+    calls = data if isinstance(data, list) else [data]
+    if all(isinstance(call, dict) for call in calls):
+        data = [dict((key, value) for key, value in call.items() if key != 'id') for call in calls]
+
+    return '{:s} {:s} {:s}'.format(method, url, json.dumps(data, sort_keys=True))
+
+
+def _call_ids(body):
+    """
+    Returns the JSON-RPC call identifiers in a request body, in order.
+    """
+    try:
+        data = json.loads(body.decode('utf-8')) if body else None
+    except ValueError:
+        return []
+    calls = data if isinstance(data, list) else [data]
+    return [call.get('id') for call in calls if isinstance(call, dict)]
+
+
+class RecordingTransport(Transport):
+    """
+    Transport which performs requests through another transport and records the exchanges to a file for replaying
+    them using `ReplayTransport`.
+
+    The file is a gzip-compressed JSON lines file with one exchange per line. Exchanges are appended, so the same file
+    can be used for multiple sessions. Request headers are not recorded, but request and response bodies are recorded as
+    is, so recordings of token requests contain the tokens.
+    """
+    def __init__(self, transport, path):
+        """
+        :param transport: The `Transport` to perform the requests with.
+        :param path: The path of the recording file.
+        """
+        self.transport = transport
+        self.path = path
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers, body, stream=False):
+        started = time.perf_counter()
+        response = self.transport.request(method, url, headers, body, stream=stream)
+        content = response.content
+        latency = time.perf_counter() - started
+
+        exchange = {
+            'method': method,
+            'url': url,
+            'body': body.decode('utf-8') if body else '',
+            'status': response.status,
+            'headers': {'Content-Type': response.headers.get('Content-Type', '')},
+            'response': content.decode('utf-8'),
+            'latency': round(latency, 6),
+        }
+
+        with self._lock:
+            with gzip.open(self.path, 'at', encoding='utf-8') as file:
+                file.write(json.dumps(exchange, separators=(',', ':')) + '\n')
+
+        return TransportResponse(response.status, response.headers, content=content)
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Transport which serves recorded exchanges instead of performing requests.
+
+    Requests are matched to recorded exchanges by method, URL and body, ignoring JSON-RPC call identifiers. The
+    identifiers in the recorded response are replaced by those of the request. Exchanges with the same request are
+    served in recorded order; the last one is repeated when they run out. Unmatched requests raise a `ReplayError`.
+    """
+    def __init__(self, path, latency=0):
+        """
+        :param path: The path of the recording file.
+        :param latency: (Optional) The factor by which the recorded latencies are simulated. Defaults to no latency.
+        """
+        self.path = path
+        self.latency = latency
+        self._exchanges = {}
+        self._lock = threading.Lock()
+
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    exchange = json.loads(line)
+                    key = _request_key(exchange['method'], exchange['url'], exchange['body'].encode('utf-8'))
+                    self._exchanges.setdefault(key, []).append(exchange)
+
+    def __len__(self):
+        return sum(len(exchanges) for exchanges in self._exchanges.values())
+
+    def request(self, method, url, headers, body, stream=False):
+        key = _request_key(method, url, body)
+
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                raise ReplayError("No recorded exchange for {:s} {:s}.".format(method, url))
+            exchange = exchanges.pop(0) if len(exchanges) > 1 else exchanges[0]
+
+        if self.latency:
+            time.sleep(exchange['latency'] * self.latency)
+
+        content = exchange['response'].encode('utf-8')
+        recorded_ids = _call_ids(exchange['body'].encode('utf-8'))
+
+        if recorded_ids:
+            ids = dict(zip(recorded_ids, _call_ids(body)))
+            data = json.loads(exchange['response'])
+            for item in (data if isinstance(data, list) else [data]):
+                if isinstance(item, dict) and item.get('id') in ids:
+                    item['id'] = ids[item['id']]
+            content = json.dumps(data).encode('utf-8')
+
+        return TransportResponse(exchange['status'], exchange['headers'], content=content)
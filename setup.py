@@ -9,5 +9,13 @@ setup(
     description='OAuth and API consumer for the Inter-Actief web site',
     license='MIT',
     packages=['iaconnector'],
+    python_requires='>=3.9',
     install_requires=['requests>=2.9,<3', 'requests-oauthlib>=0.6,<0.7'],
+    extras_require={
+        'async': ['aiohttp>=3.7'],
+        'http2': ['httpx[http2]>=0.23'],
+        'fast': ['orjson>=3'],
+        'numpy': ['numpy>=1.17'],
+        'arrow': ['pyarrow>=4'],
+    },
 )